@@ -0,0 +1,41 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0020_media_hls_renditions"),
+        ("actions", "0003_auto_20201201_0712"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="mediaaction",
+            index=models.Index(fields=["action_date"], name="actions_mediaaction_date_idx"),
+        ),
+        migrations.CreateModel(
+            name="MediaActionRollup",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "action",
+                    models.CharField(
+                        choices=[("like", "Like"), ("dislike", "Dislike"), ("watch", "Watch"), ("report", "Report"), ("rate", "Rate")],
+                        max_length=20,
+                    ),
+                ),
+                ("period", models.CharField(choices=[("hour", "Hour"), ("day", "Day")], max_length=4)),
+                ("period_start", models.DateTimeField()),
+                ("count", models.PositiveIntegerField(default=0)),
+                (
+                    "media",
+                    models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="action_rollups", to="files.media"),
+                ),
+            ],
+            options={
+                "constraints": [models.UniqueConstraint(fields=("media", "action", "period", "period_start"), name="actions_rollup_unique")],
+                "indexes": [models.Index(fields=["action", "period", "period_start"], name="actions_rollup_period_idx")],
+            },
+        ),
+    ]
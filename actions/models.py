@@ -49,4 +49,36 @@ class MediaAction(models.Model):
         indexes = [
             models.Index(fields=["user", "action", "-action_date"]),
             models.Index(fields=["session_key", "action"]),
+            # rollup windows and retention scan by date
+            models.Index(fields=["action_date"], name="actions_mediaaction_date_idx"),
+        ]
+
+
+ROLLUP_PERIODS = (
+    ("hour", "Hour"),
+    ("day", "Day"),
+)
+
+
+class MediaActionRollup(models.Model):
+    """Number of actions per media, action and hour or day.
+    Built from MediaAction by rollup_media_actions, analytics read these
+    instead of the raw rows
+    """
+
+    media = models.ForeignKey(Media, on_delete=models.CASCADE, related_name="action_rollups")
+    action = models.CharField(max_length=20, choices=USER_MEDIA_ACTIONS)
+    period = models.CharField(max_length=4, choices=ROLLUP_PERIODS)
+    period_start = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.action} {self.period} {self.period_start}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["media", "action", "period", "period_start"], name="actions_rollup_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["action", "period", "period_start"], name="actions_rollup_period_idx"),
         ]
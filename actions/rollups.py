@@ -0,0 +1,120 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import MediaAction, MediaActionRollup
+
+logger = logging.getLogger(__name__)
+
+# MediaAction is an append-only log. Complete hours of it are counted into
+# MediaActionRollup per media and action, hourly and daily, and raw watch
+# rows older than the retention window are deleted once rolled up.
+# Rollups are replaced and not incremented, so a rerun over the same hours
+# gives the same counts.
+ROLLUP_CHUNK = timedelta(days=1)
+# actions still being committed when the hour closed land in the hour
+# before, that hour is counted again on the next run
+ROLLUP_LAG = timedelta(hours=1)
+
+
+def _floor_hour(value):
+    return timezone.localtime(value).replace(minute=0, second=0, microsecond=0)
+
+
+def _floor_day(value):
+    return timezone.localtime(value).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def rolled_up_until():
+    """Start of the first hour not rolled up yet, None if nothing is"""
+
+    last = MediaActionRollup.objects.filter(period="hour").aggregate(last=Max("period_start"))["last"]
+    return last + timedelta(hours=1) if last else None
+
+
+def _upsert(rows):
+    MediaActionRollup.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=["media", "action", "period", "period_start"],
+        update_fields=["count"],
+    )
+
+
+def _rollup_hours(start, end):
+    rows = (
+        MediaAction.objects.filter(action_date__gte=start, action_date__lt=end)
+        .annotate(period_start=TruncHour("action_date"))
+        .values("media_id", "action", "period_start")
+        .annotate(total=Count("id"))
+        .order_by()
+    )
+    _upsert([MediaActionRollup(media_id=row["media_id"], action=row["action"], period="hour", period_start=row["period_start"], count=row["total"]) for row in rows])
+
+
+def _rollup_days(start, end):
+    rows = (
+        MediaActionRollup.objects.filter(period="hour", period_start__gte=start, period_start__lt=end)
+        .annotate(day=TruncDay("period_start"))
+        .values("media_id", "action", "day")
+        .annotate(total=Sum("count"))
+        .order_by()
+    )
+    _upsert([MediaActionRollup(media_id=row["media_id"], action=row["action"], period="day", period_start=row["day"], count=row["total"]) for row in rows])
+
+
+def rollup_media_actions(now=None):
+    """Count the complete hours of actions not rolled up yet into hourly
+    and daily rollups, returns the start of the first hour left out"""
+
+    end = _floor_hour(now or timezone.now())
+    start = rolled_up_until()
+    if start:
+        start = start - ROLLUP_LAG
+    # skip hours without actions, up to the first one
+    first = MediaAction.objects.filter(**({"action_date__gte": start} if start else {})).aggregate(first=Min("action_date"))["first"]
+    if first is None:
+        return end
+    cursor = max(start, _floor_hour(first)) if start else _floor_hour(first)
+
+    while cursor < end:
+        chunk_end = min(cursor + ROLLUP_CHUNK, end)
+        with transaction.atomic():
+            _rollup_hours(cursor, chunk_end)
+            # days touched by the chunk, from all of their hours
+            _rollup_days(_floor_day(cursor), _floor_day(chunk_end - timedelta(microseconds=1)) + timedelta(days=1))
+        cursor = chunk_end
+
+    logger.info("Rolled up media actions until %s", end)
+    return end
+
+
+def purge_media_actions(now=None):
+    """Delete watch actions older than MEDIA_ACTION_RETENTION_DAYS that are
+    rolled up already, returns the number of rows deleted.
+    Like, dislike and report actions are kept, they stop users from
+    repeating them"""
+
+    days = getattr(settings, "MEDIA_ACTION_RETENTION_DAYS", None)
+    until = rolled_up_until()
+    if not days or until is None:
+        return 0
+    cutoff = min((now or timezone.now()) - timedelta(days=days), until - ROLLUP_LAG)
+    batch_size = max(1, int(getattr(settings, "MEDIA_ACTION_PURGE_BATCH_SIZE", 5000) or 5000))
+
+    deleted = 0
+    queryset = MediaAction.objects.filter(action="watch", action_date__lt=cutoff)
+    while True:
+        ids = list(queryset.values_list("id", flat=True)[:batch_size])
+        if not ids:
+            break
+        deleted += MediaAction.objects.filter(id__in=ids).delete()[0]
+    if deleted:
+        logger.info("Deleted %s media actions older than %s", deleted, cutoff)
+    return deleted
+
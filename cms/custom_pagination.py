@@ -1,9 +1,16 @@
+import binascii
+import json
+from base64 import b64decode, b64encode
 from collections import OrderedDict  # requires Python 2.7 or later
 
 from django.core.paginator import Paginator
+from django.db.models import BooleanField, F, Func, Value
 from django.utils.functional import cached_property
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
 
 
 class FasterDjangoPaginator(Paginator):
@@ -27,3 +34,127 @@ class FastPaginationWithoutCount(PageNumberPagination):
                 ]
             )
         )
+
+
+def keyset_pagination_requested(request):
+    """Clients opt in to cursor pages with ?pagination=cursor, follow up
+    pages carry the cursor parameter"""
+
+    params = request.query_params
+    return params.get("pagination", "") == "cursor" or bool(params.get(KeysetPagination.cursor_query_param))
+
+
+class RowComparison(Func):
+    """(a, b, ...) < (x, y, ...) style row comparison, that Postgres can use
+    as a range condition on a multicolumn index"""
+
+    output_field = BooleanField()
+
+    def __init__(self, lhs, operator, rhs):
+        if len(lhs) != len(rhs):
+            raise ValueError("row comparison needs rows of the same length")
+        self.operator = operator
+        self.width = len(lhs)
+        super().__init__(*lhs, *rhs)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sql_parts = []
+        params = []
+        for expression in self.get_source_expressions():
+            sql, expression_params = compiler.compile(expression)
+            sql_parts.append(sql)
+            params.extend(expression_params)
+        lhs = ", ".join(sql_parts[: self.width])
+        rhs = ", ".join(sql_parts[self.width :])
+        return f"(({lhs}) {self.operator} ({rhs}))", params
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination keyed on (sort field, id).
+
+    Pages are read with WHERE (field, id) < (last field, last id) instead
+    of OFFSET, and no COUNT is issued, so deep pages cost the same as the
+    first one. ordering is a single model field or annotation, with a
+    leading "-" for descending order; id breaks ties.
+    """
+
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def __init__(self, ordering="-add_date"):
+        self.field = ordering.lstrip("-")
+        self.descending = ordering.startswith("-")
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(b64decode(encoded.encode("ascii")).decode("utf-8"))
+            return {"value": cursor["v"], "id": int(cursor["i"]), "previous": bool(cursor.get("p"))}
+        except (TypeError, ValueError, KeyError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj, previous=False):
+        cursor = {"v": getattr(obj, self.field), "i": obj.pk}
+        if previous:
+            cursor["p"] = 1
+        # full isoformat, DjangoJSONEncoder drops microseconds and the
+        # (field, id) comparison needs the exact value
+        encoded = b64encode(json.dumps(cursor, default=lambda value: value.isoformat()).encode("utf-8")).decode("ascii")
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def page_queryset(self, queryset, cursor, descending):
+        """Rows after the cursor, in page order"""
+
+        if cursor:
+            field = F(self.field).resolve_expression(queryset.query).output_field
+            value = Value(field.to_python(cursor["value"]), output_field=field)
+            queryset = queryset.filter(
+                RowComparison([F(self.field), F("pk")], "<" if descending else ">", [value, Value(cursor["id"])])
+            )
+        if descending:
+            return queryset.order_by(f"-{self.field}", "-pk")
+        return queryset.order_by(self.field, "pk")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        cursor = self.decode_cursor(request)
+        backwards = bool(cursor and cursor["previous"])
+        # walking back to previous pages reads the other way round
+        descending = self.descending != backwards
+
+        queryset = self.page_queryset(queryset, cursor, descending)
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[: self.page_size]
+        if backwards:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.page = results
+        return results
+
+    def get_next_link(self):
+        if not (self.has_next and self.page):
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_previous_link(self):
+        if not (self.has_previous and self.page):
+            return None
+        return self.encode_cursor(self.page[0], previous=True)
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
@@ -108,11 +108,24 @@ MAX_CHARS_FOR_COMMENT = 10000  # so that it doesn't end up huge
 TIMESTAMP_IN_TIMEBAR = False  # shows timestamped comments in the timebar for videos
 ALLOW_MENTION_IN_COMMENTS = False  # allowing to mention other users with @ in the comments
 
-# valid options: content, author
+# valid options: content, author, calculated
 RELATED_MEDIA_STRATEGY = "content"
+# related lists are computed daily, and again for a media when it or its
+# categories change
+RELATED_MEDIA_LIMIT = 100
+# calculated: media watched by the same viewers during the last
+# RELATED_MEDIA_DAYS. Pairs watched together by fewer than
+# RELATED_MEDIA_MIN_CO_WATCH viewers are ignored
+RELATED_MEDIA_DAYS = 90
+RELATED_MEDIA_MIN_CO_WATCH = 2
+RELATED_MEDIA_MAX_VIEWER_MEDIA = 500
+RELATED_MEDIA_TIMEOUT = 60 * 60 * 24 * 2
 
 # Whether or not to generate a sitemap.xml listing the pages on the site (default: False)
 GENERATE_SITEMAP = False
+# sitemap.xml is an index of child sitemaps holding this many ids each
+SITEMAP_PARTITION_SIZE = 10000
+SITEMAP_CACHE_TIMEOUT = 60 * 60 * 24
 
 USE_I18N = True
 USE_L10N = True
@@ -207,6 +220,37 @@ MASK_IPS_FOR_ACTIONS = True
 # Habilita balanceo por IP para hosts VOD/LIVE (ver files/cdn_balancer.py)
 CDN_BALANCER_ENABLED = True
 CDN_BALANCER_CACHE_TTL_SECONDS = 60 * 60  # 1 hora
+# Rutas por prefijo de red: cada proceso recarga la tabla compilada (tarea
+# compile_cdn_routing_table) cada tantos segundos. Los prefijos fuera de ella
+# se aprenden por CDN_BALANCER_CACHE_TTL_SECONDS en Redis y en cada proceso,
+# hasta tantos por proceso (sale el usado hace más tiempo)
+CDN_BALANCER_ROUTES_REFRESH_SECONDS = 5 * 60
+CDN_BALANCER_LEARNED_PREFIXES_MAX = 50000
+# redes sin ASN ni ciudad en las mmdb (cache negativo)
+CDN_BALANCER_NEGATIVE_CACHE_TTL_SECONDS = 5 * 60
+
+# Salud de los edges (tarea check_cdn_edges, ver files/cdn_health.py): se
+# sondea el playlist HLS de cada edge; tras MAX_FAILURES fallos seguidos o con
+# tasa de error sobre MAX_ERROR_RATE el edge sale del pool, y si no queda
+# ninguno se usa el CDN fallback. Estados más viejos que STALE_SECONDS se
+# ignoran (el edge cuenta como sano).
+CDN_BALANCER_HEALTH_ENABLED = True
+CDN_BALANCER_HEALTH_CHECK_SECONDS = 15
+CDN_BALANCER_HEALTH_TIMEOUT_SECONDS = 2
+CDN_BALANCER_HEALTH_CONCURRENCY = 8
+CDN_BALANCER_HEALTH_MAX_FAILURES = 2
+CDN_BALANCER_HEALTH_MAX_ERROR_RATE = 0.5
+CDN_BALANCER_HEALTH_EWMA_ALPHA = 0.3
+CDN_BALANCER_HEALTH_REFRESH_SECONDS = 5
+CDN_BALANCER_HEALTH_STALE_SECONDS = 60
+# URLs por tipo ("vod", "live") con {host}, deben apuntar a un playlist que
+# exista: un 404 cuenta como falla (401/403 por tokens cuentan como sano).
+# Por defecto, VOD sondea con WOWZA_VOD_SMIL_PATH_TEMPLATE el playlist de
+# CDN_BALANCER_HEALTH_MEDIA_ID o del video listable más nuevo (sin videos no
+# se sondea), y live el del primer stream de WOWZA_STREAM_NAMES, que debe
+# estar siempre al aire o los edges live saldrán del pool
+CDN_BALANCER_HEALTH_URLS = {}
+CDN_BALANCER_HEALTH_MEDIA_ID = os.getenv("CDN_BALANCER_HEALTH_MEDIA_ID", "")
 CDN_BALANCER_FALLBACK_TO_CDN = os.getenv("CDN_BALANCER_FALLBACK_TO_CDN", "true").lower() in ("1", "true", "yes", "on")
 CDN_BALANCER_FALLBACK_VOD_HOST = os.getenv("CDN_BALANCER_FALLBACK_VOD_HOST", "claro-vtrlolla-vod.cl.cdnz.cl")
 CDN_BALANCER_FALLBACK_LIVE_HOST = os.getenv("CDN_BALANCER_FALLBACK_LIVE_HOST", "claro.02.cl.cdnz.cl")
@@ -274,6 +318,83 @@ WOWZA_VOD_SMIL_PATH_TEMPLATE = os.getenv(
     "WOWZA_VOD_SMIL_PATH_TEMPLATE",
     "mediavms-development/smil:{media_id}.smil/playlist.m3u8",
 )
+# segundos que se espera antes de regenerar un SMIL, para agrupar
+# varios encodings que terminan casi al mismo tiempo
+SMIL_DEBOUNCE_SECONDS = int((os.getenv("SMIL_DEBOUNCE_SECONDS", "10") or "10").strip())
+
+# search indexing: media marked dirty on save are reindexed in batches
+SEARCH_INDEX_BATCH_SIZE = 500
+SEARCH_INDEX_MAX_BATCHES = 20
+# MediaSearch and search RSS keep result ids and counts in the cache,
+# invalidated by category/tag when a public media changes
+SEARCH_CACHE_ENABLED = True
+SEARCH_CACHE_TIMEOUT = 60 * 5
+SEARCH_CACHE_MAX_IDS = 1000
+SEARCH_CACHE_LOCK_WAIT = 2
+# rendered RSS feeds, dropped with the search cache generations of their scope
+RSS_FEED_CACHE_TIMEOUT = 60 * 60
+# facets=1 on the search API, values returned per facet
+SEARCH_FACETS_LIMIT = 20
+
+# search box typeahead, served from the SearchSuggestion table
+AUTOCOMPLETE_MIN_LENGTH = 2
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_MEDIA = 50000
+AUTOCOMPLETE_CACHE_TIMEOUT = 60 * 5
+
+# listing cards: URLs and author fields of media listings, kept in the
+# cache and dropped when the media, its encodings or its author change
+MEDIA_CARD_TIMEOUT = 60 * 60 * 24
+# media detail API: encodings, HLS, subtitles, categories and tags are
+# cached per media, entitlements and counters are computed per request
+MEDIA_DOCUMENT_TIMEOUT = 60 * 60 * 24
+
+# sort_by=relevance ranks only this many of the most recent matches, older
+# matches are left out of its results
+SEARCH_RANK_MAX_CANDIDATES = 2000
+SEARCH_INDEX_SCHEDULE_SECONDS = int((os.getenv("SEARCH_INDEX_SCHEDULE_SECONDS", "30") or "30").strip())
+
+# media saves record the fields that changed, the search caches, sitemap and
+# related lists depending on them are updated once per burst, this many
+# seconds later. Media cards and detail documents are dropped by the save
+MEDIA_CHANGES_DELAY = 2
+
+# bulk deletions from the manage media page run as background jobs, deleting
+# this many media per transaction and removing their files in tasks of this
+# many files and folders. Jobs not updated for MEDIA_DELETION_STALE_SECONDS
+# lost their worker and are resumed
+MEDIA_DELETION_BATCH_SIZE = 50
+MEDIA_DELETION_FILES_PER_TASK = 200
+MEDIA_DELETION_STALE_SECONDS = 10 * 60
+
+# view, like and dislike counters are buffered in redis and applied by a
+# periodic flush, one UPDATE per media and flush
+MEDIA_COUNTERS_BUFFERED = True
+MEDIA_COUNTERS_FLUSH_BATCH_SIZE = 500
+MEDIA_COUNTERS_FLUSH_SECONDS = int((os.getenv("MEDIA_COUNTERS_FLUSH_SECONDS", "10") or "10").strip())
+
+# user actions are rolled up hourly and daily per media. Watch actions older
+# than this many days are deleted once rolled up, None keeps them all
+MEDIA_ACTION_RETENTION_DAYS = 90
+MEDIA_ACTION_PURGE_BATCH_SIZE = 5000
+
+# management dashboard figures are read from a snapshot taken every
+# STATISTICS_SNAPSHOT_SECONDS, managers can take one on demand. Media
+# storage usage walks the media folders, periodic snapshots measure it
+# again every STATISTICS_STORAGE_SECONDS only
+STATISTICS_SNAPSHOT_SECONDS = int((os.getenv("STATISTICS_SNAPSHOT_SECONDS", "300") or "300").strip())
+STATISTICS_STORAGE_SECONDS = int((os.getenv("STATISTICS_STORAGE_SECONDS", "3600") or "3600").strip())
+STATISTICS_SNAPSHOT_KEEP_DAYS = 7
+STATISTICS_SERIES_DAYS = 30
+
+# recommended media: top media by views and likes, decayed by half every
+# TRENDING_HALF_LIFE_HOURS, updated from the hourly action rollups
+TRENDING_ACTION_WEIGHTS = {"watch": 1, "like": 5}
+TRENDING_HALF_LIFE_HOURS = 48
+# media kept per scope (global, category, channel)
+TRENDING_TOP_K = 500
+# history replayed when the scores are built from scratch
+TRENDING_REBUILD_DAYS = 30
 # how many seconds a process in running state without reporting progress is
 # considered as stale...unfortunately v9 seems to not include time
 # some times so raising this high
@@ -576,14 +697,54 @@ CELERY_BEAT_SCHEDULE = {
         "task": "clear_sessions",
         "schedule": crontab(hour=1, minute=1, day_of_week=6),
     },
-    "get_list_of_popular_media": {
-        "task": "get_list_of_popular_media",
-        "schedule": crontab(minute=1, hour="*/10"),
-    },
     "update_listings_thumbnails": {
         "task": "update_listings_thumbnails",
         "schedule": crontab(minute=2, hour="*/30"),
     },
+    "rebuild_search_suggestions": {
+        "task": "rebuild_search_suggestions",
+        "schedule": crontab(minute="*/10"),
+    },
+    # media saves only mark the search vector dirty, this reindexes them
+    "update_search_index": {
+        "task": "update_search_index",
+        "schedule": timedelta(seconds=SEARCH_INDEX_SCHEDULE_SECONDS),
+    },
+    "flush_media_counters": {
+        "task": "flush_media_counters",
+        "schedule": timedelta(seconds=MEDIA_COUNTERS_FLUSH_SECONDS),
+    },
+    "update_related_media": {
+        "task": "update_related_media",
+        "schedule": crontab(minute=30, hour=3),
+    },
+    # media_count is kept with deltas, this corrects any drift
+    "reconcile_media_counts": {
+        "task": "reconcile_media_counts",
+        "schedule": crontab(minute=15, hour=4),
+    },
+    "take_statistics_snapshot": {
+        "task": "take_statistics_snapshot",
+        "schedule": timedelta(seconds=STATISTICS_SNAPSHOT_SECONDS),
+    },
+    # after every complete hour
+    "rollup_media_actions": {
+        "task": "rollup_media_actions",
+        "schedule": crontab(minute=5),
+    },
+    "resume_media_deletion_jobs": {
+        "task": "resume_media_deletion_jobs",
+        "schedule": crontab(minute="*/5"),
+    },
+    "check_cdn_edges": {
+        "task": "check_cdn_edges",
+        "schedule": timedelta(seconds=CDN_BALANCER_HEALTH_CHECK_SECONDS),
+    },
+    # GeoLite2 databases are updated weekly at most
+    "compile_cdn_routing_table": {
+        "task": "compile_cdn_routing_table",
+        "schedule": crontab(minute=45, hour=5),
+    },
 }
 
 if LIVE_RECORD_SYNC_ENABLED:
@@ -0,0 +1,112 @@
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import helpers
+from .stop_words import STOP_WORDS
+
+logger = logging.getLogger(__name__)
+
+AUTOCOMPLETE_VERSION_KEY = "autocomplete_version"
+
+# only the leading words of a title get their own suggestion row,
+# so "gran concierto de rock" is also found typing "concierto" or "rock"
+MAX_TITLE_WORDS = 6
+
+
+def normalize_prefix(query):
+    query = helpers.clean_query(query or "")
+    return " ".join(query.split())[:100]
+
+
+def _suggestion_terms(title):
+    words = normalize_prefix(title).split()[:MAX_TITLE_WORDS]
+    terms = []
+    for i, word in enumerate(words):
+        if word in STOP_WORDS:
+            continue
+        terms.append(" ".join(words[i:])[:100])
+    return terms
+
+
+def _iter_suggestions():
+    from .models import Category, Media, SearchSuggestion, Tag
+
+    max_media = getattr(settings, "AUTOCOMPLETE_MAX_MEDIA", 50000)
+    media = (
+        Media.objects.filter(state="public", is_reviewed=True)
+        .order_by("-views")
+        .values_list("title", "views")[:max_media]
+    )
+    for title, views in media.iterator():
+        for term in _suggestion_terms(title):
+            yield SearchSuggestion(term=term, title=title[:100], kind="media", weight=views)
+
+    for title, media_count in Tag.objects.filter(media_count__gt=0).values_list("title", "media_count").iterator():
+        for term in _suggestion_terms(title):
+            yield SearchSuggestion(term=term, title=title, kind="tag", weight=media_count)
+
+    for title, media_count in Category.objects.filter(media_count__gt=0).values_list("title", "media_count").iterator():
+        for term in _suggestion_terms(title):
+            yield SearchSuggestion(term=term, title=title[:100], kind="category", weight=media_count)
+
+
+def rebuild_suggestions():
+    """Replace the suggestions table in one transaction, readers keep
+    seeing the previous set until it commits"""
+
+    from .models import SearchSuggestion
+
+    batch = []
+    total = 0
+    with transaction.atomic():
+        SearchSuggestion.objects.all().delete()
+        for suggestion in _iter_suggestions():
+            batch.append(suggestion)
+            if len(batch) >= 1000:
+                SearchSuggestion.objects.bulk_create(batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            SearchSuggestion.objects.bulk_create(batch)
+            total += len(batch)
+
+    # cached answers of the previous set are not read anymore
+    cache.set(AUTOCOMPLETE_VERSION_KEY, int(time.time()), None)
+    logger.info("rebuilt %s search suggestions", total)
+    return total
+
+
+def autocomplete(query, limit=None):
+    """Titles for the search box typeahead, as [{"title", "type"}]"""
+
+    from .models import SearchSuggestion
+
+    prefix = normalize_prefix(query)
+    if len(prefix) < getattr(settings, "AUTOCOMPLETE_MIN_LENGTH", 2):
+        return []
+    limit = limit or getattr(settings, "AUTOCOMPLETE_LIMIT", 10)
+
+    version = cache.get(AUTOCOMPLETE_VERSION_KEY, 0)
+    key = "autocomplete:{0}:{1}:{2}".format(version, limit, hashlib.md5(prefix.encode("utf-8")).hexdigest())
+    results = cache.get(key)
+    if results is not None:
+        return results
+
+    results = []
+    seen = set()
+    suggestions = SearchSuggestion.objects.filter(term__startswith=prefix).order_by("-weight").values_list("title", "kind")
+    for title, kind in suggestions[: limit * 3]:
+        if (title, kind) in seen:
+            continue
+        seen.add((title, kind))
+        results.append({"title": title, "type": kind})
+        if len(results) >= limit:
+            break
+
+    cache.set(key, results, getattr(settings, "AUTOCOMPLETE_CACHE_TIMEOUT", 60 * 5))
+    return results
@@ -2,14 +2,18 @@ from __future__ import annotations
 
 import ipaddress
 import os
-import random
 import threading
+import time
 import unicodedata
+from collections import OrderedDict
 from dataclasses import dataclass
 
 from django.conf import settings
 from django.core.cache import cache
 
+from .cdn_health import choose_edge
+from .cdn_routing import PrefixTrie, compile_mmdb_routes
+
 try:
     import geoip2.database
 except Exception as exc:  # pragma: no cover
@@ -40,10 +44,25 @@ def _normalize_city(value: str | None) -> str:
     return _strip_accents((value or "").strip()).casefold()
 
 
-def _pick_one(value: str | list[str] | tuple[str, ...]) -> str:
+def _pool(value: str | list[str] | tuple[str, ...]) -> list[str]:
     if isinstance(value, (list, tuple)):
-        return random.choice(list(value))
-    return value
+        return list(value)
+    return [value]
+
+
+def _pick_one(value: str | list[str] | tuple[str, ...]) -> str | None:
+    # Un edge sano del pool, ponderado por latencia y errores (ver files/cdn_health.py)
+    return choose_edge(_pool(value))
+
+
+def _pick_failover(*pools) -> str:
+    # Un edge sano del primer pool que tenga alguno; si no hay ninguno sano,
+    # el primer edge del último pool como último recurso
+    for pool in pools:
+        host = _pick_one(pool)
+        if host is not None:
+            return host
+    return _pool(pools[-1])[0]
 
 
 def _iter_forwarded_for(value: str | None):
@@ -124,6 +143,13 @@ def _default_hosts() -> BalancedHosts:
     return BalancedHosts(vod_host=host_default, live_host=host_default, decision="default")
 
 
+def _fallback_cdn() -> tuple[str, str]:
+    return (
+        getattr(settings, "CDN_BALANCER_FALLBACK_VOD_HOST", "claro-vtrlolla-vod.cl.cdnz.cl"),
+        getattr(settings, "CDN_BALANCER_FALLBACK_LIVE_HOST", "claro.02.cl.cdnz.cl"),
+    )
+
+
 def _fallback_hosts(reason: str, *, client_ip: str | None = None) -> BalancedHosts:
     if not bool(getattr(settings, "CDN_BALANCER_FALLBACK_TO_CDN", True)):
         defaults = _default_hosts()
@@ -134,77 +160,119 @@ def _fallback_hosts(reason: str, *, client_ip: str | None = None) -> BalancedHos
             decision=f"default:{reason}",
         )
 
+    # El CDN fallback también pasa por el health check: si está caído se usa
+    # un edge sano de default:geo
+    vod_fallback, live_fallback = _fallback_cdn()
+    vod_geo, live_geo = _ROUTE_HOSTS["default:geo"]
     return BalancedHosts(
-        vod_host=getattr(settings, "CDN_BALANCER_FALLBACK_VOD_HOST", "claro-vtrlolla-vod.cl.cdnz.cl"),
-        live_host=getattr(settings, "CDN_BALANCER_FALLBACK_LIVE_HOST", "claro.02.cl.cdnz.cl"),
+        vod_host=_pick_failover(vod_fallback, vod_geo, vod_fallback),
+        live_host=_pick_failover(live_fallback, live_geo, live_fallback),
         client_ip=client_ip,
         decision=f"fallback_cdn:{reason}",
     )
 
 
-def _select_by_asn_and_city(asn: int | None, city_es: str | None) -> BalancedHosts:
-    city = _normalize_city(city_es)
+# VOD y LIVE hosts de cada ruta (un host o un pool para elegir uno)
+_VOD_DEFAULT = [
+    "internexa-vtrlolla-vod.cl.cdnz.cl",
+    "claro-vtrlolla-vod.cl.cdnz.cl",
+    "florida01-vtrlolla-vod.cl.cdnz.cl",
+    "pitchile-vtrlolla-vod.cl.cdnz.cl",
+]
+_LIVE_DEFAULT = ["internexa.02.cl.cdnz.cl", "claro.02.cl.cdnz.cl"]
+
+_ROUTE_HOSTS = {
+    "movistar:santiago": ("telsantin1-vtrlolla-vod.cl.cdnz.cl", "telsantin1.02.cl.cdnz.cl"),
+    "movistar:antofagasta": ("telanto01-vtrlolla-vod.cl.cdnz.cl", "telanto01.02.cl.cdnz.cl"),
+    "movistar:concepcion": ("telconce01-vtrlolla-vod.cl.cdnz.cl", "telconce01.02.cl.cdnz.cl"),
+    "movistar:punta_arenas": ("telpunta01-vtrlolla-vod.cl.cdnz.cl", "telpunta01.02.cl.cdnz.cl"),
+    "movistar:default": ("pitchile-vtrlolla-vod.cl.cdnz.cl", _LIVE_DEFAULT),
+    "claro": ("claro-vtrlolla-vod.cl.cdnz.cl", "claro.02.cl.cdnz.cl"),
+    "internexa": ("internexa-vtrlolla-vod.cl.cdnz.cl", "internexa.02.cl.cdnz.cl"),
+    "manquehue": ("manquehue-01-vtrlolla-vod.cl.cdnz.cl", "manquehue-01.02.cl.cdnz.cl"),
+    "telsur": (
+        ["telsur01-vtrlolla-vod.cl.cdnz.cl", "telsur02-vtrlolla-vod.cl.cdnz.cl"],
+        ["telsur01.02.cl.cdnz.cl", "telsur02.02.cl.cdnz.cl"],
+    ),
+    "vtr": (
+        ["vtrcache-vtrlolla-vod.cl.cdnz.cl", "vtrcache02-vtrlolla-vod.cl.cdnz.cl"],
+        "vtrcache.02.cl.cdnz.cl",
+    ),
+    "default:geo": (_VOD_DEFAULT, _LIVE_DEFAULT),
+}
+
+# ASNs cuya ruta depende de la ciudad
+_CITY_ROUTED_ASNS = frozenset(_MOVISTAR_ASNS)
 
-    # VOD hosts
-    vod_entel = "entel-01-vtrlolla-vod.cl.cdnz.cl"
-    vod_claro = "claro-vtrlolla-vod.cl.cdnz.cl"
-    vod_mov_antof = "telanto01-vtrlolla-vod.cl.cdnz.cl"
-    vod_mov_conce = "telconce01-vtrlolla-vod.cl.cdnz.cl"
-    vod_mov_punta = "telpunta01-vtrlolla-vod.cl.cdnz.cl"
-    vod_mov_stgo = "telsantin1-vtrlolla-vod.cl.cdnz.cl"
-    vod_manquehue = "manquehue-01-vtrlolla-vod.cl.cdnz.cl"
-    vod_telsur = ["telsur01-vtrlolla-vod.cl.cdnz.cl", "telsur02-vtrlolla-vod.cl.cdnz.cl"]
-    vod_vtr = ["vtrcache-vtrlolla-vod.cl.cdnz.cl", "vtrcache02-vtrlolla-vod.cl.cdnz.cl"]
-    vod_pitchile = "pitchile-vtrlolla-vod.cl.cdnz.cl"
-    vod_internexa = "internexa-vtrlolla-vod.cl.cdnz.cl"
-    vod_default = [
-        "internexa-vtrlolla-vod.cl.cdnz.cl",
-        "claro-vtrlolla-vod.cl.cdnz.cl",
-        "florida01-vtrlolla-vod.cl.cdnz.cl",
-        "pitchile-vtrlolla-vod.cl.cdnz.cl",
-    ]
-
-    # LIVE hosts
-    live_claro = "claro.02.cl.cdnz.cl"
-    live_mov_antof = "telanto01.02.cl.cdnz.cl"
-    live_mov_conce = "telconce01.02.cl.cdnz.cl"
-    live_mov_punta = "telpunta01.02.cl.cdnz.cl"
-    live_mov_stgo = "telsantin1.02.cl.cdnz.cl"
-    live_manquehue = "manquehue-01.02.cl.cdnz.cl"
-    live_telsur = ["telsur01.02.cl.cdnz.cl", "telsur02.02.cl.cdnz.cl"]
-    live_vtr = "vtrcache.02.cl.cdnz.cl"
-    live_internexa = "internexa.02.cl.cdnz.cl"
-    live_default = ["internexa.02.cl.cdnz.cl", "claro.02.cl.cdnz.cl"]
+# ASNs con ruta propia, el resto va a default:geo
+_ROUTED_ASNS = frozenset(_MOVISTAR_ASNS | _CLARO_ASNS | _INTERNEXA_ASNS | _MANQUEHUE_ASNS | _TELSUR_ASNS | _VTR_ASNS)
+
+
+def _route_for(asn: int | None, city_es: str | None) -> str:
+    city = _normalize_city(city_es)
 
     if asn in _MOVISTAR_ASNS:
         # Mapeo por ciudad (equivalente al PHP, con fix para Punta Arenas)
         if city in {"santiago de chile", "santiago"}:
-            return BalancedHosts(vod_host=vod_mov_stgo, live_host=live_mov_stgo, asn=asn, city=city_es, decision="movistar:santiago")
+            return "movistar:santiago"
         if city == "antofagasta":
-            return BalancedHosts(vod_host=vod_mov_antof, live_host=live_mov_antof, asn=asn, city=city_es, decision="movistar:antofagasta")
+            return "movistar:antofagasta"
         if city in {"concepcion", "concepción"}:
-            return BalancedHosts(vod_host=vod_mov_conce, live_host=live_mov_conce, asn=asn, city=city_es, decision="movistar:concepcion")
+            return "movistar:concepcion"
         if city == "punta arenas":
-            return BalancedHosts(vod_host=vod_mov_punta, live_host=live_mov_punta, asn=asn, city=city_es, decision="movistar:punta_arenas")
-        return BalancedHosts(vod_host=vod_pitchile, live_host=_pick_one(live_default), asn=asn, city=city_es, decision="movistar:default")
+            return "movistar:punta_arenas"
+        return "movistar:default"
 
     if asn in _CLARO_ASNS:
-        return BalancedHosts(vod_host=vod_claro, live_host=live_claro, asn=asn, city=city_es, decision="claro")
+        return "claro"
 
     if asn in _INTERNEXA_ASNS:
-        return BalancedHosts(vod_host=vod_internexa, live_host=live_internexa, asn=asn, city=city_es, decision="internexa")
+        return "internexa"
 
     if asn in _MANQUEHUE_ASNS:
-        return BalancedHosts(vod_host=vod_manquehue, live_host=live_manquehue, asn=asn, city=city_es, decision="manquehue")
+        return "manquehue"
 
     if asn in _TELSUR_ASNS:
-        return BalancedHosts(vod_host=_pick_one(vod_telsur), live_host=_pick_one(live_telsur), asn=asn, city=city_es, decision="telsur")
+        return "telsur"
 
     if asn in _VTR_ASNS:
-        return BalancedHosts(vod_host=_pick_one(vod_vtr), live_host=live_vtr, asn=asn, city=city_es, decision="vtr")
+        return "vtr"
 
     # Default
-    return BalancedHosts(vod_host=_pick_one(vod_default), live_host=_pick_one(live_default), asn=asn, city=city_es, decision="default:geo")
+    return "default:geo"
+
+
+def configured_edges() -> dict[str, list[str]]:
+    """Edges VOD y LIVE de todas las rutas y del CDN fallback, para el health checker."""
+
+    edges = {"vod": [], "live": []}
+    hosts = list(_ROUTE_HOSTS.values())
+    if bool(getattr(settings, "CDN_BALANCER_FALLBACK_TO_CDN", True)):
+        hosts.append(_fallback_cdn())
+    for vod, live in hosts:
+        for kind, value in (("vod", vod), ("live", live)):
+            edges[kind].extend(host for host in _pool(value) if host not in edges[kind])
+    return edges
+
+
+def _hosts_for_route(route: str, asn: int | None, city_es: str | None, client_ip: str | None = None) -> BalancedHosts:
+    vod, live = _ROUTE_HOSTS[route]
+    vod_host = _pick_one(vod)
+    live_host = _pick_one(live)
+    decision = route
+    # Sin edges sanos en el pool: failover a un edge sano de default:geo,
+    # luego al CDN fallback si está sano, y si nada lo está al CDN fallback
+    if vod_host is None or live_host is None:
+        vod_geo, live_geo = _ROUTE_HOSTS["default:geo"]
+        vod_fallback, live_fallback = _fallback_cdn()
+        vod_host = vod_host or _pick_failover(vod_geo, vod_fallback)
+        live_host = live_host or _pick_failover(live_geo, live_fallback)
+        decision = f"{route}:failover"
+    return BalancedHosts(vod_host=vod_host, live_host=live_host, client_ip=client_ip, asn=asn, city=city_es, decision=decision)
+
+
+def _select_by_asn_and_city(asn: int | None, city_es: str | None) -> BalancedHosts:
+    return _hosts_for_route(_route_for(asn, city_es), asn, city_es)
 
 
 _readers_lock = threading.Lock()
@@ -250,7 +318,17 @@ def _get_reader(kind: str, db_path: str):
     return None
 
 
-def _lookup_asn_city(client_ip: str) -> tuple[int | None, str | None]:
+def _lookup_network(networks: list, client_ip: str):
+    # ASN y ciudad valen para toda la red más específica de ambas bases
+    networks = [network for network in networks if network is not None]
+    if not networks:
+        return ipaddress.ip_network(client_ip)
+    return max(networks, key=lambda network: network.prefixlen)
+
+
+def _lookup_asn_city(client_ip: str) -> tuple[int | None, str | None, object]:
+    """(ASN, ciudad, red) de una IP; la red es el prefijo en que ambos valen."""
+
     global GEOIP2_LOOKUP_STATUS
 
     city_db = getattr(settings, "CDN_BALANCER_CITY_DB_PATH", "")
@@ -258,6 +336,7 @@ def _lookup_asn_city(client_ip: str) -> tuple[int | None, str | None]:
 
     asn = None
     city_name_es = None
+    networks = []
     status = {
         "client_ip": client_ip,
         "asn_db_path": asn_db,
@@ -273,14 +352,17 @@ def _lookup_asn_city(client_ip: str) -> tuple[int | None, str | None]:
         if asn_reader is not None:
             asn_resp = asn_reader.asn(client_ip)
             asn = getattr(asn_resp, "autonomous_system_number", None)
+            networks.append(getattr(asn_resp, "network", None))
     except Exception as exc:
         asn = None
+        networks.append(getattr(exc, "network", None))
         status["asn_error"] = repr(exc)
 
     try:
         city_reader = _get_reader("city", city_db)
         if city_reader is not None:
             city_resp = city_reader.city(client_ip)
+            networks.append(getattr(city_resp.traits, "network", None))
             city_name_es = None
             try:
                 city_name_es = city_resp.city.names.get("es")
@@ -288,19 +370,185 @@ def _lookup_asn_city(client_ip: str) -> tuple[int | None, str | None]:
                 city_name_es = None
     except Exception as exc:
         city_name_es = None
+        networks.append(getattr(exc, "network", None))
         status["city_error"] = repr(exc)
 
+    network = _lookup_network(networks, client_ip)
     status["asn"] = asn
     status["city"] = city_name_es
+    status["network"] = str(network)
     GEOIP2_LOOKUP_STATUS = status
-    return asn, city_name_es
+    return asn, city_name_es, network
+
+
+# Tabla de rutas por prefijo, compilada por compile_routing_table (tarea
+# periódica) desde las mmdb y guardada en Redis en una sola llave. Cada
+# proceso la carga en un PrefixTrie y la recarga cada
+# CDN_BALANCER_ROUTES_REFRESH_SECONDS. Las IPs fuera de la tabla se resuelven
+# con las mmdb y su prefijo se aprende en dos niveles: un trie del proceso,
+# acotado por LRU, delante de una llave de Redis por prefijo compartida por
+# todos los procesos.
+ROUTING_TABLE_KEY = "cdn_balancer:routes:v1"
+LEARNED_ROUTE_KEY = "cdn_balancer:v2:{0}"
+
+_routing_lock = threading.Lock()
+# learned_order: prefijos aprendidos, del menos al más recientemente usado
+_routing = {"table": PrefixTrie(), "learned": PrefixTrie(), "learned_order": OrderedDict(), "loaded_at": None, "built_at": None}
+
+_stats_lock = threading.Lock()
+_STATS_EMPTY = {"prefix_hits": 0, "learned_hits": 0, "shared_hits": 0, "misses": 0, "negative": 0, "seconds": 0.0, "lookup_seconds": 0.0}
+_stats = dict(_STATS_EMPTY)
+
+
+def compile_routing_table() -> int:
+    """Compila las rutas de los ASNs configurados desde las mmdb y las guarda
+    en Redis; devuelve la cantidad de prefijos."""
+
+    asn_db = getattr(settings, "CDN_BALANCER_ASN_DB_PATH", "")
+    city_db = getattr(settings, "CDN_BALANCER_CITY_DB_PATH", "")
+    if not asn_db:
+        return 0
+
+    routes = compile_mmdb_routes(asn_db, city_db, _ROUTED_ASNS, _CITY_ROUTED_ASNS, _route_for)
+
+    cache.set(
+        ROUTING_TABLE_KEY,
+        {"built_at": time.time(), "routes": [(str(network), list(value)) for network, value in routes]},
+        None,
+    )
+    return len(routes)
+
+
+def _routing_table() -> PrefixTrie:
+    refresh = int(getattr(settings, "CDN_BALANCER_ROUTES_REFRESH_SECONDS", 300))
+    loaded_at = _routing["loaded_at"]
+    if loaded_at is not None and time.monotonic() - loaded_at < refresh:
+        return _routing["table"]
+
+    with _routing_lock:
+        if _routing["loaded_at"] is loaded_at:
+            stored = cache.get(ROUTING_TABLE_KEY) or {}
+            if stored.get("built_at") != _routing["built_at"]:
+                table = PrefixTrie()
+                for network, value in stored.get("routes", []):
+                    table.insert(network, tuple(value))
+                _routing.update(table=table, built_at=stored.get("built_at"))
+            _routing["loaded_at"] = time.monotonic()
+    return _routing["table"]
+
+
+def _learned_route(client_ip: str):
+    """(ruta, asn, ciudad) del prefijo aprendido en este proceso, o None."""
+
+    learned = _routing["learned"].lookup(client_ip)
+    if learned is None:
+        return None
+    route, asn, city, expires, network = learned
+    with _routing_lock:
+        if expires <= time.monotonic():
+            _forget_route(network)
+            return None
+        if network in _routing["learned_order"]:
+            _routing["learned_order"].move_to_end(network)
+    return route, asn, city
+
+
+def _forget_route(network: str) -> None:
+    _routing["learned"].remove(network)
+    _routing["learned_order"].pop(network, None)
+
+
+def _keep_route(network: str, route: str, asn: int | None, city: str | None, ttl: float) -> None:
+    # Aprende un prefijo en el proceso; sobre el máximo sale el usado hace más tiempo
+    max_prefixes = int(getattr(settings, "CDN_BALANCER_LEARNED_PREFIXES_MAX", 50000))
+    with _routing_lock:
+        _routing["learned"].insert(network, (route, asn, city, time.monotonic() + ttl, network))
+        _routing["learned_order"][network] = None
+        _routing["learned_order"].move_to_end(network)
+        while len(_routing["learned_order"]) > max_prefixes:
+            oldest, _ = _routing["learned_order"].popitem(last=False)
+            _routing["learned"].remove(oldest)
+
+
+def _covering_prefixes(client_ip: str) -> list[str]:
+    # Todos los prefijos que contienen la IP, del más específico al más amplio
+    address = ipaddress.ip_address(client_ip)
+    return [str(ipaddress.ip_network((address, length), strict=False)) for length in range(address.max_prefixlen, -1, -1)]
+
+
+def _shared_route(client_ip: str):
+    """(ruta, asn, ciudad) del prefijo más específico aprendido por cualquier
+    proceso, en un solo MGET; queda aprendido también en este proceso."""
+
+    prefixes = _covering_prefixes(client_ip)
+    found = cache.get_many([LEARNED_ROUTE_KEY.format(network) for network in prefixes])
+    for network in prefixes:
+        value = found.get(LEARNED_ROUTE_KEY.format(network))
+        if value:
+            route, asn, city, expires_at = value
+            _keep_route(network, route, asn, city, max(expires_at - time.time(), 0))
+            return route, asn, city
+    return None
+
+
+def _learn_route(network, route: str, asn: int | None, city: str | None, cache_ttl: int) -> None:
+    ttl = cache_ttl
+    if route == "no_geo_match":
+        ttl = min(ttl, int(getattr(settings, "CDN_BALANCER_NEGATIVE_CACHE_TTL_SECONDS", 300)))
+    network = str(network)
+    cache.set(LEARNED_ROUTE_KEY.format(network), [route, asn, city, time.time() + ttl], ttl)
+    _keep_route(network, route, asn, city, ttl)
+
+
+def _record(outcome: str, started: float, *, lookup_seconds: float = 0.0, negative: bool = False) -> None:
+    with _stats_lock:
+        _stats[outcome] += 1
+        _stats["seconds"] += time.perf_counter() - started
+        _stats["lookup_seconds"] += lookup_seconds
+        if negative:
+            _stats["negative"] += 1
+
+
+def balancer_cache_stats() -> dict:
+    """Aciertos por prefijo, fallos y latencia media (microsegundos) del balancer en este proceso."""
+
+    with _stats_lock:
+        stats = dict(_stats)
+    requests = stats["prefix_hits"] + stats["learned_hits"] + stats["shared_hits"] + stats["misses"]
+    return {
+        "requests": requests,
+        "prefix_hits": stats["prefix_hits"],
+        "learned_hits": stats["learned_hits"],
+        "shared_hits": stats["shared_hits"],
+        "misses": stats["misses"],
+        "negative": stats["negative"],
+        "table_prefixes": len(_routing["table"]),
+        "learned_prefixes": len(_routing["learned"]),
+        "table_built_at": _routing["built_at"],
+        "hit_rate": round((requests - stats["misses"]) / requests, 4) if requests else 0.0,
+        "avg_us": round(stats["seconds"] / requests * 1e6, 1) if requests else 0.0,
+        "avg_lookup_us": round(stats["lookup_seconds"] / stats["misses"] * 1e6, 1) if stats["misses"] else 0.0,
+    }
+
+
+def reset_balancer_cache() -> None:
+    """Descarta las rutas cargadas y aprendidas en el proceso y los contadores
+    (tests, recarga de mmdb); las llaves de Redis vencen solas."""
+
+    with _routing_lock:
+        _routing.update(table=PrefixTrie(), learned=PrefixTrie(), learned_order=OrderedDict(), loaded_at=None, built_at=None)
+    with _stats_lock:
+        _stats.update(_STATS_EMPTY)
 
 
 def get_balanced_hosts_for_request(request) -> BalancedHosts:
     """Devuelve hosts VOD/LIVE balanceados según IP→(ASN, Ciudad).
 
     - No lanza excepciones: si falta geoip2/mmdb, cae al CDN fallback configurable.
-    - Cachea por IP para bajar costo.
+    - Resuelve por prefijo de red: tabla compilada de los ASNs configurados,
+      prefijos aprendidos en el proceso (LRU) y en Redis (compartidos).
+    - Las redes sin ASN ni ciudad se cachean también (cache negativo), con un
+      TTL más corto.
     """
 
     client_ip = _pick_client_ip(request)
@@ -325,44 +573,30 @@ def get_balanced_hosts_for_request(request) -> BalancedHosts:
     if not getattr(settings, "CDN_BALANCER_CITY_DB_PATH", "") and not getattr(settings, "CDN_BALANCER_ASN_DB_PATH", ""):
         return _fallback_hosts("no_mmdb", client_ip=client_ip)
 
+    started = time.perf_counter()
     cache_ttl = int(getattr(settings, "CDN_BALANCER_CACHE_TTL_SECONDS", 3600))
-    cache_key = f"cdn_balancer:v1:{client_ip}"
-    cached = cache.get(cache_key)
-    if isinstance(cached, dict) and cached.get("vod_host") and cached.get("live_host"):
-        return BalancedHosts(
-            vod_host=cached["vod_host"],
-            live_host=cached["live_host"],
-            client_ip=client_ip,
-            asn=cached.get("asn"),
-            city=cached.get("city"),
-            decision=cached.get("decision", "cache"),
-        )
-
-    asn, city = _lookup_asn_city(client_ip)
-    # Si no pudimos resolver nada, usar CDN fallback para no volver al origen.
-    if asn is None and not (city and str(city).strip()):
-        selected = _fallback_hosts("no_geo_match", client_ip=client_ip)
+    # 1) tabla compilada, 2) prefijos aprendidos en el proceso, 3) en Redis
+    route = _routing_table().lookup(client_ip)
+    outcome = "prefix_hits"
+    if route is None:
+        route = _learned_route(client_ip)
+        outcome = "learned_hits"
+    if route is None:
+        route = _shared_route(client_ip)
+        outcome = "shared_hits"
+    if route is not None:
+        decision, asn, city = route[:3]
+        _record(outcome, started, negative=decision == "no_geo_match")
     else:
-        selected = _select_by_asn_and_city(asn, city)
-    selected = BalancedHosts(
-        vod_host=selected.vod_host,
-        live_host=selected.live_host,
-        client_ip=client_ip,
-        asn=selected.asn,
-        city=selected.city,
-        decision=selected.decision,
-    )
-
-    cache.set(
-        cache_key,
-        {
-            "vod_host": selected.vod_host,
-            "live_host": selected.live_host,
-            "asn": selected.asn,
-            "city": selected.city,
-            "decision": selected.decision,
-        },
-        cache_ttl,
-    )
-
-    return selected
+        # 4) lookup en las mmdb, el prefijo queda aprendido en ambos niveles
+        lookup_started = time.perf_counter()
+        asn, city, network = _lookup_asn_city(client_ip)
+        lookup_seconds = time.perf_counter() - lookup_started
+        # Si no pudimos resolver nada, usar CDN fallback para no volver al origen.
+        decision = "no_geo_match" if asn is None and not (city and str(city).strip()) else _route_for(asn, city)
+        _learn_route(network, decision, asn, city, cache_ttl)
+        _record("misses", started, lookup_seconds=lookup_seconds, negative=decision == "no_geo_match")
+
+    if decision == "no_geo_match":
+        return _fallback_hosts("no_geo_match", client_ip=client_ip)
+    return _hosts_for_route(decision, asn, city, client_ip=client_ip)
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+# Health of the CDN edges the balancer routes to. check_edges probes the HLS
+# endpoint of every edge and keeps, per host, moving averages of latency and
+# error rate plus the run of consecutive failures, in one shared cache key.
+# Processes read it at most every CDN_BALANCER_HEALTH_REFRESH_SECONDS and
+# choose_edge picks among the healthy edges of a pool, weighted by speed.
+EDGE_HEALTH_KEY = "cdn_balancer:edge_health:v1"
+# latency assumed for edges not probed yet
+UNKNOWN_LATENCY_MS = 100.0
+
+_snapshot_lock = threading.Lock()
+_snapshot = {"health": {}, "loaded_at": None}
+
+
+def _setting(name, default):
+    return getattr(settings, f"CDN_BALANCER_HEALTH_{name}", default)
+
+
+def _probe_media_id() -> str | None:
+    from .models import Media
+
+    # the newest listable video, encoded, so its playlist exists
+    return Media.objects.filter(listable=True, media_type="video").order_by("-add_date").values_list("friendly_token", flat=True).first()
+
+
+def health_urls() -> dict:
+    """URL templates with {host} probed on the edges of each kind, a VOD
+    and a live HLS playlist; None when there is no VOD media to probe"""
+
+    urls = dict(_setting("URLS", {}) or {})
+    if not urls.get("live"):
+        stream = (getattr(settings, "WOWZA_STREAM_NAMES", None) or ["default_stream"])[0]
+        urls["live"] = f"https://{{host}}/{stream}/live/playlist.m3u8"
+    if not urls.get("vod"):
+        media_id = _setting("MEDIA_ID", None) or _probe_media_id()
+        vod_template = getattr(settings, "WOWZA_VOD_SMIL_PATH_TEMPLATE", "mediavms-development/smil:{media_id}.smil/playlist.m3u8")
+        urls["vod"] = "https://{host}/" + vod_template.format(media_id=media_id) if media_id else None
+    return urls
+
+
+def probe_edge(url: str, timeout: float) -> tuple[bool, float]:
+    """(up, seconds) of a GET; the edge serves when it answers the playlist,
+    or 401/403 for tokens. A missing playlist (404) counts as down"""
+
+    started = time.perf_counter()
+    try:
+        response = requests.get(url, timeout=timeout, allow_redirects=False)
+        response.close()
+        up = response.status_code < 400 or response.status_code in (401, 403)
+    except requests.RequestException:
+        up = False
+    return up, time.perf_counter() - started
+
+
+def _update(state: dict | None, up: bool, seconds: float, now: float) -> dict:
+    alpha = float(_setting("EWMA_ALPHA", 0.3))
+    state = dict(state or {"latency_ms": seconds * 1000, "error_rate": 0.0, "failures": 0})
+    state["error_rate"] = (1 - alpha) * state["error_rate"] + alpha * (0.0 if up else 1.0)
+    if up:
+        state["latency_ms"] = (1 - alpha) * state["latency_ms"] + alpha * seconds * 1000
+        state["failures"] = 0
+    else:
+        state["failures"] += 1
+    state["healthy"] = state["failures"] < int(_setting("MAX_FAILURES", 2)) and state["error_rate"] <= float(_setting("MAX_ERROR_RATE", 0.5))
+    state["checked_at"] = now
+    return state
+
+
+def check_edges(edges: dict) -> dict:
+    """Probe edges, {kind: [hosts]}, and store their updated health;
+    returns the health by host"""
+
+    # edges of a kind without a playlist to probe keep their last health
+    templates = health_urls()
+    urls = {}
+    for kind, pool in edges.items():
+        for host in pool:
+            if host not in urls and templates.get(kind):
+                urls[host] = templates[kind].format(host=host)
+    timeout = float(_setting("TIMEOUT_SECONDS", 2))
+    workers = max(1, min(int(_setting("CONCURRENCY", 8)), len(urls) or 1))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = dict(zip(urls, executor.map(lambda url: probe_edge(url, timeout), urls.values())))
+
+    previous = cache.get(EDGE_HEALTH_KEY) or {}
+    now = time.time()
+    health = {host: previous[host] for pool in edges.values() for host in pool if host in previous}
+    health.update({host: _update(previous.get(host), up, seconds, now) for host, (up, seconds) in results.items()})
+    cache.set(EDGE_HEALTH_KEY, health, None)
+    return health
+
+
+def edge_health() -> dict:
+    """Health by host as last stored, reread every CDN_BALANCER_HEALTH_REFRESH_SECONDS"""
+
+    refresh = float(_setting("REFRESH_SECONDS", 5))
+    loaded_at = _snapshot["loaded_at"]
+    if loaded_at is None or time.monotonic() - loaded_at >= refresh:
+        with _snapshot_lock:
+            if _snapshot["loaded_at"] is loaded_at:
+                _snapshot.update(health=cache.get(EDGE_HEALTH_KEY) or {}, loaded_at=time.monotonic())
+    return _snapshot["health"]
+
+
+def reset_edge_health() -> None:
+    with _snapshot_lock:
+        _snapshot.update(health={}, loaded_at=None)
+
+
+def choose_edge(pool: list[str]) -> str | None:
+    """A healthy edge of a pool, faster and more reliable edges more often.
+    Edges without recent checks count as healthy; None when all are down"""
+
+    if not _setting("ENABLED", True):
+        return random.choice(pool)
+
+    health = edge_health()
+    stale_before = time.time() - float(_setting("STALE_SECONDS", 60))
+    candidates = []
+    weights = []
+    for host in pool:
+        state = health.get(host)
+        if state is None or state["checked_at"] < stale_before:
+            latency_ms, error_rate = UNKNOWN_LATENCY_MS, 0.0
+        elif not state["healthy"]:
+            continue
+        else:
+            latency_ms, error_rate = state["latency_ms"], state["error_rate"]
+        candidates.append(host)
+        weights.append(max(1.0 - error_rate, 0.01) / max(latency_ms, 1.0))
+    if not candidates:
+        return None
+    return random.choices(candidates, weights=weights)[0]
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import ipaddress
+
+try:
+    import maxminddb
+except Exception:  # pragma: no cover
+    maxminddb = None
+
+# Balancer decisions only depend on the ASN and city of a client, so they are
+# constant over the networks of the GeoLite2 ASN and City databases. Routes
+# are kept per network prefix in a PrefixTrie, where the route of an address
+# is the value of its longest prefix, found in at most 32 (IPv4) or 128
+# (IPv6) steps. compile_routes builds the table of the configured ASNs from
+# the databases, split by city where the route depends on the city.
+
+
+class PrefixTrie:
+    """Binary trie of IP networks, with longest prefix match lookups"""
+
+    def __init__(self):
+        # node: [child for bit 0, child for bit 1, value]
+        self._roots = {4: [None, None, None], 6: [None, None, None]}
+        self._size = 0
+
+    def insert(self, network, value) -> None:
+        network = ipaddress.ip_network(network, strict=False)
+        bits = network.max_prefixlen
+        address = int(network.network_address)
+        node = self._roots[network.version]
+        for depth in range(network.prefixlen):
+            bit = (address >> (bits - 1 - depth)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        if node[2] is None:
+            self._size += 1
+        node[2] = value
+
+    def remove(self, network) -> None:
+        """Drop the value of a network, and the nodes left without values"""
+
+        network = ipaddress.ip_network(network, strict=False)
+        bits = network.max_prefixlen
+        address = int(network.network_address)
+        path = [self._roots[network.version]]
+        for depth in range(network.prefixlen):
+            node = path[-1][(address >> (bits - 1 - depth)) & 1]
+            if node is None:
+                return
+            path.append(node)
+        if path[-1][2] is None:
+            return
+        path[-1][2] = None
+        self._size -= 1
+        for depth in range(network.prefixlen, 0, -1):
+            if path[depth] != [None, None, None]:
+                break
+            path[depth - 1][(address >> (bits - depth)) & 1] = None
+
+    def lookup(self, address):
+        """Value of the longest prefix holding an address, None if none does"""
+
+        address = ipaddress.ip_address(address)
+        bits = address.max_prefixlen
+        value = int(address)
+        node = self._roots[address.version]
+        found = node[2]
+        for depth in range(bits):
+            node = node[(value >> (bits - 1 - depth)) & 1]
+            if node is None:
+                break
+            if node[2] is not None:
+                found = node[2]
+        return found
+
+    def __len__(self) -> int:
+        return self._size
+
+
+def compile_routes(asn_networks, route_for, city_asns=frozenset(), city_prefix=None):
+    """[(network, (route, asn, city))] of the networks of a list of ASNs.
+    asn_networks yields (network, asn), route_for(asn, city) gives the route
+    and city_prefix(address) the (city, network) of an address. Networks of
+    city_asns are split by the City networks inside them"""
+
+    routes = []
+    for network, asn in asn_networks:
+        if asn not in city_asns or city_prefix is None:
+            routes.append((network, (route_for(asn, None), asn, None)))
+            continue
+        address_class = ipaddress.IPv4Address if network.version == 4 else ipaddress.IPv6Address
+        address = int(network.network_address)
+        end = int(network.broadcast_address)
+        while address <= end:
+            city, city_network = city_prefix(address_class(address))
+            # City networks are nested in the ASN network or hold all of it
+            piece = city_network if city_network.prefixlen > network.prefixlen else network
+            routes.append((piece, (route_for(asn, city), asn, city)))
+            address = int(piece.broadcast_address) + 1
+    return routes
+
+
+def _mmdb_asn_networks(reader, asns):
+    for network, record in reader:
+        asn = (record or {}).get("autonomous_system_number")
+        if asn in asns:
+            yield network, asn
+
+
+def _mmdb_city_prefix(reader):
+    def city_prefix(address):
+        record, prefix_len = reader.get_with_prefix_len(address)
+        city = ((record or {}).get("city") or {}).get("names", {}).get("es")
+        return city, ipaddress.ip_network((address, prefix_len), strict=False)
+
+    return city_prefix
+
+
+def compile_mmdb_routes(asn_db: str, city_db: str, asns, city_asns, route_for):
+    """compile_routes of the networks of asns in a GeoLite2 ASN database,
+    split by the Spanish city names of a GeoLite2 City database"""
+
+    if maxminddb is None:
+        return []
+    with maxminddb.open_database(asn_db) as asn_reader:
+        if not city_db:
+            return compile_routes(_mmdb_asn_networks(asn_reader, asns), route_for)
+        with maxminddb.open_database(city_db) as city_reader:
+            return compile_routes(_mmdb_asn_networks(asn_reader, asns), route_for, city_asns, _mmdb_city_prefix(city_reader))
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+# Version counters behind the ETag and Last-Modified of API responses.
+# Signals bump them when the content changes, so validators are computed
+# without rendering the response body.
+VERSION_KEY = "content_version:{0}"
+
+# media listings and RSS feeds. View, like and dislike counters are
+# updated without signals, listings revalidate on the next content change
+LISTING_SCOPE = "listing"
+
+
+def media_scope(media_id):
+    return f"media:{media_id}"
+
+
+def playlist_scope(playlist_id):
+    return f"playlist:{playlist_id}"
+
+
+def comments_scope(media_id):
+    return f"comments:{media_id}"
+
+
+# what a user has paid for, subscribed to and rated
+def user_scope(user_id):
+    return f"user:{user_id}"
+
+
+def bump_versions(scopes):
+    # time based, like search cache generations, so a version evicted
+    # from redis never comes back with a value already handed out
+    scopes = list(scopes)
+    if scopes:
+        version = time.time_ns()
+        cache.set_many({VERSION_KEY.format(scope): version for scope in scopes}, None)
+
+
+def get_versions(scopes):
+    keys = [VERSION_KEY.format(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        now = time.time_ns()
+        for key in missing:
+            cache.add(key, now, None)
+        versions.update(cache.get_many(missing))
+    return [versions.get(key, 0) for key in keys]
+
+
+def content_validators(request, scopes, *extra):
+    """ETag and Last-Modified timestamp of a response that depends on the
+    given version scopes and extra values, such as row counters"""
+
+    versions = get_versions(scopes)
+    user_id = request.user.pk if getattr(request, "user", None) and request.user.is_authenticated else None
+    payload = json.dumps([versions, request.get_full_path(), user_id, *extra], default=str)
+    etag = '"{0}"'.format(hashlib.md5(payload.encode("utf-8")).hexdigest())
+    last_modified = max(versions) // 1_000_000_000 if versions else None
+    return etag, last_modified
+
+
+def set_validators(response, etag, last_modified):
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified)
+    return response
+
+
+def not_modified(request, etag, last_modified):
+    """304 response when the client copy is current, otherwise None"""
+
+    validators = set_validators(HttpResponse(), etag, last_modified)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified, response=validators)
+    return None if response is validators else response
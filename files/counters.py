@@ -0,0 +1,125 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django_redis import get_redis_connection
+from redis.exceptions import ResponseError
+
+logger = logging.getLogger(__name__)
+
+# Media counters updated by viewers. Increments are buffered in one redis
+# hash per field (media id -> delta) and applied in batches by
+# flush_media_counters, so a popular media costs one UPDATE per flush
+# instead of one per view.
+COUNTER_FIELDS = ("views", "likes", "dislikes")
+# user actions and the counter they increment
+COUNTER_ACTIONS = {"watch": "views", "like": "likes", "dislike": "dislikes"}
+COUNTER_KEY = "media_counters:{0}"
+# a hash being flushed. It is renamed out of the way of new increments and
+# kept until its deltas are committed, a failed flush retries it first
+FLUSHING_KEY = "media_counters:{0}:flushing"
+
+
+def counters_buffered():
+    return getattr(settings, "MEDIA_COUNTERS_BUFFERED", True)
+
+
+def increment_media_counter(media_id, field, delta=1):
+    """Add delta to a counter of a media"""
+
+    from .models import Media
+
+    if field not in COUNTER_FIELDS:
+        raise ValueError(f"{field} is not a buffered media counter")
+    if not counters_buffered():
+        Media.objects.filter(id=media_id).update(**{field: F(field) + delta})
+        return
+    get_redis_connection("default").hincrby(COUNTER_KEY.format(field), media_id, delta)
+
+
+def pending_media_counters(media_id):
+    """Deltas of a media not flushed yet, by field"""
+
+    redis = get_redis_connection("default")
+    pipe = redis.pipeline()
+    for field in COUNTER_FIELDS:
+        pipe.hget(COUNTER_KEY.format(field), media_id)
+        pipe.hget(FLUSHING_KEY.format(field), media_id)
+    values = pipe.execute()
+    return {field: int(values[i * 2] or 0) + int(values[i * 2 + 1] or 0) for i, field in enumerate(COUNTER_FIELDS)}
+
+
+def _take_deltas(redis, field):
+    live = COUNTER_KEY.format(field)
+    flushing = FLUSHING_KEY.format(field)
+    if not redis.exists(flushing):
+        try:
+            redis.rename(live, flushing)
+        except ResponseError:
+            # no increments since the last flush
+            return {}
+    return {int(media_id): int(delta) for media_id, delta in redis.hgetall(flushing).items() if int(delta)}
+
+
+def flush_media_counters():
+    """Apply buffered counter deltas with F() updates, returns the number
+    of media updated"""
+
+    from .models import Media
+
+    redis = get_redis_connection("default")
+    batch_size = max(1, int(getattr(settings, "MEDIA_COUNTERS_FLUSH_BATCH_SIZE", 500) or 500))
+    updated = set()
+    for field in COUNTER_FIELDS:
+        deltas = _take_deltas(redis, field)
+        items = sorted(deltas.items())
+        # sorted ids, so concurrent flushes and saves lock rows in the same order
+        for start in range(0, len(items), batch_size):
+            batch = items[start : start + batch_size]
+            with transaction.atomic():
+                for media_id, delta in batch:
+                    Media.objects.filter(id=media_id).update(**{field: F(field) + delta})
+            # committed deltas leave the hash, a retry applies only the rest
+            redis.hdel(FLUSHING_KEY.format(field), *[media_id for media_id, _ in batch])
+            updated.update(media_id for media_id, _ in batch)
+        redis.delete(FLUSHING_KEY.format(field))
+
+    if updated:
+        logger.info("Flushed counters of %s media", len(updated))
+    return len(updated)
+
+
+# media_count of users, categories and tags is kept with F() deltas when a
+# media becomes or ceases to be counted, or a category or tag is linked or
+# unlinked (see update_media_counts). Changes made with update() skip those,
+# reconcile_media_counts recounts everything periodically.
+
+
+def _reconcile(model, counts):
+    stale = []
+    for object_id, media_count in model.objects.values_list("id", "media_count").iterator(chunk_size=5000):
+        count = counts.get(object_id, 0)
+        if media_count != count:
+            stale.append(model(id=object_id, media_count=count))
+    model.objects.bulk_update(stale, ["media_count"], batch_size=500)
+    return len(stale)
+
+
+def reconcile_media_counts():
+    """Recount media_count of users, categories and tags with one grouped
+    query each, returns the number of rows corrected"""
+
+    from users.models import User
+
+    from .models import Category, Media, Tag
+
+    listable = Media.objects.filter(listable=True)
+    users = dict(listable.values_list("user_id").annotate(count=Count("id")).order_by())
+    categories = dict(Media.category.through.objects.filter(media__listable=True).values_list("category_id").annotate(count=Count("id")).order_by())
+    tags = dict(Media.tags.through.objects.filter(media__state="public", media__is_reviewed=True).values_list("tag_id").annotate(count=Count("id")).order_by())
+
+    fixed = _reconcile(User, users) + _reconcile(Category, categories) + _reconcile(Tag, tags)
+    if fixed:
+        logger.info("Corrected media_count of %s users, categories and tags", fixed)
+    return fixed
@@ -1,12 +1,18 @@
+import time
+
 from django.conf import settings
-from django.contrib.postgres.search import SearchQuery
 from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.http import HttpResponse
 from django.urls import reverse
+from django.utils.cache import patch_vary_headers
 from django.utils.feedgenerator import Rss201rev2Feed
+from django.utils.text import compress_string
 
-from . import helpers
+from .content_versions import not_modified, set_validators
 from .models import Media
-from .stop_words import STOP_WORDS
+from .search_cache import cached_search, search_cache_key
+from .search_index import build_search_query
 
 
 class MediaRSSFeed(Rss201rev2Feed):
@@ -105,9 +111,10 @@ class SearchRSSFeed(Feed):
         return "/rss/search"
 
     def get_object(self, request):
-        category = request.GET.get("c", "")
-        tag = request.GET.get("t", "")
-        query = request.GET.get("q", "")
+        cache_params = feed_search_params(request)
+        category = cache_params["c"]
+        tag = cache_params["t"]
+        query = cache_params["q"]
 
         media = Media.objects.filter(listable=True)
 
@@ -116,21 +123,14 @@ class SearchRSSFeed(Feed):
         elif tag:
             media = media.filter(tags__title=tag)
         elif query:
-            # same as on files.views.MediaSearch: move this processing to a prepare_query function
-            query = helpers.clean_query(query)
-            q_parts = [q_part.rstrip("y") for q_part in query.split() if q_part not in STOP_WORDS]
-            if q_parts:
-                query = SearchQuery(q_parts[0] + ":*", search_type="raw")
-                for part in q_parts[1:]:
-                    query &= SearchQuery(part + ":*", search_type="raw")
-            else:
-                query = None
-        if query:
-            media = media.filter(search=query)
+            search_query = build_search_query(query)
+            if search_query:
+                # listable media are public and reviewed, spelled out for
+                # the partial search index
+                media = media.filter(state="public", is_reviewed=True, search=search_query)
 
         media = media.order_by("-add_date").prefetch_related("user")
-
-        return media
+        return cached_search("rss", cache_params, media, max_ids=20)
 
     def items(self, objects):
         return objects[:20]
@@ -163,3 +163,58 @@ class SearchRSSFeed(Feed):
             "thumbnail_width": 720,
         }
         return item
+
+
+def feed_search_params(request):
+    """Normalised scope of a feed request, as search cache params"""
+
+    return {
+        "c": request.GET.get("c", ""),
+        "t": request.GET.get("t", ""),
+        "q": " ".join(request.GET.get("q", "").lower().split()),
+    }
+
+
+def cached_feed(feed):
+    """Feed view cached per feed key.
+
+    The key holds the search cache generations of the feed scope, so a
+    feed is rendered again as soon as media of its category, tag or of
+    the whole site change. Responses carry an ETag and Last-Modified, and
+    the gzip body is cached next to the plain one.
+    """
+
+    def view(request, *args, **kwargs):
+        params = {"path": request.path, **feed_search_params(request)}
+        key = search_cache_key("rss_feed", params)
+        gzipped = "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", "")
+        digest = key.rsplit(":", 1)[-1]
+        etag = f'"{digest}-gzip"' if gzipped else f'"{digest}"'
+
+        entry = cache.get(key)
+        response = not_modified(request, etag, entry["last_modified"] if entry else None)
+        if response:
+            patch_vary_headers(response, ["Accept-Encoding"])
+            return response
+
+        if entry is None:
+            rendered = feed(request, *args, **kwargs)
+            if rendered.status_code != 200:
+                return rendered
+            entry = {
+                "content": rendered.content,
+                "gzip_content": compress_string(rendered.content),
+                "content_type": rendered["Content-Type"],
+                "last_modified": int(time.time()),
+            }
+            cache.set(key, entry, getattr(settings, "RSS_FEED_CACHE_TIMEOUT", 60 * 60))
+
+        if gzipped:
+            response = HttpResponse(entry["gzip_content"], content_type=entry["content_type"])
+            response["Content-Encoding"] = "gzip"
+        else:
+            response = HttpResponse(entry["content"], content_type=entry["content_type"])
+        patch_vary_headers(response, ["Accept-Encoding"])
+        return set_validators(response, etag, entry["last_modified"])
+
+    return view
@@ -0,0 +1,84 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from . import helpers
+from .content_versions import LISTING_SCOPE, bump_versions
+
+# bump when the card layout changes, old cards are then ignored
+MEDIA_CARD_KEY = "media_card:v1:{0}"
+
+# user fields shown on media cards
+CARD_USER_FIELDS = {"username", "name", "logo"}
+
+
+def _card_key(media_id):
+    return MEDIA_CARD_KEY.format(media_id)
+
+
+def _build_cards(media_list):
+    """Listing cards of the given media: the URLs and author fields of a
+    listing row, relative to the site, so they can be shared by requests.
+    Counters like views and likes are not part of it, they are read from
+    the row."""
+
+    from .models import Encoding
+
+    # preview_url falls back to the gif encoding, look those up in one query
+    missing_preview = [media.id for media in media_list if not media.preview_file_path]
+    gif_previews = {}
+    if missing_preview:
+        encodings = (
+            Encoding.objects.filter(media_id__in=missing_preview, profile__extension="gif")
+            .exclude(media_file="")
+            .order_by("id")
+            .values_list("media_id", "media_file")
+        )
+        storage = Encoding._meta.get_field("media_file").storage
+        for media_id, media_file in encodings:
+            gif_previews.setdefault(media_id, helpers.url_from_path(storage.path(media_file)))
+
+    cards = {}
+    for media in media_list:
+        if media.preview_file_path:
+            preview_url = helpers.url_from_path(media.preview_file_path)
+        else:
+            preview_url = gif_previews.get(media.id)
+        cards[media.id] = {
+            "url": media.get_absolute_url(),
+            "api_url": media.get_absolute_url(api=True),
+            "thumbnail_url": media.thumbnail_url,
+            "preview_url": preview_url,
+            "author_profile": media.author_profile(),
+            "author_thumbnail": media.author_thumbnail(),
+        }
+    return cards
+
+
+def get_media_cards(media_list):
+    """Cards by media id, read from the cache in one round trip and built
+    in bulk for the ones missing"""
+
+    media_list = [media for media in media_list if media is not None]
+    if not media_list:
+        return {}
+
+    cached = cache.get_many([_card_key(media.id) for media in media_list])
+    cards = {media.id: cached[_card_key(media.id)] for media in media_list if _card_key(media.id) in cached}
+
+    missing = [media for media in media_list if media.id not in cards]
+    if missing:
+        built = _build_cards(missing)
+        cache.set_many(
+            {_card_key(media_id): card for media_id, card in built.items()},
+            getattr(settings, "MEDIA_CARD_TIMEOUT", 60 * 60 * 24),
+        )
+        cards.update(built)
+    return cards
+
+
+def invalidate_media_cards(media_ids):
+    media_ids = list(media_ids)
+    if media_ids:
+        cache.delete_many([_card_key(media_id) for media_id in media_ids])
+        # listings and feeds showing these cards revalidate
+        bump_versions([LISTING_SCOPE])
@@ -0,0 +1,105 @@
+import itertools
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from files.models import Media
+from files.search_index import build_search_query, index_media_batch, rank_search_results, search_batch_size
+from users.models import User
+
+WORDS = [
+    "concierto", "entrevista", "noticias", "deporte", "futbol", "musica", "radio", "programa",
+    "documental", "cultura", "historia", "ciencia", "politica", "economia", "teatro", "danza",
+    "festival", "clase", "tutorial", "podcast", "reportaje", "tecnologia", "cine", "series",
+]
+# synthetic vocabulary with a zipf-like distribution, so that query
+# selectivity looks like real titles and descriptions
+VOCABULARY = WORDS + [f"palabra{i}" for i in range(20000)]
+VOCABULARY_CUM_WEIGHTS = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(VOCABULARY))))
+
+
+def random_text(words):
+    return " ".join(random.choices(VOCABULARY, cum_weights=VOCABULARY_CUM_WEIGHTS, k=words))
+
+
+class Command(BaseCommand):
+    help = "Compare MediaSearch latency with date ordering vs relevance ranking on seeded data"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=500000, help="Synthetic media rows to create")
+        parser.add_argument("--runs", type=int, default=20, help="Runs per query and ordering")
+        parser.add_argument("--keep", action="store_true", help="Keep seeded rows instead of rolling back")
+        parser.add_argument("queries", nargs="*", help="Search terms, defaults to a sample of seeded words")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options["seed"]:
+                self.seed(options["seed"])
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE files_media")
+
+            queries = options["queries"] or random.sample(WORDS, 3) + ["palabra50", "palabra500", "noticias pala"]
+            for query in queries:
+                self.benchmark(query, max(1, options["runs"]))
+
+            if not options["keep"]:
+                transaction.set_rollback(True)
+                self.stdout.write("Seeded rows rolled back")
+
+    def seed(self, total):
+        user, _ = User.objects.get_or_create(username="search-benchmark", defaults={"email": "search-benchmark@example.com"})
+        batch_size = search_batch_size()
+        created = 0
+        now = timezone.now()
+        while created < total:
+            size = min(batch_size, total - created)
+            # bulk_create skips Media.save and signals, which is what a
+            # seed of this size needs
+            media = Media.objects.bulk_create(
+                [
+                    Media(
+                        user=user,
+                        title=random_text(4),
+                        description=random_text(30),
+                        media_file="original/search-benchmark.mp4",
+                        friendly_token=f"bench{created + i}",
+                        add_date=now - timedelta(minutes=random.randint(0, 60 * 24 * 365 * 5)),
+                        state="public",
+                        is_reviewed=True,
+                        encoding_status="success",
+                        listable=True,
+                    )
+                    for i in range(size)
+                ]
+            )
+            index_media_batch([item.id for item in media])
+            created += size
+            self.stdout.write(f"  seeded {created}/{total}")
+
+    def benchmark(self, query, runs):
+        search_query = build_search_query(query)
+        if search_query is None:
+            return
+        base = Media.objects.filter(state="public", is_reviewed=True, search=search_query)
+        orderings = {
+            "add_date": base.order_by("-add_date"),
+            "relevance": rank_search_results(base, search_query),
+        }
+        for name, qs in orderings.items():
+            timings = []
+            for _ in range(runs):
+                # same work as a MediaSearch page: count plus first page
+                start = time.perf_counter()
+                qs.count()
+                list(qs.values_list("id", flat=True)[:50])
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            self.stdout.write(
+                self.style.SUCCESS(f"{query!r:32} {name:10} p50={statistics.median(timings):.1f}ms p95={p95:.1f}ms")
+            )
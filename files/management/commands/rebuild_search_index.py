@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from files.search_index import index_dirty_media, rebuild_search_index, search_batch_size
+
+
+class Command(BaseCommand):
+    help = "Recompute the media search index in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=search_batch_size(),
+            help="Media rows per UPDATE",
+        )
+        parser.add_argument(
+            "--dirty-only",
+            action="store_true",
+            help="Only reindex media queued by saves",
+        )
+
+    def handle(self, *args, **options):
+        if options["dirty_only"]:
+            updated = index_dirty_media()
+            self.stdout.write(self.style.SUCCESS(f"Reindexed {updated} media"))
+            return
+
+        def progress(done, total):
+            self.stdout.write(f"  {done}/{total}")
+
+        updated = rebuild_search_index(batch_size=max(1, options["batch_size"]), progress=progress)
+        self.stdout.write(self.style.SUCCESS(f"Reindexed {updated} media"))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from files.models import Media, generate_smil, schedule_smil_generation
+
+
+class Command(BaseCommand):
+    help = "Regenerate SMIL manifests for media with successful mp4 encodings"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "tokens",
+            nargs="*",
+            help="Friendly tokens to regenerate, defaults to the whole catalog",
+        )
+        parser.add_argument(
+            "--async",
+            action="store_true",
+            dest="use_async",
+            help="Schedule the debounced background task instead of writing inline",
+        )
+
+    def handle(self, *args, **options):
+        media = Media.objects.filter(
+            encodings__profile__extension="mp4",
+            encodings__status="success",
+            encodings__chunk=False,
+        ).distinct()
+        if options["tokens"]:
+            media = media.filter(friendly_token__in=options["tokens"])
+
+        generated = 0
+        skipped = 0
+        for item in media.iterator():
+            if options["use_async"]:
+                done = schedule_smil_generation(item)
+            else:
+                done = generate_smil(item)
+            if done:
+                generated += 1
+            else:
+                skipped += 1
+
+        verb = "Scheduled" if options["use_async"] else "Generated"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {generated} SMIL files"))
+        self.stdout.write(f"Skipped {skipped} media")
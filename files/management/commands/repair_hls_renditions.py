@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from files.media_documents import invalidate_media_documents
+from files.models import Media, parse_hls_renditions
+
+
+class Command(BaseCommand):
+    help = "Parse the HLS playlists of media and store their rendition map"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "tokens",
+            nargs="*",
+            help="Friendly tokens to repair, defaults to media with an HLS file",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            dest="reparse",
+            help="Parse again media that already have a rendition map",
+        )
+
+    def handle(self, *args, **options):
+        media = Media.objects.exclude(hls_file="")
+        if options["tokens"]:
+            media = media.filter(friendly_token__in=options["tokens"])
+        elif not options["reparse"]:
+            media = media.filter(hls_renditions={})
+
+        repaired = 0
+        missing = 0
+        for media_id, hls_file in media.values_list("id", "hls_file").iterator():
+            renditions = parse_hls_renditions(hls_file)
+            if not renditions:
+                missing += 1
+            # update() skips the post_save pipeline, only this field changed
+            Media.objects.filter(id=media_id).update(hls_renditions=renditions)
+            invalidate_media_documents([media_id])
+            repaired += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Stored HLS renditions of {repaired} media"))
+        if missing:
+            self.stdout.write(f"{missing} media have an HLS file that is missing or empty")
@@ -1,22 +1,22 @@
 from drf_yasg import openapi as openapi
 from drf_yasg.utils import swagger_auto_schema
-from django.db.models import Q
-from django.db.utils import OperationalError, ProgrammingError
 from rest_framework import status
 from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
+from cms.custom_pagination import KeysetPagination, keyset_pagination_requested
 from users.models import User
 from users.serializers import UserSerializer
-from payments.models import Payment, UserSubscription
 
 from .methods import is_mediacms_manager
-from .models import Category, Comment, Media, WowzaApplication
+from .media_deletion import create_media_deletion_job, media_deletion_status
+from .models import Comment, Media, MediaDeletionJob
 from .permissions import IsMediacmsEditor
+from .search_cache import search_cache_stats
 from .serializers import CommentSerializer, MediaSerializer
-from .storage_usage import get_media_storage_usage
+from .statistics_snapshot import latest_statistics_snapshot, take_statistics_snapshot
 
 
 class StatisticsView(APIView):
@@ -32,101 +32,27 @@ class StatisticsView(APIView):
         operation_description='Summary statistics for MediaCMS management pages',
     )
     def get(self, request, format=None):
-        try:
-            total_sales = Payment.objects.filter(status=Payment.STATUS_PAID).count()
-        except (OperationalError, ProgrammingError):
-            total_sales = 0
-
-        try:
-            total_subscribers = UserSubscription.objects.filter(
-                flow_subscription_id__isnull=False,
-                flow_status__in=[
-                    UserSubscription.FLOW_STATUS_ACTIVE,
-                    UserSubscription.FLOW_STATUS_TRIAL,
-                ],
-                status__in=[
-                    UserSubscription.STATUS_ACTIVE,
-                    UserSubscription.STATUS_TRIAL,
-                ],
-            ).filter(Q(morose=0) | Q(morose__isnull=True)).exclude(flow_subscription_id="").count()
-        except (OperationalError, ProgrammingError):
-            total_subscribers = 0
-
-        top_categories = [
-            {
-                "title": category.title,
-                "url": category.get_absolute_url(),
-                "media_count": category.media_count,
-            }
-            for category in Category.objects.order_by("-media_count", "title")[:6]
-        ]
+        return Response(self._statistics(latest_statistics_snapshot()))
 
-        recent_activity = []
-
-        for media in Media.objects.select_related("user").order_by("-add_date")[:5]:
-            recent_activity.append(
-                {
-                    "kind": "media",
-                    "user_name": media.user.name or media.user.username,
-                    "user_email": media.user.email,
-                    "user_thumbnail": media.user.thumbnail_url(),
-                    "media_title": media.title,
-                    "status": "Approved" if media.is_reviewed and media.state == "public" else "Pending",
-                    "date": media.add_date,
-                }
-            )
-
-        for comment in Comment.objects.select_related("user", "media").order_by("-add_date")[:5]:
-            recent_activity.append(
-                {
-                    "kind": "comment",
-                    "user_name": comment.user.name or comment.user.username,
-                    "user_email": comment.user.email,
-                    "user_thumbnail": comment.user.thumbnail_url(),
-                    "media_title": comment.media.title,
-                    "status": "Approved" if comment.media.is_reviewed and comment.media.state == "public" else "Pending",
-                    "date": comment.add_date,
-                }
-            )
-
-        recent_activity = sorted(recent_activity, key=lambda item: item["date"], reverse=True)[:5]
-
-        top_rated_videos = []
-        for index, media in enumerate(
-            Media.objects.filter(media_type="video")
-            .prefetch_related("category")
-            .order_by("-likes", "-views", "title")[:5],
-            start=1,
-        ):
-            primary_category = media.category.order_by("title").first()
-            top_rated_videos.append(
-                {
-                    "rank": index,
-                    "title": media.title,
-                    "url": media.get_absolute_url(),
-                    "thumbnail_url": media.poster_url or media.thumbnail_url,
-                    "year": media.add_date.year if media.add_date else None,
-                    "category": primary_category.title if primary_category else "",
-                    "views": media.views,
-                    "likes": media.likes,
-                }
-            )
-
-        return Response(
-            {
-                "total_videos": Media.objects.filter(media_type="video").count(),
-                "total_members": User.objects.count(),
-                "total_categories": Category.objects.count(),
-                "total_sales": total_sales,
-                "total_subscribers": total_subscribers,
-                "total_comments": Comment.objects.count(),
-                "total_live_signals": WowzaApplication.objects.filter(is_active=True).count(),
-                "storage_usage": get_media_storage_usage(),
-                "top_categories": top_categories,
-                "recent_activity": recent_activity,
-                "top_rated_videos": top_rated_videos,
-            }
-        )
+    @swagger_auto_schema(
+        manual_parameters=[],
+        tags=['Manage'],
+        operation_summary='Refresh Manage Statistics',
+        operation_description='Take a new statistics snapshot now, for MediaCMS managers',
+    )
+    def post(self, request, format=None):
+        if not is_mediacms_manager(request.user):
+            return Response({"detail": "bad permissions"}, status=status.HTTP_403_FORBIDDEN)
+        return Response(self._statistics(take_statistics_snapshot(refresh_storage=True)))
+
+    def _statistics(self, snapshot):
+        # figures are read from the latest snapshot, taken by a periodic
+        # task, search cache stats are live counters
+        return {
+            **snapshot.data,
+            "search_cache": search_cache_stats(),
+            "generated_at": snapshot.add_date,
+        }
 
 
 class MediaList(APIView):
@@ -217,7 +143,10 @@ class MediaList(APIView):
 
         media = qs.order_by(f"{ordering}{sort_by}")
 
-        paginator = pagination_class()
+        if keyset_pagination_requested(request):
+            paginator = KeysetPagination(f"{ordering}{sort_by}")
+        else:
+            paginator = pagination_class()
 
         page = paginator.paginate_queryset(media, request)
 
@@ -232,10 +161,31 @@ class MediaList(APIView):
     )
     def delete(self, request, format=None):
         tokens = request.GET.get("tokens")
-        if tokens:
-            tokens = tokens.split(",")
-            Media.objects.filter(friendly_token__in=tokens).delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        if not tokens:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        job = create_media_deletion_job(request.user, tokens.split(","))
+        ret = media_deletion_status(job)
+        ret["url"] = f"/api/v1/manage_media/deletions/{job.uid}"
+        return Response(ret, status=status.HTTP_202_ACCEPTED)
+
+
+class MediaDeletionJobDetail(APIView):
+    """Progress of a bulk media deletion"""
+
+    permission_classes = (IsMediacmsEditor,)
+    parser_classes = (JSONParser,)
+
+    @swagger_auto_schema(
+        manual_parameters=[],
+        tags=['Manage'],
+        operation_summary='Media Deletion Progress',
+        operation_description='Progress of a media deletion started from the manage media page',
+    )
+    def get(self, request, uid, format=None):
+        job = MediaDeletionJob.objects.filter(uid=uid).first()
+        if not job:
+            return Response({"detail": "deletion not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(media_deletion_status(job))
 
 
 class CommentList(APIView):
@@ -0,0 +1,78 @@
+import copy
+
+from django.db import models
+from django_redis import get_redis_connection
+
+# Maintenance that depends on Media fields runs in one background job per
+# media. Media.save records which fields actually changed value, media_save
+# drops the media card and detail documents, adds the fields to a redis set of
+# the media and schedules process_media_changes once per burst, and the job
+# runs what depends on the fields it finds.
+MEDIA_CHANGES_KEY = "media_changes:{0}"
+MEDIA_CHANGES_PENDING_KEY = "media_changes_pending:{0}"
+
+# fields no dependent reads, or kept by the save itself
+UNTRACKED_FIELDS = {"search", "search_dirty", "search_dirty_at", "edit_date"}
+# related media lists: author, listability and categories
+RELATED_FIELDS = {"user", "listable", "category"}
+# sitemap entries: listable media and their url
+SITEMAP_FIELDS = {"listable", "friendly_token"}
+# whether a media shows on search results
+SEARCHABLE_FIELDS = {"state", "is_reviewed"}
+
+
+def _value(field, value):
+    if isinstance(field, models.FileField):
+        # files are renamed in place when saved
+        return getattr(value, "name", value)
+    if isinstance(value, (dict, list)):
+        return copy.deepcopy(value)
+    return value
+
+
+def _tracked_fields(model):
+    return [field for field in model._meta.concrete_fields if field.name not in UNTRACKED_FIELDS]
+
+
+def tracked_field_names(model):
+    return {field.name for field in _tracked_fields(model)}
+
+
+def tracked_values(media):
+    """Values of the fields whose changes are recorded, by attname"""
+
+    return {field.attname: _value(field, media.__dict__.get(field.attname)) for field in _tracked_fields(media)}
+
+
+def changed_fields(media, original, update_fields=None):
+    """Names of the fields that changed value since original, limited to
+    update_fields when given. original maps attnames to the values loaded
+    from the database or kept by tracked_values, fields missing from it
+    changed if they were set since"""
+
+    changed = set()
+    for field in _tracked_fields(media):
+        if field.attname not in original:
+            if field.attname in media.__dict__:
+                changed.add(field.name)
+        elif _value(field, media.__dict__.get(field.attname)) != original[field.attname]:
+            changed.add(field.name)
+    if update_fields is not None:
+        # update_fields may use attnames, user_id for user
+        names = {media._meta.get_field(name).name for name in update_fields}
+        changed &= names
+    return changed
+
+
+def record_media_changes(media_id, fields):
+    get_redis_connection("default").sadd(MEDIA_CHANGES_KEY.format(media_id), *fields)
+
+
+def take_media_changes(media_id):
+    """Changed fields recorded for a media since the last take"""
+
+    pipe = get_redis_connection("default").pipeline(transaction=True)
+    pipe.smembers(MEDIA_CHANGES_KEY.format(media_id))
+    pipe.delete(MEDIA_CHANGES_KEY.format(media_id))
+    members, _ = pipe.execute()
+    return {member.decode() for member in members}
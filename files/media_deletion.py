@@ -0,0 +1,119 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Media, MediaDeletionJob, deferred_file_removal, remove_media_path
+
+logger = logging.getLogger(__name__)
+
+# Bulk deletion of media runs as a MediaDeletionJob. The job deletes rows in
+# small batches, each in its own transaction, with the files of the deleted
+# media and encodings collected instead of removed, and hands the files of
+# every batch to remove_media_files tasks. Progress is kept on the job.
+# Batches only delete what is left, so a job whose worker stopped is resumed
+# once it has not been updated for MEDIA_DELETION_STALE_SECONDS.
+
+
+def _batch_size():
+    return max(1, int(getattr(settings, "MEDIA_DELETION_BATCH_SIZE", 50) or 50))
+
+
+def _files_per_task():
+    return max(1, int(getattr(settings, "MEDIA_DELETION_FILES_PER_TASK", 200) or 200))
+
+
+def create_media_deletion_job(user, friendly_tokens):
+    """Create the deletion job of the media of a list of friendly tokens and
+    schedule it"""
+
+    from . import tasks
+
+    friendly_tokens = sorted({token for token in friendly_tokens if token})
+    job = MediaDeletionJob.objects.create(
+        user=user,
+        friendly_tokens=friendly_tokens,
+        total=Media.objects.filter(friendly_token__in=friendly_tokens).count(),
+    )
+    transaction.on_commit(lambda: tasks.delete_media_job.delay(str(job.uid)))
+    return job
+
+
+def _stale_before():
+    return timezone.now() - timedelta(seconds=int(getattr(settings, "MEDIA_DELETION_STALE_SECONDS", 600)))
+
+
+def claim_media_deletion_job(job_uid):
+    """The job of a uid, marked running, if it is pending or stale, None
+    when it is done or another worker runs it"""
+
+    claimable = Q(status="pending") | Q(status="running", update_date__lt=_stale_before())
+    if not MediaDeletionJob.objects.filter(claimable, uid=job_uid).update(status="running", update_date=timezone.now()):
+        return None
+    return MediaDeletionJob.objects.get(uid=job_uid)
+
+
+def stale_media_deletion_jobs():
+    """uids of running jobs no worker updated lately"""
+
+    return [str(uid) for uid in MediaDeletionJob.objects.filter(status="running", update_date__lt=_stale_before()).values_list("uid", flat=True)]
+
+
+def _dispatch_files(job, paths):
+    from . import tasks
+
+    size = _files_per_task()
+    for start in range(0, len(paths), size):
+        tasks.remove_media_files.delay(job.id, paths[start : start + size])
+
+
+def run_media_deletion_job(job):
+    """Delete the media of a job batch by batch, returns the number deleted"""
+
+    job.status = "running"
+    job.save(update_fields=["status", "update_date"])
+
+    queryset = Media.objects.filter(friendly_token__in=job.friendly_tokens)
+    batch_size = _batch_size()
+    while True:
+        ids = list(queryset.order_by("id").values_list("id", flat=True)[:batch_size])
+        if not ids:
+            break
+        with deferred_file_removal() as paths:
+            with transaction.atomic():
+                _, deleted = Media.objects.filter(id__in=ids).delete()
+                job.deleted += deleted.get(Media._meta.label, 0)
+                job.files_total += len(paths)
+                job.save(update_fields=["deleted", "files_total", "update_date"])
+        # files go only once their rows are gone for good
+        _dispatch_files(job, paths)
+
+    job.status = "success"
+    job.save(update_fields=["status", "update_date"])
+    logger.info("Deleted %s media of deletion job %s", job.deleted, job.uid)
+    return job.deleted
+
+
+def remove_job_files(job_id, paths):
+    """Remove files collected by a deletion job and count them on the job"""
+
+    for kind, path in paths:
+        remove_media_path(path, kind=kind)
+    MediaDeletionJob.objects.filter(id=job_id).update(files_removed=F("files_removed") + len(paths))
+    return len(paths)
+
+
+def media_deletion_status(job):
+    return {
+        "uid": str(job.uid),
+        "status": job.status,
+        "total": job.total,
+        "deleted": job.deleted,
+        "files_total": job.files_total,
+        "files_removed": job.files_removed,
+        "add_date": job.add_date,
+        "update_date": job.update_date,
+    }
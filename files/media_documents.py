@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .content_versions import bump_versions, media_scope
+
+# bump when the document layout changes, old documents are then ignored
+MEDIA_DOCUMENT_KEY = "media_document:v1:{0}"
+
+
+def _document_key(media_id):
+    return MEDIA_DOCUMENT_KEY.format(media_id)
+
+
+def get_media_document(media, build):
+    """Shared part of the media detail response.
+
+    It holds what is the same for every viewer (encodings, HLS, subtitles,
+    categories and tags), build() computes it on a miss. Signals on the
+    media and its related objects drop it.
+    """
+
+    key = _document_key(media.id)
+    document = cache.get(key)
+    if document is None:
+        document = build()
+        cache.set(key, document, getattr(settings, "MEDIA_DOCUMENT_TIMEOUT", 60 * 60 * 24))
+    return document
+
+
+def invalidate_media_documents(media_ids):
+    media_ids = list(media_ids)
+    if media_ids:
+        cache.delete_many([_document_key(media_id) for media_id in media_ids])
+        # the detail response changes with its document
+        bump_versions([media_scope(media_id) for media_id in media_ids])
@@ -1,7 +1,6 @@
 # Kudos to Werner Robitza, AVEQ GmbH, for helping with ffmpeg
 # related content
 
-import itertools
 import logging
 import os
 import random
@@ -19,6 +18,8 @@ from cms import celery_app
 
 from . import models
 from .helpers import get_file_type, mask_ip
+from .recommendations import content_related_ids, related_media_ids
+from .trending import GLOBAL_SCOPE, category_scope, channel_scope, trending_media_ids
 
 logger = logging.getLogger(__name__)
 
@@ -479,16 +480,23 @@ def create_video_trim_request(media, data):
     )
 
 
-def show_recommended_media(request, limit=100):
+def show_recommended_media(request, limit=100, category=None, channel=None):
     """Return a list of recommended media
-    used on the index page
+    used on the index page, or of a category or channel
     """
 
     basic_query = Q(listable=True)
-    pmi = cache.get("popular_media_ids")
-    # produced by task get_list_of_popular_media and cached
-    if pmi:
-        media = list(models.Media.objects.filter(friendly_token__in=pmi).filter(basic_query).prefetch_related("user")[:limit])
+    scope = GLOBAL_SCOPE
+    if category:
+        basic_query &= Q(category=category)
+        scope = category_scope(category.id)
+    elif channel:
+        basic_query &= Q(channel=channel)
+        scope = channel_scope(channel.id)
+    # kept by update_trending_scores from the action rollups
+    trending = trending_media_ids(scope, limit)
+    if trending:
+        media = list(models.Media.objects.filter(id__in=trending).filter(basic_query).prefetch_related("user")[:limit])
     else:
         media = list(models.Media.objects.filter(basic_query).order_by("-views", "-likes").prefetch_related("user")[:limit])
     random.shuffle(media)
@@ -507,50 +515,13 @@ def show_related_media(media, request=None, limit=100):
 
 
 def show_related_media_content(media, request, limit):
-    """Return a list of related media based on simple calculations"""
-
-    # Create list with author items
-    # then items on same category, then some random(latest)
-    # Aim is to always show enough (limit) videos
-    # and include author videos in any case
-
-    q_author = Q(listable=True, user=media.user)
-    m = list(models.Media.objects.filter(q_author).order_by().prefetch_related("user")[:limit])
-
-    # order by random criteria so that it doesn't bring the same results
-    # attention: only fields that are indexed make sense here! also need
-    # find a way for indexes with more than 1 field
-    order_criteria = [
-        "-views",
-        "views",
-        "add_date",
-        "-add_date",
-        "featured",
-        "-featured",
-        "user_featured",
-        "-user_featured",
-    ]
-    # TODO: MAke this mess more readable, and add TAGS support - aka related
-    # tags rather than random media
-    if len(m) < limit:
-        category = media.category.first()
-        if category:
-            q_category = Q(listable=True, category=category)
-            q_res = models.Media.objects.filter(q_category).order_by(order_criteria[random.randint(0, len(order_criteria) - 1)]).prefetch_related("user")[: limit - media.user.media_count]
-            m = list(itertools.chain(m, q_res))
-
-        if len(m) < limit:
-            q_generic = Q(listable=True)
-            q_res = models.Media.objects.filter(q_generic).order_by(order_criteria[random.randint(0, len(order_criteria) - 1)]).prefetch_related("user")[: limit - media.user.media_count]
-            m = list(itertools.chain(m, q_res))
-
-    m = list(set(m[:limit]))  # remove duplicates
-
-    try:
-        m.remove(media)  # remove media from results
-    except ValueError:
-        pass
+    """Return a list of related media: author items, then items of the
+    same categories, then popular items
+    Lists are precomputed by refresh_content_related
+    """
 
+    ids = content_related_ids(media)[:limit]
+    m = list(models.Media.objects.filter(id__in=ids, listable=True).prefetch_related("user")) if ids else []
     random.shuffle(m)
     return m
 
@@ -577,11 +548,19 @@ def show_related_media_author(media, request, limit):
 
 
 def show_related_media_calculated(media, request, limit):
-    """Return a list of related media based on ML recommendations
-    A big todo!
+    """Return a list of related media based on co-watching
+    Computed by update_related_media, media without enough watches are
+    completed with the content strategy
     """
 
-    return []
+    ids = related_media_ids(media.id)[:limit]
+    found = models.Media.objects.filter(listable=True).prefetch_related("user").in_bulk(ids) if ids else {}
+    m = [found[media_id] for media_id in ids if media_id in found]
+
+    if len(m) < limit:
+        seen = {media.id, *found}
+        m.extend(item for item in show_related_media_content(media, request, limit + len(seen)) if item.id not in seen)
+    return m[:limit]
 
 
 def update_user_ratings(user, media, user_ratings):
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0015_wowzaapplication_stream_metadata"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="media",
+            name="search_dirty",
+            field=models.BooleanField(default=False, help_text="search vector needs to be recomputed by the indexing worker"),
+        ),
+        migrations.AddIndex(
+            model_name="media",
+            index=models.Index(condition=models.Q(("search_dirty", True)), fields=["id"], name="files_media_search_dirty_idx"),
+        ),
+    ]
@@ -0,0 +1,25 @@
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0016_media_search_dirty"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="media",
+            index=django.contrib.postgres.indexes.GinIndex(
+                condition=models.Q(("is_reviewed", True), ("state", "public")),
+                fields=["search"],
+                name="files_media_search_public_gin",
+            ),
+        ),
+        # search vectors are now weighted, let the indexing worker rebuild them
+        migrations.RunSQL(
+            "UPDATE files_media SET search_dirty = true",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
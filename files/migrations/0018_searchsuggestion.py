@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0017_media_weighted_search"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SearchSuggestion",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("term", models.CharField(help_text="lowercased text matched by prefix", max_length=100)),
+                ("title", models.CharField(help_text="text shown to the user", max_length=100)),
+                (
+                    "kind",
+                    models.CharField(choices=[("media", "Media"), ("tag", "Tag"), ("category", "Category")], max_length=10),
+                ),
+                ("weight", models.IntegerField(default=0)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["term"], name="files_searchsugg_term_like", opclasses=["varchar_pattern_ops"]),
+                ],
+            },
+        ),
+    ]
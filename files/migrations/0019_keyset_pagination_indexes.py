@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0018_searchsuggestion"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="media",
+            index=models.Index(fields=["add_date", "id"], name="files_media_add_date_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="media",
+            index=models.Index(condition=models.Q(("listable", True)), fields=["add_date", "id"], name="files_media_listable_keyset"),
+        ),
+        migrations.AddIndex(
+            model_name="media",
+            index=models.Index(fields=["views", "id"], name="files_media_views_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(fields=["add_date", "id"], name="files_comment_add_date_id_idx"),
+        ),
+    ]
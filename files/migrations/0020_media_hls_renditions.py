@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0019_keyset_pagination_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="media",
+            name="hls_renditions",
+            field=models.JSONField(blank=True, default=dict, help_text="HLS rendition map parsed from hls_file when it is packaged"),
+        ),
+    ]
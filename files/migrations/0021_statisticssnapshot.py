@@ -0,0 +1,20 @@
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0020_media_hls_renditions"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StatisticsSnapshot",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("add_date", models.DateTimeField(auto_now_add=True, db_index=True)),
+                ("data", models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+            ],
+        ),
+    ]
@@ -0,0 +1,43 @@
+import uuid
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0021_statisticssnapshot"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MediaDeletionJob",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("uid", models.UUIDField(default=uuid.uuid4, unique=True)),
+                ("friendly_tokens", models.JSONField(default=list)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("pending", "Pending"), ("running", "Running"), ("success", "Success"), ("fail", "Fail")],
+                        default="pending",
+                        max_length=20,
+                    ),
+                ),
+                ("total", models.IntegerField(default=0, help_text="media to delete")),
+                ("deleted", models.IntegerField(default=0, help_text="media deleted so far")),
+                ("files_total", models.IntegerField(default=0, help_text="files and folders of deleted media")),
+                ("files_removed", models.IntegerField(default=0, help_text="files and folders removed so far")),
+                ("logs", models.TextField(blank=True)),
+                ("add_date", models.DateTimeField(auto_now_add=True)),
+                ("update_date", models.DateTimeField(auto_now=True)),
+                (
+                    "user",
+                    models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+        ),
+    ]
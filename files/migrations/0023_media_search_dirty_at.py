@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0022_mediadeletionjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="media",
+            name="search_dirty_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="when search_dirty was last set, the indexing worker only clears the flag if it did not change since it read the media",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0023_media_search_dirty_at"),
+    ]
+
+    operations = [
+        # every search query goes to files_media_search_public_gin
+        migrations.RemoveIndex(
+            model_name="media",
+            name="files_media_search_7194c6_gin",
+        ),
+    ]
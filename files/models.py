@@ -6,14 +6,19 @@ import random
 import re
 import tempfile
 import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
 
 import m3u8
 from django.conf import settings
 from django.contrib.postgres.indexes import GinIndex
 from django.contrib.postgres.search import SearchVectorField
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.files import File
-from django.db import connection, models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import F
 from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from django.urls import reverse
@@ -24,12 +29,26 @@ from imagekit.processors import ResizeToFit
 from mptt.models import MPTTModel, TreeForeignKey
 
 from . import helpers
-from .stop_words import STOP_WORDS
+from .content_versions import bump_versions, comments_scope, playlist_scope, user_scope
+from .listing_cards import invalidate_media_cards
+from .media_changes import MEDIA_CHANGES_PENDING_KEY, changed_fields, record_media_changes, tracked_field_names, tracked_values
+from .media_documents import invalidate_media_documents
+from .search_cache import (
+    category_scope,
+    global_scope,
+    invalidate_media_searches,
+    invalidate_search_scopes,
+    tag_scope,
+)
+from .search_index import SEARCH_SOURCE_FIELDS, index_media_batch, mark_media_dirty
+from .sitemaps import sitemap_scopes
 
 logger = logging.getLogger(__name__)
 
 RE_TIMECODE = re.compile(r"(\d+:\d+:\d+.\d+)")
 
+SMIL_PENDING_CACHE_KEY = "smil_pending:{0}"
+
 # this is used by Media and Encoding models
 # reflects media encoding status for objects
 MEDIA_ENCODING_STATUS = (
@@ -122,6 +141,40 @@ def category_thumb_path(instance, filename):
     return settings.MEDIA_UPLOAD_DIR + "categories/{0}".format(file_name)
 
 
+def parse_hls_renditions(hls_file):
+    """Parse an HLS master playlist into the rendition map served as
+    hls_info, curated to be read by video.js. Run when the playlists are
+    packaged, requests only read the stored result.
+    """
+
+    res = {}
+    valid_resolutions = [240, 360, 480, 720, 1080, 1440, 2160]
+    if hls_file and os.path.exists(hls_file):
+        p = os.path.dirname(hls_file)
+        m3u8_obj = m3u8.load(hls_file)
+        res["master_file"] = helpers.url_from_path(hls_file)
+        for iframe_playlist in m3u8_obj.iframe_playlists:
+            uri = os.path.join(p, iframe_playlist.uri)
+            if os.path.exists(uri):
+                resolution = iframe_playlist.iframe_stream_info.resolution[1]
+                # most probably video is vertical, getting the first value to
+                # be the resolution
+                if resolution not in valid_resolutions:
+                    resolution = iframe_playlist.iframe_stream_info.resolution[0]
+
+                res["{}_iframe".format(resolution)] = helpers.url_from_path(uri)
+        for playlist in m3u8_obj.playlists:
+            uri = os.path.join(p, playlist.uri)
+            if os.path.exists(uri):
+                resolution = playlist.stream_info.resolution[1]
+                # same as above
+                if resolution not in valid_resolutions:
+                    resolution = playlist.stream_info.resolution[0]
+
+                res["{}_playlist".format(resolution)] = helpers.url_from_path(uri)
+    return res
+
+
 class Media(models.Model):
     """The most important model for MediaCMS"""
 
@@ -161,6 +214,8 @@ class Media(models.Model):
 
     hls_file = models.CharField(max_length=1000, blank=True, help_text="Ruta al archivo HLS para videos")
 
+    hls_renditions = models.JSONField(default=dict, blank=True, help_text="HLS rendition map parsed from hls_file when it is packaged")
+
     stream = models.CharField(max_length=255, help_text="stream path", blank=True, db_index=True)
 
     is_reviewed = models.BooleanField(
@@ -225,6 +280,17 @@ class Media(models.Model):
         help_text="used to store all searchable info and metadata for a Media",
     )
 
+    search_dirty = models.BooleanField(
+        default=False,
+        help_text="search vector needs to be recomputed by the indexing worker",
+    )
+
+    search_dirty_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="when search_dirty was last set, the indexing worker only clears the flag if it did not change since it read the media",
+    )
+
     size = models.CharField(
         max_length=20,
         blank=True,
@@ -308,13 +374,24 @@ class Media(models.Model):
     __original_media_file = None
     __original_thumbnail_time = None
     __original_uploaded_poster = None
+    __original_searchable = False
+    __original_listable = False
 
     class Meta:
         ordering = ["-add_date"]
         indexes = [
-            # TODO: check with pgdash.io or other tool what index need be
-            # removed
-            GinIndex(fields=["search"])
+            # searches only look at public reviewed media, search RSS feeds
+            # at listable ones, which are public and reviewed too
+            GinIndex(
+                fields=["search"],
+                condition=models.Q(state="public", is_reviewed=True),
+                name="files_media_search_public_gin",
+            ),
+            models.Index(fields=["id"], condition=models.Q(search_dirty=True), name="files_media_search_dirty_idx"),
+            # keyset pagination reads (sort field, id) ranges
+            models.Index(fields=["add_date", "id"], name="files_media_add_date_id_idx"),
+            models.Index(fields=["add_date", "id"], condition=models.Q(listable=True), name="files_media_listable_keyset"),
+            models.Index(fields=["views", "id"], name="files_media_views_id_idx"),
         ]
 
     def __str__(self):
@@ -330,6 +407,16 @@ class Media(models.Model):
         self.__original_media_file = self.media_file
         self.__original_thumbnail_time = self.thumbnail_time
         self.__original_uploaded_poster = self.uploaded_poster
+        self.__original_searchable = self.is_searchable
+        self.__original_listable = self.listable
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        media = super().from_db(db, field_names, values)
+        # the loaded values are what saves compare with to find the changed
+        # fields. Kept as loaded, JSON fields are reassigned, never mutated
+        media._original_values = dict(zip(field_names, values))
+        return media
 
     def save(self, *args, **kwargs):
         if not self.title:
@@ -383,8 +470,35 @@ class Media(models.Model):
         else:
             self.listable = False
 
+        # media_count of the user and categories counts listable media, of
+        # tags public and reviewed media. media_save applies the changes
+        was_listable = self.__original_listable if self.pk else False
+        was_searchable = self.__original_searchable if self.pk else False
+        self._media_count_deltas = (self.listable - was_listable, self.is_searchable - was_searchable)
+        if kwargs.get("update_fields") is not None and self.listable != was_listable:
+            kwargs["update_fields"] = set(kwargs["update_fields"]) | {"listable"}
+
+        # searchable content changed, let the indexing worker pick it up
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None:
+            self.search_dirty = True
+            self.search_dirty_at = timezone.now()
+        elif SEARCH_SOURCE_FIELDS.intersection(update_fields):
+            self.search_dirty = True
+            self.search_dirty_at = timezone.now()
+            kwargs["update_fields"] = set(update_fields) | {"search_dirty", "search_dirty_at", "edit_date"}
+
+        # fields media_save schedules maintenance for, None for new media.
+        # Set before saving, post_save runs inside super().save()
+        original = self.__dict__.get("_original_values")
+        self._changed_fields = changed_fields(self, original, kwargs.get("update_fields")) if self.pk and original is not None else None
+
         super(Media, self).save(*args, **kwargs)
 
+        self.__original_searchable = self.is_searchable
+        self.__original_listable = self.listable
+        self._original_values = tracked_values(self)
+
         # produce a thumbnail out of an uploaded poster
         # will run only when a poster is uploaded for the first time
         if self.uploaded_poster and self.uploaded_poster != self.__original_uploaded_poster:
@@ -396,49 +510,19 @@ class Media(models.Model):
                 thumbnail_name = helpers.get_file_name(self.uploaded_poster.path)
                 self.uploaded_thumbnail.save(content=myfile, name=thumbnail_name)
 
+    @property
+    def is_searchable(self):
+        """Whether the media shows up on MediaSearch results"""
+        return self.state == "public" and self.is_reviewed is True
+
     def update_search_vector(self):
         """
-        Update SearchVector field of SearchModel using raw SQL
-        search field is used to store SearchVector
+        Update SearchVector field of this media right away. Regular saves
+        only mark the media dirty and the indexing worker updates it in batches
         """
-        db_table = self._meta.db_table
-
-        # first get anything interesting out of the media
-        # that needs to be search able
-
-        a_tags = b_tags = ""
-        if self.id:
-            a_tags = " ".join([tag.title for tag in self.tags.all()])
-            b_tags = " ".join([tag.title.replace("-", " ") for tag in self.tags.all()])
-
-        items = [
-            self.title,
-            self.user.username,
-            self.user.email,
-            self.user.name,
-            self.description,
-            a_tags,
-            b_tags,
-        ]
-        items = [item for item in items if item]
-        text = " ".join(items)
-        text = " ".join([token for token in text.lower().split(" ") if token not in STOP_WORDS])
-
-        text = helpers.clean_query(text)
-
-        sql_code = """
-            UPDATE {db_table} SET search = to_tsvector(
-                '{config}', '{text}'
-            ) WHERE {db_table}.id = {id}
-            """.format(
-            db_table=db_table, config="simple", text=text, id=self.id
-        )
-
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute(sql_code)
-        except BaseException:
-            pass  # TODO:add log
+        if not self.id:
+            return False
+        index_media_batch([self.id])
         return True
 
     def media_init(self):
@@ -927,35 +1011,9 @@ class Media(models.Model):
         Returns hls info, curated to be read by video.js
         """
 
-        res = {}
-        valid_resolutions = [240, 360, 480, 720, 1080, 1440, 2160]
-        if self.hls_file:
-            if os.path.exists(self.hls_file):
-                hls_file = self.hls_file
-                p = os.path.dirname(hls_file)
-                m3u8_obj = m3u8.load(hls_file)
-                if os.path.exists(hls_file):
-                    res["master_file"] = helpers.url_from_path(hls_file)
-                    for iframe_playlist in m3u8_obj.iframe_playlists:
-                        uri = os.path.join(p, iframe_playlist.uri)
-                        if os.path.exists(uri):
-                            resolution = iframe_playlist.iframe_stream_info.resolution[1]
-                            # most probably video is vertical, getting the first value to
-                            # be the resolution
-                            if resolution not in valid_resolutions:
-                                resolution = iframe_playlist.iframe_stream_info.resolution[0]
-
-                            res["{}_iframe".format(resolution)] = helpers.url_from_path(uri)
-                    for playlist in m3u8_obj.playlists:
-                        uri = os.path.join(p, playlist.uri)
-                        if os.path.exists(uri):
-                            resolution = playlist.stream_info.resolution[1]
-                            # same as above
-                            if resolution not in valid_resolutions:
-                                resolution = playlist.stream_info.resolution[0]
-
-                            res["{}_playlist".format(resolution)] = helpers.url_from_path(uri)
-        return res
+        if not self.hls_file:
+            return {}
+        return self.hls_renditions or {}
 
     @property
     def author_name(self):
@@ -1582,6 +1640,11 @@ class Comment(MPTTModel):
     class MPTTMeta:
         order_insertion_by = ["add_date"]
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["add_date", "id"], name="files_comment_add_date_id_idx"),
+        ]
+
     def __str__(self):
         return "On {0} by {1}".format(self.media.title, self.user.username)
 
@@ -1602,59 +1665,253 @@ class Comment(MPTTModel):
     def media_url(self):
         return self.get_absolute_url()
 
-def generate_smil(media_instance):
-    """
-    Genera un archivo SMIL con los paths de los videos MP4 listos para el media_instance.
-    """
-    logger = logging.getLogger(__name__)
-    logger.info(f"Generando SMIL para: {media_instance.friendly_token}")
 
-    # Filtrar encodings que tienen un archivo asociado en media_file
-    mp4_encodings = Encoding.objects.filter(
-        media=media_instance,
-        profile__extension="mp4",
-        status="success",
-        chunk=False
-    ).exclude(media_file="")  # Excluir encodings sin archivo asociado
+class SearchSuggestion(models.Model):
+    """Typeahead suggestions, rebuilt periodically from media titles, tags and categories"""
 
-    logger.info(f"Encodings encontrados para {media_instance.friendly_token}: {mp4_encodings.count()}")
+    KIND_CHOICES = (
+        ("media", "Media"),
+        ("tag", "Tag"),
+        ("category", "Category"),
+    )
 
-    if not mp4_encodings.exists():
-        logger.warning(f"No se encontraron encodings válidos para {media_instance.friendly_token}")
-        return None
+    term = models.CharField(max_length=100, help_text="lowercased text matched by prefix")
 
-    smil_dir = settings.MEDIA_ROOT  # Cambiar el directorio de salida si es necesario
-    os.makedirs(smil_dir, exist_ok=True)
+    title = models.CharField(max_length=100, help_text="text shown to the user")
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
 
-    # Definir el path del archivo SMIL
-    smil_path = os.path.join(smil_dir, f"{media_instance.friendly_token}.smil")
+    weight = models.IntegerField(default=0)
 
-    # Construir el contenido del archivo SMIL
-    smil_content = '<?xml version="1.0" encoding="UTF-8"?>\n<smil>\n  <body>\n    <switch>\n'
+    class Meta:
+        indexes = [
+            # LIKE 'prefix%' lookups without pg_trgm
+            models.Index(fields=["term"], name="files_searchsugg_term_like", opclasses=["varchar_pattern_ops"]),
+        ]
+
+    def __str__(self):
+        return self.title
+
+
+class MediaDeletionJob(models.Model):
+    """Deletion of many media at once, run in background by delete_media_job"""
+
+    STATUS_CHOICES = (
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("success", "Success"),
+        ("fail", "Fail"),
+    )
+
+    uid = models.UUIDField(unique=True, default=uuid.uuid4)
+
+    user = models.ForeignKey("users.User", on_delete=models.SET_NULL, blank=True, null=True)
+
+    friendly_tokens = models.JSONField(default=list)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+
+    total = models.IntegerField(default=0, help_text="media to delete")
+
+    deleted = models.IntegerField(default=0, help_text="media deleted so far")
+
+    files_total = models.IntegerField(default=0, help_text="files and folders of deleted media")
+
+    files_removed = models.IntegerField(default=0, help_text="files and folders removed so far")
+
+    logs = models.TextField(blank=True)
+
+    add_date = models.DateTimeField(auto_now_add=True)
+
+    update_date = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"deletion of {self.total} media ({self.status})"
+
+
+class StatisticsSnapshot(models.Model):
+    """Aggregates of the management dashboard, taken periodically by
+    take_statistics_snapshot so the dashboard does not count on every load"""
+
+    add_date = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+
+    def __str__(self):
+        return f"statistics {self.add_date}"
+
+
+def smil_file_path(friendly_token):
+    return os.path.join(settings.MEDIA_ROOT, f"{friendly_token}.smil")
+
+
+def build_smil_content(media_instance):
+    """
+    Construye el contenido SMIL con los MP4 listos del media_instance,
+    o None si todavía no hay encodings válidos.
+    """
+
+    # Filtrar encodings que tienen un archivo asociado en media_file
+    mp4_encodings = (
+        Encoding.objects.filter(
+            media=media_instance,
+            profile__extension="mp4",
+            status="success",
+            chunk=False,
+        )
+        .exclude(media_file="")  # Excluir encodings sin archivo asociado
+        .select_related("profile")
+        .order_by("profile__resolution", "id")
+    )
+
+    videos = []
     for encoding in mp4_encodings:
         try:
             path = encoding.media_file.path
             relative_path = path.split('/media_files/encoded/', 1)[-1]  # Extraer la parte después de '/media_files/encoded/'
             resolution = int(encoding.profile.resolution) * 1000  # Convertir resolución a formato esperado
-            smil_content += f'      <video src="/encoded/{relative_path}" system-bitrate="{resolution}"/>\n'
+            videos.append(f'      <video src="/encoded/{relative_path}" system-bitrate="{resolution}"/>\n')
         except (ValueError, AttributeError) as e:
             logger.error(f"Error al procesar encoding {encoding.id}: {e}")
             continue
-    smil_content += '    </switch>\n  </body>\n</smil>\n'
 
-    # Guardar el archivo SMIL
-    with open(smil_path, "w") as smil_file:
-        smil_file.write(smil_content)
+    logger.info(f"Encodings encontrados para {media_instance.friendly_token}: {len(videos)}")
+    if not videos:
+        return None
+
+    return '<?xml version="1.0" encoding="UTF-8"?>\n<smil>\n  <body>\n    <switch>\n' + "".join(videos) + '    </switch>\n  </body>\n</smil>\n'
+
+
+def write_smil_file(smil_path, smil_content):
+    """
+    Escribe el SMIL de forma atómica (archivo temporal + os.replace) para que
+    Wowza nunca lea un archivo a medio escribir. Devuelve False si el contenido
+    no cambió y no fue necesario escribir.
+    """
+
+    try:
+        with open(smil_path, "r") as smil_file:
+            if smil_file.read() == smil_content:
+                return False
+    except (FileNotFoundError, OSError):
+        pass
+
+    smil_dir = os.path.dirname(smil_path)
+    os.makedirs(smil_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=".smil.tmp", dir=smil_dir)
+    try:
+        with os.fdopen(fd, "w") as tmp_file:
+            tmp_file.write(smil_content)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, smil_path)
+    except BaseException:
+        helpers.rm_file(tmp_path)
+        raise
+    return True
+
+
+def generate_smil(media_instance):
+    """
+    Genera un archivo SMIL con los paths de los videos MP4 listos para el media_instance.
+    """
+    logger.info(f"Generando SMIL para: {media_instance.friendly_token}")
+
+    smil_content = build_smil_content(media_instance)
+    if smil_content is None:
+        logger.warning(f"No se encontraron encodings válidos para {media_instance.friendly_token}")
+        return None
 
-    logger.info(f"Archivo SMIL generado en: {smil_path}")
+    smil_path = smil_file_path(media_instance.friendly_token)
+    if write_smil_file(smil_path, smil_content):
+        logger.info(f"Archivo SMIL generado en: {smil_path}")
+    else:
+        logger.info(f"Archivo SMIL sin cambios: {smil_path}")
 
     # Actualizar el estado del Media a "success"
-    media_instance.encoding_status = "success"
-    media_instance.save(update_fields=["encoding_status"])
+    if media_instance.encoding_status != "success":
+        media_instance.encoding_status = "success"
+        media_instance.save(update_fields=["encoding_status"])
 
     return smil_path
 
 
+def schedule_smil_generation(media_instance):
+    """
+    Agenda la generación del SMIL en background. Las ráfagas de encodings
+    terminados para un mismo media se agrupan en una sola ejecución.
+    """
+
+    from . import tasks
+
+    debounce = getattr(settings, "SMIL_DEBOUNCE_SECONDS", 10)
+    key = SMIL_PENDING_CACHE_KEY.format(media_instance.friendly_token)
+    if not cache.add(key, 1, timeout=debounce + 60):
+        return False
+    tasks.generate_smil_task.apply_async(args=[media_instance.friendly_token], countdown=debounce)
+    return True
+
+
+# files of deleted media and encodings, collected instead of removed while a
+# deletion job deletes rows, see deferred_file_removal
+_deferred_media_paths = ContextVar("deferred_media_paths", default=None)
+
+
+@contextmanager
+def deferred_file_removal():
+    """Collect the (kind, path) of the files that deletes would remove,
+    to remove them later with remove_media_path"""
+
+    paths = []
+    token = _deferred_media_paths.set(paths)
+    try:
+        yield paths
+    finally:
+        _deferred_media_paths.reset(token)
+
+
+def remove_media_path(path, kind="file"):
+    """Remove a file, a folder or the files matching a glob pattern, or
+    defer it inside deferred_file_removal"""
+
+    paths = _deferred_media_paths.get()
+    if paths is not None:
+        paths.append((kind, path))
+        return False
+    if kind == "dir":
+        return helpers.rm_dir(path)
+    if kind == "glob":
+        return all([helpers.rm_file(match) for match in glob.glob(path)])
+    return helpers.rm_file(path)
+
+
+def schedule_media_changes(media_id, fields):
+    """Record changed fields of a media and schedule process_media_changes
+    once the transaction commits, the changes of a burst of saves are
+    processed by one run"""
+
+    from . import tasks
+
+    def schedule():
+        record_media_changes(media_id, fields)
+        delay = getattr(settings, "MEDIA_CHANGES_DELAY", 2)
+        if cache.add(MEDIA_CHANGES_PENDING_KEY.format(media_id), 1, timeout=delay + 60):
+            tasks.process_media_changes.apply_async(args=[media_id], countdown=delay)
+
+    # the job reads the media, it must not run before the save commits
+    transaction.on_commit(schedule)
+
+
+def media_document_ids(media):
+    """Media whose detail document shows this media"""
+
+    # images are part of the slideshow of the other images of their user
+    if media.media_type == "image":
+        return Media.objects.filter(user_id=media.user_id, media_type="image").values_list("id", flat=True)
+    return [media.id]
+
+
 @receiver(post_save, sender=Media)
 def media_save(sender, instance, created, **kwargs):
     # media_file path is not set correctly until mode is saved
@@ -1668,30 +1925,31 @@ def media_save(sender, instance, created, **kwargs):
         instance.media_init()
         notify_users(friendly_token=instance.friendly_token, action="media_added")
 
-    instance.user.update_user_media()
-    if instance.category.all():
-        # this won't catch when a category
-        # is removed from a media, which is what we want...
-        for category in instance.category.all():
-            category.update_category_media()
-
-    if instance.tags.all():
-        for tag in instance.tags.all():
-            tag.update_tag_media()
+    update_media_counts(instance, *getattr(instance, "_media_count_deltas", (0, 0)))
+    instance._media_count_deltas = (0, 0)
 
-    instance.update_search_vector()
+    # saves that change nothing (encoding status callbacks) keep the caches.
+    # The media card and detail documents are dropped right away, sitemap,
+    # searches and related lists are kept by process_media_changes
+    changed = getattr(instance, "_changed_fields", None)
+    if changed is None:
+        changed = tracked_field_names(instance)
+    instance._changed_fields = set()
+    if changed:
+        invalidate_media_cards([instance.id])
+        invalidate_media_documents(media_document_ids(instance))
+        schedule_media_changes(instance.id, changed)
 
 
 @receiver(pre_delete, sender=Media)
 def media_file_pre_delete(sender, instance, **kwargs):
-    if instance.category.all():
-        for category in instance.category.all():
-            instance.category.remove(category)
-            category.update_category_media()
-    if instance.tags.all():
-        for tag in instance.tags.all():
-            instance.tags.remove(tag)
-            tag.update_tag_media()
+    invalidate_media_cards([instance.id])
+    invalidate_media_documents(media_document_ids(instance))
+    bump_versions(sitemap_scopes("media", [instance.id]))
+    if instance.is_searchable:
+        invalidate_media_searches(instance)
+    # category and tag links go with the media, without m2m signals
+    update_media_counts(instance, -instance.listable, -instance.is_searchable)
 
 
 @receiver(post_delete, sender=Media)
@@ -1702,51 +1960,92 @@ def media_file_delete(sender, instance, **kwargs):
     """
 
     if instance.media_file:
-        helpers.rm_file(instance.media_file.path)
+        remove_media_path(instance.media_file.path)
     if instance.thumbnail:
-        helpers.rm_file(instance.thumbnail.path)
+        remove_media_path(instance.thumbnail.path)
     if instance.poster:
-        helpers.rm_file(instance.poster.path)
+        remove_media_path(instance.poster.path)
     if instance.uploaded_thumbnail:
-        helpers.rm_file(instance.uploaded_thumbnail.path)
+        remove_media_path(instance.uploaded_thumbnail.path)
     if instance.uploaded_poster:
-        helpers.rm_file(instance.uploaded_poster.path)
+        remove_media_path(instance.uploaded_poster.path)
     if instance.sprites:
-        helpers.rm_file(instance.sprites.path)
+        remove_media_path(instance.sprites.path)
     if instance.hls_file:
         p = os.path.dirname(instance.hls_file)
-        helpers.rm_dir(p)
-    instance.user.update_user_media()
+        remove_media_path(p, kind="dir")
 
     # remove extra zombie thumbnails
     if instance.thumbnail:
         thumbnails_path = os.path.dirname(instance.thumbnail.path)
-        thumbnails = glob.glob(f'{thumbnails_path}/{instance.uid.hex}.*')
-        for thumbnail in thumbnails:
-            helpers.rm_file(thumbnail)
+        remove_media_path(f'{thumbnails_path}/{instance.uid.hex}.*', kind="glob")
+
+
+def update_media_counts(media, listable_delta, searchable_delta):
+    """Apply the media_count changes of a media becoming or ceasing to be
+    listable (user, categories) and public and reviewed (tags) as F() updates.
+    reconcile_media_counts corrects any drift periodically"""
+
+    from users.models import User
+
+    if listable_delta:
+        User.objects.filter(id=media.user_id).update(media_count=F("media_count") + listable_delta)
+        Category.objects.filter(media=media).update(media_count=F("media_count") + listable_delta)
+    if searchable_delta:
+        Tag.objects.filter(media=media).update(media_count=F("media_count") + searchable_delta)
+
+
+# m2m relations with a media_count, and the media they count
+MEDIA_COUNT_RELATIONS = {
+    Media.category.through: (Category, "category", {"listable": True}),
+    Media.tags.through: (Tag, "tags", {"state": "public", "is_reviewed": True}),
+}
 
 
 @receiver(m2m_changed, sender=Media.category.through)
-def media_m2m(sender, instance, **kwargs):
-    if instance.category.all():
-        for category in instance.category.all():
-            category.update_category_media()
-    if instance.tags.all():
-        for tag in instance.tags.all():
-            tag.update_tag_media()
+@receiver(m2m_changed, sender=Media.tags.through)
+def media_count_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    related, field, counted = MEDIA_COUNT_RELATIONS[sender]
+    if reverse:
+        # instance is a category or tag, pk_set holds media ids
+        if action == "pre_clear":
+            related.objects.filter(pk=instance.pk).update(media_count=0)
+        elif action in ("post_add", "pre_remove") and pk_set:
+            media = Media.objects.filter(pk__in=pk_set, **counted)
+            if action == "pre_remove":
+                media = media.filter(**{field: instance})
+            delta = media.count() if action == "post_add" else -media.count()
+            if delta:
+                related.objects.filter(pk=instance.pk).update(media_count=F("media_count") + delta)
+        return
+
+    if not all(getattr(instance, name) == value for name, value in counted.items()):
+        return
+    if action == "pre_clear":
+        related.objects.filter(media=instance).update(media_count=F("media_count") - 1)
+    elif action == "post_add" and pk_set:
+        # only holds the new links
+        related.objects.filter(pk__in=pk_set).update(media_count=F("media_count") + 1)
+    elif action == "pre_remove" and pk_set:
+        # may hold objects that are not linked
+        related.objects.filter(pk__in=pk_set, media=instance).update(media_count=F("media_count") - 1)
 
 
 @receiver(post_save, sender=Encoding)
 def encoding_file_save(sender, instance, created, **kwargs):
     """Performs actions on encoding file save."""
 
+    # the gif encoding is the preview_url of listing cards
+    invalidate_media_cards([instance.media_id])
+    invalidate_media_documents([instance.media_id])
+
     if instance.chunk and instance.status == "success":
 
         instance.media.encoding_status = "waiting_smil"
         instance.media.save(update_fields=["encoding_status"])
 
         # Intentar generar el SMIL
-        generate_smil(instance.media)
+        schedule_smil_generation(instance.media)
 
         # a chunk got completed
         # check if all chunks are OK
@@ -1890,7 +2189,7 @@ def encoding_file_save(sender, instance, created, **kwargs):
 
         if instance.status == "success" and not instance.chunk and instance.profile.extension == "mp4":
             # Cuando se guarda un mp4 exitoso, intenta generar el SMIL
-            generate_smil(instance.media)
+            schedule_smil_generation(instance.media)
 
 
 @receiver(post_delete, sender=Encoding)
@@ -1900,9 +2199,124 @@ def encoding_file_delete(sender, instance, **kwargs):
     when corresponding `Encoding` object is deleted.
     """
 
+    invalidate_media_cards([instance.media_id])
+    invalidate_media_documents([instance.media_id])
+
     if instance.media_file:
-        helpers.rm_file(instance.media_file.path)
-        if not instance.chunk:
+        remove_media_path(instance.media_file.path)
+        # the media goes too when deleted by a deletion job
+        if not instance.chunk and _deferred_media_paths.get() is None:
             instance.media.post_encode_actions(encoding=instance, action="delete")
     # delete local chunks, and remote chunks + media file. Only when the
     # last encoding of a media is complete
+
+
+@receiver(m2m_changed, sender=Media.tags.through)
+def media_tags_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    # tags are part of the search document
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if reverse:
+        # a tag was (un)linked from media, pk_set holds the media ids
+        mark_media_dirty(pk_set or [])
+    else:
+        mark_media_dirty([instance.pk])
+
+
+@receiver(m2m_changed, sender=Media.category.through)
+@receiver(m2m_changed, sender=Media.tags.through)
+def media_search_cache_m2m(sender, instance, action, reverse, model, pk_set, **kwargs):
+    # searches by category or tag are cached per category or tag title
+    related = type(instance) if reverse else model
+    scope = category_scope if related is Category else tag_scope
+    if reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            invalidate_search_scopes([global_scope(), scope(instance.title)])
+        return
+
+    if not instance.is_searchable:
+        return
+    if action == "pre_clear":
+        invalidate_media_searches(instance)
+    elif action in ("post_add", "post_remove") and pk_set:
+        titles = model.objects.filter(pk__in=pk_set).values_list("title", flat=True)
+        invalidate_search_scopes([global_scope()] + [scope(title) for title in titles])
+
+
+@receiver(post_save, sender=Subtitle)
+@receiver(post_delete, sender=Subtitle)
+def subtitle_media_document(sender, instance, **kwargs):
+    invalidate_media_documents([instance.media_id])
+
+
+# lookup from Media to the objects shown in its detail document
+MEDIA_DOCUMENT_RELATIONS = {
+    Category: "category",
+    Tag: "tags",
+    Ads: "ad_tag",
+    RatingCategory: "rating_category",
+}
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ads)
+@receiver(post_save, sender=RatingCategory)
+@receiver(pre_delete, sender=Category)
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ads)
+@receiver(pre_delete, sender=RatingCategory)
+def media_document_related_change(sender, instance, created=False, update_fields=None, **kwargs):
+    # media_count updates don't change what media details show
+    if created or (update_fields is not None and set(update_fields) <= {"media_count"}):
+        return
+    media = Media.objects.filter(**{MEDIA_DOCUMENT_RELATIONS[sender]: instance})
+    invalidate_media_documents(media.values_list("id", flat=True))
+
+
+@receiver(m2m_changed, sender=Media.category.through)
+@receiver(m2m_changed, sender=Media.tags.through)
+@receiver(m2m_changed, sender=Media.rating_category.through)
+def media_document_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            invalidate_media_documents([instance.pk])
+    elif action == "pre_clear":
+        media = Media.objects.filter(**{MEDIA_DOCUMENT_RELATIONS[type(instance)]: instance})
+        invalidate_media_documents(media.values_list("id", flat=True))
+    elif action in ("post_add", "post_remove"):
+        invalidate_media_documents(pk_set or [])
+
+
+@receiver(m2m_changed, sender=Media.category.through)
+def media_category_changes(sender, instance, action, reverse, pk_set, **kwargs):
+    # related media lists follow the categories
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    for media_id in (pk_set or []) if reverse else [instance.pk]:
+        schedule_media_changes(media_id, {"category"})
+
+
+@receiver(post_save, sender=Playlist)
+@receiver(post_delete, sender=Playlist)
+def playlist_version(sender, instance, **kwargs):
+    bump_versions([playlist_scope(instance.id), *sitemap_scopes("playlists", [instance.id])])
+
+
+@receiver(post_save, sender=PlaylistMedia)
+@receiver(post_delete, sender=PlaylistMedia)
+def playlist_media_version(sender, instance, **kwargs):
+    bump_versions([playlist_scope(instance.playlist_id)])
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_version(sender, instance, **kwargs):
+    bump_versions([comments_scope(instance.media_id)])
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def rating_version(sender, instance, **kwargs):
+    # media details carry the ratings of the viewer
+    bump_versions([user_scope(instance.user_id)])
@@ -0,0 +1,200 @@
+import itertools
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Item to item recommendations from co-watching. Viewers (users, or
+# sessions of anonymous viewers) and the listable media they watched form a
+# sparse binary matrix X, X.T @ X counts for every pair of media the viewers
+# that watched both, and the cosine similarity of the pair is that count
+# over the square root of the viewers of each media. The nearest media of
+# each media are stored in the cache as a list of ids.
+RELATED_MEDIA_KEY = "related_media:v1:{0}"
+# Related media of the content strategy: media of the same author, then of
+# the same categories, then popular media. Lists of ids, refreshed daily
+# for all listable media and when a media or its categories change.
+CONTENT_RELATED_KEY = "related_media:content:v1:{0}"
+
+
+def _limit():
+    return getattr(settings, "RELATED_MEDIA_LIMIT", 100)
+
+
+def _timeout():
+    return getattr(settings, "RELATED_MEDIA_TIMEOUT", 60 * 60 * 24 * 2)
+
+
+def _store(key, lists):
+    items = list(lists.items())
+    for start in range(0, len(items), 1000):
+        cache.set_many({key.format(media_id): ids for media_id, ids in items[start : start + 1000]}, _timeout())
+
+
+def related_media_ids(media_id):
+    """Precomputed related media ids of a media, most similar first"""
+
+    return cache.get(RELATED_MEDIA_KEY.format(media_id)) or []
+
+
+def _merge(media_id, *candidates):
+    ids = []
+    seen = {media_id}
+    for candidate in itertools.chain(*candidates):
+        if candidate not in seen:
+            seen.add(candidate)
+            ids.append(candidate)
+            if len(ids) == _limit():
+                break
+    return ids
+
+
+def content_related_ids(media):
+    """Related media ids of the content strategy, computed on a cache miss"""
+
+    ids = cache.get(CONTENT_RELATED_KEY.format(media.id))
+    if ids is None:
+        ids = refresh_content_related([media.id]).get(media.id, [])
+    return ids
+
+
+def refresh_content_related(media_ids):
+    """Compute the content related lists of a few media"""
+
+    from .models import Media
+
+    limit = _limit()
+    listable = Media.objects.filter(listable=True)
+    popular = list(listable.order_by("-views").values_list("id", flat=True)[: limit + 1])
+    lists = {}
+    for media_id, user_id in Media.objects.filter(id__in=media_ids).values_list("id", "user_id"):
+        author = listable.filter(user_id=user_id).order_by("-add_date").values_list("id", flat=True)[: limit + 1]
+        categories = Media.category.through.objects.filter(media_id=media_id).values("category_id")
+        category = listable.filter(category__in=categories).order_by("-views").values_list("id", flat=True).distinct()[: limit + 1]
+        lists[media_id] = _merge(media_id, author, category, popular)
+    _store(CONTENT_RELATED_KEY, lists)
+    return lists
+
+
+def refresh_all_content_related():
+    """Compute the content related lists of all listable media, with one
+    pass over the listable media and their categories"""
+
+    from .models import Media
+
+    limit = _limit()
+    listable = Media.objects.filter(listable=True)
+    popular = list(listable.order_by("-views").values_list("id", flat=True)[: limit + 1])
+
+    by_author = defaultdict(list)
+    media_authors = {}
+    for media_id, user_id in listable.order_by("user_id", "-add_date").values_list("id", "user_id").iterator(chunk_size=5000):
+        media_authors[media_id] = user_id
+        if len(by_author[user_id]) <= limit:
+            by_author[user_id].append(media_id)
+
+    by_category = defaultdict(list)
+    media_categories = defaultdict(list)
+    rows = Media.category.through.objects.filter(media__listable=True).order_by("category_id", "-media__views")
+    for media_id, category_id in rows.values_list("media_id", "category_id").iterator(chunk_size=5000):
+        media_categories[media_id].append(category_id)
+        if len(by_category[category_id]) <= limit:
+            by_category[category_id].append(media_id)
+
+    lists = {}
+    for media_id, user_id in media_authors.items():
+        categories = (by_category[category_id] for category_id in media_categories[media_id])
+        lists[media_id] = _merge(media_id, by_author[user_id], itertools.chain.from_iterable(categories), popular)
+    _store(CONTENT_RELATED_KEY, lists)
+
+    logger.info("Computed content related media of %s media", len(lists))
+    return len(lists)
+
+
+def _watches(since):
+    from actions.models import MediaAction
+
+    queryset = MediaAction.objects.filter(action="watch", action_date__gte=since, media__listable=True)
+    return queryset.values_list("user_id", "session_key", "media_id").distinct().iterator(chunk_size=5000)
+
+
+def build_co_watch_matrix(watches, max_viewer_media=None):
+    """Sparse viewer x media matrix of (user id, session key, media id)
+    rows, returns the matrix and the media id of each column.
+    Viewers with more than max_viewer_media media are left out, they
+    relate everything to everything"""
+
+    import numpy as np
+    from scipy import sparse
+
+    viewers = {}
+    media = {}
+    rows = []
+    cols = []
+    for user_id, session_key, media_id in watches:
+        viewer = ("u", user_id) if user_id else ("s", session_key)
+        rows.append(viewers.setdefault(viewer, len(viewers)))
+        cols.append(media.setdefault(media_id, len(media)))
+
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64))),
+        shape=(len(viewers), len(media)),
+    )
+    # a viewer watching the same media twice counts once
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    if max_viewer_media:
+        keep = np.diff(matrix.indptr) <= max_viewer_media
+        matrix = matrix[keep]
+
+    media_ids = np.empty(len(media), dtype=np.int64)
+    media_ids[list(media.values())] = list(media.keys())
+    return matrix, media_ids
+
+
+def nearest_media(matrix, media_ids, limit, min_co_watch=1):
+    """{media id: [related media ids]} by cosine similarity of the columns"""
+
+    import numpy as np
+    from scipy import sparse
+
+    co_watch = (matrix.T @ matrix).tocsr()
+    viewers = co_watch.diagonal()
+    co_watch.setdiag(0)
+    if min_co_watch > 1:
+        co_watch.data[co_watch.data < min_co_watch] = 0
+    co_watch.eliminate_zeros()
+
+    with np.errstate(divide="ignore"):
+        scale = sparse.diags(np.where(viewers > 0, 1 / np.sqrt(viewers), 0))
+    similarity = (scale @ co_watch @ scale).tocsr()
+
+    neighbours = {}
+    for column in range(similarity.shape[0]):
+        start, end = similarity.indptr[column], similarity.indptr[column + 1]
+        if start == end:
+            continue
+        scores = similarity.data[start:end]
+        top = np.argpartition(-scores, limit)[:limit] if len(scores) > limit else np.arange(len(scores))
+        # ties are broken by media id, for stable results
+        top = top[np.lexsort((media_ids[similarity.indices[start:end][top]], -scores[top]))]
+        neighbours[int(media_ids[column])] = media_ids[similarity.indices[start:end][top]].tolist()
+    return neighbours
+
+
+def update_related_media():
+    """Compute the related media of every watched media from the watch
+    actions of the last RELATED_MEDIA_DAYS, returns the number of media"""
+
+    since = timezone.now() - timedelta(days=getattr(settings, "RELATED_MEDIA_DAYS", 90))
+    matrix, media_ids = build_co_watch_matrix(_watches(since), getattr(settings, "RELATED_MEDIA_MAX_VIEWER_MEDIA", 500))
+    neighbours = nearest_media(matrix, media_ids, _limit(), getattr(settings, "RELATED_MEDIA_MIN_CO_WATCH", 2))
+    _store(RELATED_MEDIA_KEY, neighbours)
+
+    logger.info("Computed related media of %s media from %s viewers", len(neighbours), matrix.shape[0])
+    return len(neighbours)
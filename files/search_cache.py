@@ -0,0 +1,179 @@
+import hashlib
+import json
+import time
+from collections.abc import Sequence
+
+from django.conf import settings
+from django.core.cache import cache
+
+SEARCH_CACHE_PREFIX = "search_cache"
+SEARCH_CACHE_HITS_KEY = f"{SEARCH_CACHE_PREFIX}:hits"
+SEARCH_CACHE_MISSES_KEY = f"{SEARCH_CACHE_PREFIX}:misses"
+
+# free text searches can match any media, so they depend on a global
+# generation. Category and tag browsing depend only on their own one.
+GLOBAL_GENERATION = "all"
+
+
+def _generation_key(scope, name=""):
+    digest = hashlib.md5(name.encode("utf-8")).hexdigest() if name else ""
+    return f"{SEARCH_CACHE_PREFIX}:gen:{scope}:{digest}"
+
+
+def _incr(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def search_cache_stats():
+    values = cache.get_many([SEARCH_CACHE_HITS_KEY, SEARCH_CACHE_MISSES_KEY])
+    hits = values.get(SEARCH_CACHE_HITS_KEY, 0)
+    misses = values.get(SEARCH_CACHE_MISSES_KEY, 0)
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_rate": (hits / total * 100) if total else 0}
+
+
+def invalidate_media_searches(media):
+    """Drop cached searches that may include this media"""
+
+    keys = [global_scope()]
+    keys.extend(category_scope(title) for title in media.category.values_list("title", flat=True))
+    keys.extend(tag_scope(title) for title in media.tags.values_list("title", flat=True))
+    invalidate_search_scopes(keys)
+
+
+def invalidate_search_scopes(keys):
+    # time based generations, a key evicted from redis never goes back
+    # to a value that was already used
+    generation = time.time_ns()
+    cache.set_many({key: generation for key in keys}, None)
+
+
+def global_scope():
+    return _generation_key(GLOBAL_GENERATION)
+
+
+def category_scope(title):
+    return _generation_key("c", title)
+
+
+def tag_scope(title):
+    return _generation_key("t", title)
+
+
+def search_cache_key(namespace, params):
+    """Cache key for a search, params is a dict of normalised values"""
+
+    if params.get("q") or params.get("author") or not (params.get("c") or params.get("t")):
+        scopes = [global_scope()]
+    else:
+        scopes = []
+        if params.get("c"):
+            scopes.append(category_scope(params["c"]))
+        if params.get("t"):
+            scopes.append(tag_scope(params["t"]))
+
+    generations = cache.get_many(scopes)
+    payload = json.dumps(
+        {"params": params, "generations": [generations.get(scope, 0) for scope in scopes]},
+        sort_keys=True,
+    )
+    return f"{SEARCH_CACHE_PREFIX}:{namespace}:{hashlib.md5(payload.encode('utf-8')).hexdigest()}"
+
+
+def cached_value(namespace, params, compute):
+    """Cache the result of compute() under the search generations of params"""
+
+    if not getattr(settings, "SEARCH_CACHE_ENABLED", True):
+        return compute()
+    key = search_cache_key(namespace, params)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, getattr(settings, "SEARCH_CACHE_TIMEOUT", 60 * 5))
+    return value
+
+
+def _compute_entry(queryset, max_ids):
+    ids = list(queryset.values_list("id", flat=True)[:max_ids])
+    count = len(ids) if len(ids) < max_ids else queryset.count()
+    return {"ids": ids, "count": count, "expires": time.time() + getattr(settings, "SEARCH_CACHE_TIMEOUT", 60 * 5)}
+
+
+def get_search_entry(key, queryset, max_ids):
+    """Cached {"ids", "count"} of a search.
+
+    Entries are kept twice their timeout. After the soft expiry a single
+    request recomputes it while the rest keep serving the old entry, and
+    a missing entry is computed by one request while the rest wait for it.
+    """
+
+    timeout = getattr(settings, "SEARCH_CACHE_TIMEOUT", 60 * 5)
+    lock_key = f"{key}:lock"
+
+    entry = cache.get(key)
+    if entry is not None:
+        _incr(SEARCH_CACHE_HITS_KEY)
+        if entry["expires"] < time.time() and cache.add(lock_key, 1, 30):
+            try:
+                entry = _compute_entry(queryset, max_ids)
+                cache.set(key, entry, timeout * 2)
+            finally:
+                cache.delete(lock_key)
+        return entry
+
+    _incr(SEARCH_CACHE_MISSES_KEY)
+    if not cache.add(lock_key, 1, 30):
+        deadline = time.time() + getattr(settings, "SEARCH_CACHE_LOCK_WAIT", 2)
+        while time.time() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry
+        return _compute_entry(queryset, max_ids)
+
+    try:
+        entry = _compute_entry(queryset, max_ids)
+        cache.set(key, entry, timeout * 2)
+    finally:
+        cache.delete(lock_key)
+    return entry
+
+
+class CachedSearchResults(Sequence):
+    """Search results backed by a cached id list, for Django's Paginator.
+
+    Slices inside the cached ids load only those rows, slices beyond them
+    fall back to the queryset.
+    """
+
+    def __init__(self, entry, queryset):
+        self.ids = entry["ids"]
+        self.total = entry["count"]
+        self.queryset = queryset
+
+    def __len__(self):
+        return self.total
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index : index + 1][0]
+        start, stop, _ = index.indices(self.total)
+        if stop > len(self.ids):
+            return list(self.queryset[start:stop])
+        page_ids = self.ids[start:stop]
+        media = {item.id: item for item in self.queryset.model.objects.filter(id__in=page_ids).prefetch_related("user")}
+        return [media[media_id] for media_id in page_ids if media_id in media]
+
+
+def cached_search(namespace, params, queryset, max_ids=None):
+    """Wrap a search queryset so its ids and count come from the cache"""
+
+    if not getattr(settings, "SEARCH_CACHE_ENABLED", True):
+        return queryset
+    max_ids = max_ids or getattr(settings, "SEARCH_CACHE_MAX_IDS", 1000)
+    key = search_cache_key(namespace, params)
+    return CachedSearchResults(get_search_entry(key, queryset, max_ids), queryset)
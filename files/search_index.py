@@ -0,0 +1,209 @@
+import logging
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection, transaction
+from django.db.models import CharField, Count, F, Value
+from django.utils import timezone
+
+from . import helpers
+from .stop_words import STOP_WORDS
+
+logger = logging.getLogger(__name__)
+
+# Media fields that feed the search document. Saves touching any of them
+# mark the media as dirty for the indexing worker.
+SEARCH_SOURCE_FIELDS = {"title", "description", "user"}
+
+
+def search_batch_size():
+    return max(1, int(getattr(settings, "SEARCH_INDEX_BATCH_SIZE", 500) or 500))
+
+
+def clean_search_text(text):
+    text = " ".join([token for token in (text or "").lower().split(" ") if token not in STOP_WORDS])
+    return helpers.clean_query(text)
+
+
+def search_document_parts(media):
+    """Text indexed for a media, split by weight.
+
+    Returns a (title, tags, description, author) tuple, stored with
+    weights A, B, C and D. Expects tags to be prefetched.
+    """
+
+    tags = [tag.title for tag in media.tags.all()]
+    tags_text = " ".join(tags + [tag.replace("-", " ") for tag in tags])
+    author_text = " ".join([item for item in [media.user.username, media.user.email, media.user.name] if item])
+
+    return (
+        clean_search_text(media.title),
+        clean_search_text(tags_text),
+        clean_search_text(media.description),
+        clean_search_text(author_text),
+    )
+
+
+def build_search_query(query):
+    """Prefix SearchQuery matching all terms of a user query, or None"""
+
+    query = helpers.clean_query(query)
+    q_parts = [q_part.rstrip("y") for q_part in query.split() if q_part not in STOP_WORDS]
+    if not q_parts:
+        return None
+
+    search_query = SearchQuery(q_parts[0] + ":*", search_type="raw", config="simple")
+    for part in q_parts[1:]:
+        search_query &= SearchQuery(part + ":*", search_type="raw", config="simple")
+    return search_query
+
+
+def search_rank(search_query):
+    """ts_rank_cd over the weighted search vector"""
+
+    return SearchRank(F("search"), search_query, cover_density=True)
+
+
+def rank_search_results(media, search_query):
+    """Order matching media by relevance.
+
+    ts_rank_cd reads the whole search vector of every row it ranks, so only
+    the SEARCH_RANK_MAX_CANDIDATES most recent matches are ranked, found
+    walking the add_date index like the date ordering does. Older matches
+    are left out of relevance results.
+    """
+
+    limit = getattr(settings, "SEARCH_RANK_MAX_CANDIDATES", 2000)
+    media = media.model.objects.filter(id__in=media.order_by("-add_date").values("id")[:limit])
+    return media.annotate(rank=search_rank(search_query)).order_by("-rank", "-add_date")
+
+
+def _facet(queryset, facet, field, count_field, limit):
+    return (
+        queryset.annotate(facet=Value(facet, output_field=CharField()), name=F(field))
+        .values("facet", "name")
+        .annotate(count=Count(count_field))
+        .values_list("facet", "name", "count")
+        .order_by("-count")[:limit]
+    )
+
+
+def search_facets(media, limit=None):
+    """Category, tag and media_type counts of a search, in one UNION ALL
+    of grouped aggregates over the matching ids"""
+
+    from .models import Media
+
+    limit = limit or getattr(settings, "SEARCH_FACETS_LIMIT", 20)
+    ids = media.values("id")
+    categories = Media.category.through.objects.filter(media_id__in=ids)
+    tags = Media.tags.through.objects.filter(media_id__in=ids)
+
+    query = _facet(categories, "category", "category__title", "media_id", limit).union(
+        _facet(tags, "tag", "tag__title", "media_id", limit),
+        _facet(Media.objects.filter(id__in=ids), "media_type", "media_type", "id", limit),
+        all=True,
+    )
+
+    facets = {"category": [], "tag": [], "media_type": []}
+    for facet, name, count in query:
+        facets[facet].append({"title": name, "count": count})
+    return facets
+
+
+def mark_media_dirty(media_ids):
+    """Queue media for reindexing, without touching edit_date.
+    search_dirty_at is bumped even on media queued already, a batch that
+    read them before this change must not clear the flag"""
+
+    from .models import Media
+
+    media_ids = list(media_ids)
+    if not media_ids:
+        return 0
+    return Media.objects.filter(id__in=media_ids).update(search_dirty=True, search_dirty_at=timezone.now())
+
+
+def index_media_batch(media_ids):
+    """Recompute the search vector of the given media in one UPDATE.
+
+    Rows marked dirty again after they were read (search_dirty_at changed)
+    keep their dirty flag, so the next run picks up the newer content.
+    """
+
+    from .models import Media
+
+    # no .only() here, Media.__init__ reads file fields and deferring them recurses
+    media = list(Media.objects.filter(id__in=media_ids).select_related("user").prefetch_related("tags"))
+    if not media:
+        return 0
+
+    values = []
+    params = []
+    for item in media:
+        values.append("(%s::integer, %s::text, %s::text, %s::text, %s::text, %s::timestamptz)")
+        params.extend([item.id, *search_document_parts(item), item.search_dirty_at])
+
+    sql_code = """
+        UPDATE {db_table} AS m
+        SET search = setweight(to_tsvector('simple', v.title), 'A')
+            || setweight(to_tsvector('simple', v.tags), 'B')
+            || setweight(to_tsvector('simple', v.description), 'C')
+            || setweight(to_tsvector('simple', v.author), 'D'),
+            search_dirty = false
+        FROM (VALUES {values}) AS v(id, title, tags, description, author, search_dirty_at)
+        WHERE m.id = v.id AND m.search_dirty_at IS NOT DISTINCT FROM v.search_dirty_at
+        """.format(
+        db_table=Media._meta.db_table, values=", ".join(values)
+    )
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(sql_code, params)
+        return cursor.rowcount
+
+
+def index_dirty_media(max_batches=None):
+    """Reindex queued media in batches, returns the number of rows updated"""
+
+    from .models import Media
+
+    batch_size = search_batch_size()
+    updated = 0
+    batches = 0
+    last_id = 0
+    while max_batches is None or batches < max_batches:
+        ids = list(
+            Media.objects.filter(search_dirty=True, id__gt=last_id).order_by("id").values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        updated += index_media_batch(ids)
+        last_id = ids[-1]
+        batches += 1
+
+    if updated:
+        logger.info("Search index updated for %s media", updated)
+    return updated
+
+
+def rebuild_search_index(batch_size=None, progress=None):
+    """Reindex the whole catalog in chunks of primary keys"""
+
+    from .models import Media
+
+    batch_size = batch_size or search_batch_size()
+    total = Media.objects.count()
+    done = 0
+    updated = 0
+    last_id = 0
+    while True:
+        ids = list(Media.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:batch_size])
+        if not ids:
+            break
+        updated += index_media_batch(ids)
+        done += len(ids)
+        last_id = ids[-1]
+        if progress:
+            progress(done, total)
+
+    return updated
@@ -1,41 +1,67 @@
 from django.conf import settings
 from urllib.parse import urlencode
 
+from django.db import models
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework import serializers
+from rest_framework.fields import SkipField
 
+from .listing_cards import get_media_cards
+from .media_documents import get_media_document
 from .models import Category, Comment, EncodeProfile, Media, Playlist, Tag, Ads
 
 # TODO: put them in a more DRY way
 
 
+class MediaListSerializer(serializers.ListSerializer):
+    """Loads the listing cards of a page in bulk before serializing it"""
+
+    def to_representation(self, data):
+        iterable = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        self.child._cards = get_media_cards(iterable)
+        return super().to_representation(iterable)
+
+
 class MediaSerializer(serializers.ModelSerializer):
     # to be used in APIs as show related media
     user = serializers.ReadOnlyField(source="user.username")
     url = serializers.SerializerMethodField()
     api_url = serializers.SerializerMethodField()
     thumbnail_url = serializers.SerializerMethodField()
+    preview_url = serializers.SerializerMethodField()
     author_profile = serializers.SerializerMethodField()
     author_thumbnail = serializers.SerializerMethodField()
 
+    _cards = {}
+
+    def _card(self, obj):
+        card = self._cards.get(obj.id)
+        if card is None:
+            card = get_media_cards([obj])[obj.id]
+        return card
+
     def get_url(self, obj):
-        return self.context["request"].build_absolute_uri(obj.get_absolute_url())
+        return self.context["request"].build_absolute_uri(self._card(obj)["url"])
 
     def get_api_url(self, obj):
-        return self.context["request"].build_absolute_uri(obj.get_absolute_url(api=True))
+        return self.context["request"].build_absolute_uri(self._card(obj)["api_url"])
 
     def get_thumbnail_url(self, obj):
-        if obj.thumbnail_url:
-            return self.context["request"].build_absolute_uri(obj.thumbnail_url)
+        thumbnail_url = self._card(obj)["thumbnail_url"]
+        if thumbnail_url:
+            return self.context["request"].build_absolute_uri(thumbnail_url)
         else:
             return None
 
+    def get_preview_url(self, obj):
+        return self._card(obj)["preview_url"]
+
     def get_author_profile(self, obj):
-        return self.context["request"].build_absolute_uri(obj.author_profile())
+        return self.context["request"].build_absolute_uri(self._card(obj)["author_profile"])
 
     def get_author_thumbnail(self, obj):
-        return self.context["request"].build_absolute_uri(obj.author_thumbnail())
+        return self.context["request"].build_absolute_uri(self._card(obj)["author_thumbnail"])
 
     class Meta:
         model = Media
@@ -56,6 +82,7 @@ class MediaSerializer(serializers.ModelSerializer):
             "featured",
             "ad_tag"
         )
+        list_serializer_class = MediaListSerializer
         fields = (
             "friendly_token",
             "url",
@@ -107,6 +134,46 @@ class SingleMediaSerializer(serializers.ModelSerializer):
     stream_entitled = serializers.SerializerMethodField()
     stream_checkout_url = serializers.SerializerMethodField()
 
+    # fields computed on every request, the rest come from the shared
+    # media document: counters, the request host and the viewer entitlements
+    REQUEST_FIELDS = {
+        "url",
+        "views",
+        "likes",
+        "dislikes",
+        "reported_times",
+        "download_requires_payment",
+        "download_entitled",
+        "download_checkout_url",
+        "download_options",
+        "original_media_url",
+        "stream",
+        "stream_requires_payment",
+        "stream_entitled",
+        "stream_checkout_url",
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._entitlements = {}
+
+    def _represent(self, instance, fields):
+        ret = {}
+        for field in fields:
+            try:
+                attribute = field.get_attribute(instance)
+            except SkipField:
+                continue
+            ret[field.field_name] = None if attribute is None else field.to_representation(attribute)
+        return ret
+
+    def to_representation(self, instance):
+        fields = list(self._readable_fields)
+        shared_fields = [field for field in fields if field.field_name not in self.REQUEST_FIELDS]
+        document = get_media_document(instance, lambda: self._represent(instance, shared_fields))
+        ret = self._represent(instance, [field for field in fields if field.field_name in self.REQUEST_FIELDS])
+        ret.update(document)
+        return {field.field_name: ret[field.field_name] for field in fields if field.field_name in ret}
 
     def get_url(self, obj):
         return self.context["request"].build_absolute_uri(obj.get_absolute_url())
@@ -139,6 +206,19 @@ class SingleMediaSerializer(serializers.ModelSerializer):
         return bool(getattr(settings, "VIDEO_DOWNLOAD_REQUIRES_PAYMENT", True))
 
     def _user_entitled(self, obj) -> bool:
+        # several fields ask for it, query once per media
+        if obj.id not in self._entitlements:
+            self._entitlements[obj.id] = self._lookup_entitlement(obj)
+        return self._entitlements[obj.id]
+
+    def viewer_entitled(self, obj) -> bool:
+        """Whether the requesting user may download or stream a paid media"""
+
+        if not self._video_download_requires_payment(obj) and not self._stream_playback_requires_payment(obj):
+            return True
+        return self._user_entitled(obj)
+
+    def _lookup_entitlement(self, obj) -> bool:
         request = self.context.get("request")
         if not request or not getattr(request, "user", None) or not request.user.is_authenticated:
             return False
@@ -0,0 +1,127 @@
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Max, Value
+from django.http import HttpResponse, StreamingHttpResponse
+
+from .content_versions import get_versions, not_modified, set_validators
+
+# Sitemap split into child sitemaps by type and id range, each one well
+# below the 50000 urls allowed per file. Partitions are cached under the
+# version of their own scope, bumped when a row of the partition changes.
+SITEMAP_SECTIONS = ("media", "playlists", "users")
+SITEMAP_INDEX_SCOPE = "sitemap"
+SITEMAP_CACHE_KEY = "sitemap_content:{0}:{1}"
+
+URLSET_START = '<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+URLSET_END = "</urlset>\n"
+
+
+def partition_size():
+    return max(1, int(getattr(settings, "SITEMAP_PARTITION_SIZE", 10000) or 10000))
+
+
+def sitemap_partition(object_id):
+    return object_id // partition_size()
+
+
+def sitemap_scope(section, partition):
+    return f"sitemap:{section}:{partition}"
+
+
+def sitemap_scopes(section, object_ids):
+    """Version scopes to bump when these rows change"""
+
+    scopes = {sitemap_scope(section, sitemap_partition(object_id)) for object_id in object_ids}
+    return [SITEMAP_INDEX_SCOPE, *scopes]
+
+
+def _section_queryset(section):
+    from users.models import User
+
+    from .models import Media, Playlist
+
+    if section == "media":
+        return Media.objects.filter(listable=True), "edit_date"
+    if section == "playlists":
+        return Playlist.objects.all(), "add_date"
+    return User.objects.all(), None
+
+
+def section_partitions(section):
+    """(partition, lastmod) of the partitions that have rows, one grouped query"""
+
+    queryset, date_field = _section_queryset(section)
+    queryset = queryset.annotate(partition=F("id") / Value(partition_size())).values("partition").order_by("partition")
+    if date_field:
+        return list(queryset.annotate(lastmod=Max(date_field)).values_list("partition", "lastmod"))
+    return [(partition, None) for partition in queryset.distinct().values_list("partition", flat=True)]
+
+
+def _lastmod(value):
+    return f"<lastmod>{value.date().isoformat()}</lastmod>" if value else ""
+
+
+def iter_sitemap_index():
+    host = settings.FRONTEND_HOST
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    yield f"<sitemap><loc>{host}/sitemap-pages.xml</loc></sitemap>\n"
+    for section in SITEMAP_SECTIONS:
+        for partition, lastmod in section_partitions(section):
+            yield f"<sitemap><loc>{host}/sitemap-{section}-{partition}.xml</loc>{_lastmod(lastmod)}</sitemap>\n"
+    yield "</sitemapindex>\n"
+
+
+def iter_sitemap_section(section, partition):
+    host = settings.FRONTEND_HOST
+    size = partition_size()
+    queryset, _ = _section_queryset(section)
+    queryset = queryset.filter(id__gte=partition * size, id__lt=(partition + 1) * size).order_by("id")
+
+    yield URLSET_START
+    if section == "media":
+        for friendly_token, edit_date in queryset.values_list("friendly_token", "edit_date").iterator():
+            yield f"<url><loc>{host}/view?m={escape(friendly_token)}</loc>{_lastmod(edit_date)}</url>\n"
+    elif section == "playlists":
+        for friendly_token in queryset.values_list("friendly_token", flat=True).iterator():
+            yield f"<url><loc>{host}/playlists/{escape(friendly_token)}</loc></url>\n"
+    else:
+        for username in queryset.values_list("username", flat=True).iterator():
+            yield f"<url><loc>{host}/user/{escape(username)}/</loc></url>\n"
+    yield URLSET_END
+
+
+def _caching(chunks, key):
+    # rows are sent in blocks, and the cache is filled only once the
+    # whole sitemap was sent
+    parts = []
+    block = []
+    for chunk in chunks:
+        block.append(chunk)
+        if len(block) >= 500:
+            parts.append("".join(block))
+            block = []
+            yield parts[-1]
+    parts.append("".join(block))
+    yield parts[-1]
+    cache.set(key, "".join(parts), getattr(settings, "SITEMAP_CACHE_TIMEOUT", 60 * 60 * 24))
+
+
+def sitemap_response(request, scope, chunks):
+    """Cached sitemap of a scope, streamed from chunks() when it is not"""
+
+    version = get_versions([scope])[0]
+    etag = f'"{scope}:{version}"'
+    last_modified = version // 1_000_000_000
+    response = not_modified(request, etag, last_modified)
+    if response:
+        return response
+
+    key = SITEMAP_CACHE_KEY.format(scope, version)
+    content = cache.get(key)
+    if content is not None:
+        response = HttpResponse(content, content_type="application/xml")
+    else:
+        response = StreamingHttpResponse(_caching(chunks(), key), content_type="application/xml")
+    return set_validators(response, etag, last_modified)
@@ -0,0 +1,200 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.db.utils import OperationalError, ProgrammingError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from actions.models import MediaActionRollup
+from payments.models import Payment, UserSubscription
+from users.models import User
+
+from .models import Category, Comment, Media, StatisticsSnapshot, WowzaApplication
+from .storage_usage import get_media_storage_usage
+
+
+def _total_sales():
+    try:
+        return Payment.objects.filter(status=Payment.STATUS_PAID).count()
+    except (OperationalError, ProgrammingError):
+        return 0
+
+
+def _total_subscribers():
+    try:
+        return (
+            UserSubscription.objects.filter(
+                flow_subscription_id__isnull=False,
+                flow_status__in=[
+                    UserSubscription.FLOW_STATUS_ACTIVE,
+                    UserSubscription.FLOW_STATUS_TRIAL,
+                ],
+                status__in=[
+                    UserSubscription.STATUS_ACTIVE,
+                    UserSubscription.STATUS_TRIAL,
+                ],
+            )
+            .filter(Q(morose=0) | Q(morose__isnull=True))
+            .exclude(flow_subscription_id="")
+            .count()
+        )
+    except (OperationalError, ProgrammingError):
+        return 0
+
+
+def _recent_activity():
+    recent_activity = []
+
+    for media in Media.objects.select_related("user").order_by("-add_date")[:5]:
+        recent_activity.append(
+            {
+                "kind": "media",
+                "user_name": media.user.name or media.user.username,
+                "user_email": media.user.email,
+                "user_thumbnail": media.user.thumbnail_url(),
+                "media_title": media.title,
+                "status": "Approved" if media.is_reviewed and media.state == "public" else "Pending",
+                "date": media.add_date,
+            }
+        )
+
+    for comment in Comment.objects.select_related("user", "media").order_by("-add_date")[:5]:
+        recent_activity.append(
+            {
+                "kind": "comment",
+                "user_name": comment.user.name or comment.user.username,
+                "user_email": comment.user.email,
+                "user_thumbnail": comment.user.thumbnail_url(),
+                "media_title": comment.media.title,
+                "status": "Approved" if comment.media.is_reviewed and comment.media.state == "public" else "Pending",
+                "date": comment.add_date,
+            }
+        )
+
+    return sorted(recent_activity, key=lambda item: item["date"], reverse=True)[:5]
+
+
+def _top_rated_videos():
+    top_rated_videos = []
+    for index, media in enumerate(
+        Media.objects.filter(media_type="video").prefetch_related("category").order_by("-likes", "-views", "title")[:5],
+        start=1,
+    ):
+        # from the prefetched categories, no query per media
+        categories = sorted(media.category.all(), key=lambda category: category.title)
+        top_rated_videos.append(
+            {
+                "rank": index,
+                "title": media.title,
+                "url": media.get_absolute_url(),
+                "thumbnail_url": media.poster_url or media.thumbnail_url,
+                "year": media.add_date.year if media.add_date else None,
+                "category": categories[0].title if categories else "",
+                "views": media.views,
+                "likes": media.likes,
+            }
+        )
+    return top_rated_videos
+
+
+def _daily(rows, days, fields):
+    # one entry per day of the window, days without rows are zero
+    today = timezone.localdate()
+    by_day = {row["day"]: row for row in rows}
+    series = []
+    for offset in range(days - 1, -1, -1):
+        day = today - timedelta(days=offset)
+        row = by_day.get(day, {})
+        series.append({"date": day, **{field: row.get(field) or 0 for field in fields}})
+    return series
+
+
+def _series():
+    days = getattr(settings, "STATISTICS_SERIES_DAYS", 30)
+    since = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days - 1)
+
+    uploads = Media.objects.filter(add_date__gte=since).annotate(day=TruncDate("add_date")).values("day").annotate(count=Count("id")).order_by()
+    views = (
+        MediaActionRollup.objects.filter(period="day", action="watch", period_start__gte=since)
+        .annotate(day=TruncDate("period_start"))
+        .values("day")
+        .annotate(count=Sum("count"))
+        .order_by()
+    )
+    try:
+        sales = list(
+            Payment.objects.filter(status=Payment.STATUS_PAID, paid_at__gte=since)
+            .annotate(day=TruncDate("paid_at"))
+            .values("day")
+            .annotate(count=Count("id"), amount=Sum("amount"))
+            .order_by()
+        )
+    except (OperationalError, ProgrammingError):
+        sales = []
+
+    return {
+        "uploads": _daily(uploads, days, ["count"]),
+        "views": _daily(views, days, ["count"]),
+        "sales": _daily(sales, days, ["count", "amount"]),
+    }
+
+
+def _storage_usage(refresh=False):
+    # walking the media folders is slow, the figures of the last snapshot
+    # are kept until they are STATISTICS_STORAGE_SECONDS old
+    last = StatisticsSnapshot.objects.order_by("-add_date").first()
+    measured_at = parse_datetime(last.data.get("storage_usage_at") or "") if last else None
+    max_age = timedelta(seconds=getattr(settings, "STATISTICS_STORAGE_SECONDS", 3600))
+    if not refresh and measured_at and timezone.now() - measured_at < max_age:
+        return last.data["storage_usage"], measured_at
+    return get_media_storage_usage(), timezone.now()
+
+
+def build_statistics(refresh_storage=False):
+    """Aggregates, time series and storage figures of the dashboard.
+    Storage figures are measured again when refresh_storage is set or they
+    are older than STATISTICS_STORAGE_SECONDS"""
+
+    storage_usage, storage_usage_at = _storage_usage(refresh_storage)
+
+    top_categories = [
+        {
+            "title": category.title,
+            "url": category.get_absolute_url(),
+            "media_count": category.media_count,
+        }
+        for category in Category.objects.order_by("-media_count", "title")[:6]
+    ]
+
+    return {
+        "total_videos": Media.objects.filter(media_type="video").count(),
+        "total_members": User.objects.count(),
+        "total_categories": Category.objects.count(),
+        "total_sales": _total_sales(),
+        "total_subscribers": _total_subscribers(),
+        "total_comments": Comment.objects.count(),
+        "total_live_signals": WowzaApplication.objects.filter(is_active=True).count(),
+        "storage_usage": storage_usage,
+        "storage_usage_at": storage_usage_at,
+        "top_categories": top_categories,
+        "recent_activity": _recent_activity(),
+        "top_rated_videos": _top_rated_videos(),
+        "series": _series(),
+    }
+
+
+def take_statistics_snapshot(refresh_storage=False):
+    """Store a new snapshot and drop the ones past STATISTICS_SNAPSHOT_KEEP_DAYS"""
+
+    snapshot = StatisticsSnapshot.objects.create(data=build_statistics(refresh_storage))
+    keep = timedelta(days=getattr(settings, "STATISTICS_SNAPSHOT_KEEP_DAYS", 7))
+    StatisticsSnapshot.objects.filter(add_date__lt=snapshot.add_date - keep).delete()
+    return snapshot
+
+
+def latest_statistics_snapshot():
+    """Latest snapshot, taken now if there is none yet"""
+
+    return StatisticsSnapshot.objects.order_by("-add_date").first() or take_statistics_snapshot(refresh_storage=True)
@@ -4,7 +4,7 @@ import re
 import shutil
 import subprocess
 import tempfile
-from datetime import datetime, timedelta
+from datetime import datetime
 
 from celery import Task
 from celery import shared_task as task
@@ -19,9 +19,15 @@ from django.core.files import File
 from django.db.models import Q
 
 from actions.models import USER_MEDIA_ACTIONS, MediaAction
+from actions.rollups import purge_media_actions, rollup_media_actions
 from users.models import User
 
+from .autocomplete import rebuild_suggestions
 from .backends import FFmpegBackend
+from .cdn_balancer import compile_routing_table, configured_edges
+from .cdn_health import check_edges
+from .content_versions import bump_versions
+from .counters import COUNTER_ACTIONS, flush_media_counters, increment_media_counter, reconcile_media_counts
 from .exceptions import VideoEncodingError
 from .helpers import (
     calculate_seconds,
@@ -37,7 +43,25 @@ from .helpers import (
     trim_video_method,
 )
 from .methods import copy_video, list_tasks, notify_users, pre_save_action
-from .models import Category, EncodeProfile, Encoding, Media, Rating, Tag, VideoTrimRequest
+from .models import (
+    Category,
+    EncodeProfile,
+    Encoding,
+    Media,
+    MediaDeletionJob,
+    Rating,
+    Tag,
+    VideoTrimRequest,
+    parse_hls_renditions,
+)
+from .media_changes import MEDIA_CHANGES_PENDING_KEY, RELATED_FIELDS, SEARCHABLE_FIELDS, SITEMAP_FIELDS, take_media_changes
+from .media_deletion import claim_media_deletion_job, remove_job_files, run_media_deletion_job, stale_media_deletion_jobs
+from .recommendations import refresh_all_content_related, refresh_content_related, update_related_media
+from .search_cache import invalidate_media_searches
+from .search_index import index_dirty_media
+from .sitemaps import sitemap_scopes
+from .statistics_snapshot import take_statistics_snapshot
+from .trending import update_trending_scores
 
 logger = get_task_logger(__name__)
 
@@ -520,9 +544,10 @@ def create_hls(friendly_token):
             output_dir = existing_output_dir
         pp = os.path.join(output_dir, "master.m3u8")
         if os.path.exists(pp):
-            if media.hls_file != pp:
-                media.hls_file = pp
-                media.save(update_fields=["hls_file"])
+            # parse the playlists once here, hls_info only reads the result
+            media.hls_file = pp
+            media.hls_renditions = parse_hls_renditions(pp)
+            media.save(update_fields=["hls_file", "hls_renditions"])
     return True
 
 
@@ -540,11 +565,11 @@ def post_trim_action(friendly_token):
     media.set_media_type()
     encodings = media.encodings.filter(status="success", profile__extension="mp4", chunk=False)
     if encodings:
-        from .models import generate_smil
+        from .models import schedule_smil_generation
 
         media.encoding_status = "waiting_smil"
         media.save(update_fields=["encoding_status"])
-        generate_smil(media)
+        schedule_smil_generation(media)
 
         media.produce_thumbnails_from_video()
         produce_sprite_from_video.delay(friendly_token)
@@ -558,6 +583,24 @@ def post_trim_action(friendly_token):
     return True
 
 
+@task(name="generate_smil", queue="short_tasks")
+def generate_smil_task(friendly_token):
+    """Debounced SMIL generation, scheduled through schedule_smil_generation"""
+
+    from .models import SMIL_PENDING_CACHE_KEY, generate_smil
+
+    # release the debounce key before reading encodings, so that
+    # anything finishing from now on schedules a new run
+    cache.delete(SMIL_PENDING_CACHE_KEY.format(friendly_token))
+    try:
+        media = Media.objects.get(friendly_token=friendly_token)
+    except Media.DoesNotExist:
+        logger.info("Media with friendly token %s not found", friendly_token)
+        return False
+
+    return bool(generate_smil(media))
+
+
 @task(name="video_trim_task", bind=True, queue="short_tasks", soft_time_limit=600)
 def video_trim_task(self, trim_request_id):
     try:
@@ -786,11 +829,6 @@ def save_user_action(user_or_session, friendly_token=None, action="watch", extra
         ):
             return False
 
-    if action == "watch":
-        if user:
-            MediaAction.objects.filter(user=user, media=media, action="watch").delete()
-        else:
-            MediaAction.objects.filter(session_key=session_key, media=media, action="watch").delete()
     if action == "rate":
         try:
             score = extra_info.get("score")
@@ -815,6 +853,8 @@ def save_user_action(user_or_session, friendly_token=None, action="watch", extra
             # rating_category?
             return False
 
+    # actions are append-only, rollup_media_actions counts them into
+    # hourly and daily rollups
     ma = MediaAction(
         user=user,
         session_key=session_key,
@@ -825,12 +865,10 @@ def save_user_action(user_or_session, friendly_token=None, action="watch", extra
     )
     ma.save()
 
-    if action == "watch":
-        media.views += 1
-        Media.objects.filter(friendly_token=friendly_token).update(views=media.views)
-
-        # update field without calling save, to avoid post_save signals being triggered
-        # same in other actions
+    # counters are buffered and flushed in batches by flush_media_counters,
+    # without calling save, to avoid post_save signals being triggered
+    if action in COUNTER_ACTIONS:
+        increment_media_counter(media.id, COUNTER_ACTIONS[action])
 
     elif action == "report":
         media.reported_times += 1
@@ -844,51 +882,153 @@ def save_user_action(user_or_session, friendly_token=None, action="watch", extra
             action="media_reported",
             extra=extra_info,
         )
-    elif action == "like":
-        media.likes += 1
-        Media.objects.filter(friendly_token=friendly_token).update(likes=media.likes)
-    elif action == "dislike":
-        media.dislikes += 1
-        Media.objects.filter(friendly_token=friendly_token).update(dislikes=media.dislikes)
 
     return True
 
 
-@task(name="get_list_of_popular_media", queue="long_tasks")
-def get_list_of_popular_media():
-    """Experimental task for preparing media listing
-    for index page / recommended section
-    calculate and return the top 50 popular media, based on two rules
-    X = the top 25 videos that have the most views during the last week
-    Y = the most recent 25 videos that have been liked over the last 6 months
-    """
-
-    valid_media_x = {}
-    valid_media_y = {}
-    basic_query = Q(listable=True)
-    media_x = Media.objects.filter(basic_query).values("friendly_token")
-
-    period_x = datetime.now() - timedelta(days=7)
-    period_y = datetime.now() - timedelta(days=30 * 6)
-
-    for media in media_x:
-        ft = media["friendly_token"]
-        num = MediaAction.objects.filter(action_date__gte=period_x, action="watch", media__friendly_token=ft).count()
-        if num:
-            valid_media_x[ft] = num
-        num = MediaAction.objects.filter(action_date__gte=period_y, action="like", media__friendly_token=ft).count()
-        if num:
-            valid_media_y[ft] = num
-
-    x = sorted(valid_media_x.items(), key=lambda kv: kv[1], reverse=True)[:25]
-    y = sorted(valid_media_y.items(), key=lambda kv: kv[1], reverse=True)[:25]
-
-    media_ids = [a[0] for a in x]
-    media_ids.extend([a[0] for a in y])
-    media_ids = list(set(media_ids))
-    cache.set("popular_media_ids", media_ids, 60 * 60 * 12)
-    logger.info("saved popular media ids")
+@task(name="flush_media_counters", queue="short_tasks")
+def flush_media_counters_task():
+    """Apply buffered view, like and dislike counters"""
+
+    if not cache.add("media_counters_lock", 1, 60 * 5):
+        return False
+    try:
+        flush_media_counters()
+    finally:
+        cache.delete("media_counters_lock")
+    return True
+
+
+@task(name="rollup_media_actions", queue="long_tasks")
+def rollup_media_actions_task():
+    """Count user actions into hourly and daily rollups, add them to the
+    trending scores, then delete the watch actions past their retention"""
+
+    if not cache.add("media_action_rollup_lock", 1, 60 * 60):
+        return False
+    try:
+        rollup_media_actions()
+        update_trending_scores()
+        purge_media_actions()
+    finally:
+        cache.delete("media_action_rollup_lock")
+    return True
+
+
+@task(name="update_related_media", queue="long_tasks")
+def update_related_media_task():
+    """Compute the related media lists of all media"""
+
+    if settings.RELATED_MEDIA_STRATEGY == "author":
+        return False
+    refresh_all_content_related()
+    if settings.RELATED_MEDIA_STRATEGY == "calculated":
+        update_related_media()
+    return True
+
+
+@task(name="process_media_changes", queue="short_tasks")
+def process_media_changes(media_id):
+    """Maintenance depending on the fields changed on a media since the
+    last run, scheduled through schedule_media_changes"""
+
+    # release the debounce key before taking the changes, so that
+    # changes from now on schedule a new run
+    cache.delete(MEDIA_CHANGES_PENDING_KEY.format(media_id))
+    fields = take_media_changes(media_id)
+    media = Media.objects.filter(id=media_id).first()
+    if not (fields and media):
+        return False
+
+    # media_save already dropped the media card and detail documents
+    if media.listable or fields & SITEMAP_FIELDS:
+        bump_versions(sitemap_scopes("media", [media.id]))
+    if media.is_searchable or fields & SEARCHABLE_FIELDS:
+        invalidate_media_searches(media)
+    if fields & RELATED_FIELDS and settings.RELATED_MEDIA_STRATEGY != "author":
+        refresh_content_related([media.id])
+    return True
+
+
+@task(name="delete_media_job", queue="long_tasks")
+def delete_media_job(job_uid):
+    """Delete the media of a MediaDeletionJob in batches, or resume a job
+    whose worker stopped"""
+
+    job = claim_media_deletion_job(job_uid)
+    if not job:
+        return False
+    try:
+        run_media_deletion_job(job)
+    except Exception as e:
+        logger.exception("Deletion job %s failed", job_uid)
+        MediaDeletionJob.objects.filter(id=job.id).update(status="fail", logs=str(e))
+        return False
+    return True
+
+
+@task(name="resume_media_deletion_jobs", queue="short_tasks")
+def resume_media_deletion_jobs():
+    """Requeue the deletion jobs left running by stopped workers"""
+
+    uids = stale_media_deletion_jobs()
+    for uid in uids:
+        logger.info("Resuming deletion job %s", uid)
+        delete_media_job.delay(uid)
+    return len(uids)
+
 
+@task(name="remove_media_files", queue="short_tasks")
+def remove_media_files(job_id, paths):
+    """Remove the files of media deleted by a deletion job"""
+
+    remove_job_files(job_id, paths)
+    return True
+
+
+@task(name="compile_cdn_routing_table", queue="long_tasks")
+def compile_cdn_routing_table():
+    """Compile the prefix routes of the CDN balancer from the GeoLite2 databases"""
+
+    prefixes = compile_routing_table()
+    logger.info("Compiled %s CDN balancer prefixes", prefixes)
+    return True
+
+
+@task(name="check_cdn_edges", queue="short_tasks", soft_time_limit=60)
+def check_cdn_edges():
+    """Probe the CDN edges of the balancer and store their health"""
+
+    if not cache.add("cdn_edge_health_lock", 1, 60):
+        return False
+    try:
+        health = check_edges(configured_edges())
+    finally:
+        cache.delete("cdn_edge_health_lock")
+    down = sorted(host for host, state in health.items() if not state["healthy"])
+    if down:
+        logger.warning("CDN edges down: %s", ", ".join(down))
+    return True
+
+
+@task(name="reconcile_media_counts", queue="long_tasks")
+def reconcile_media_counts_task():
+    """Recount media_count of users, categories and tags"""
+
+    reconcile_media_counts()
+    return True
+
+
+@task(name="take_statistics_snapshot", queue="long_tasks")
+def take_statistics_snapshot_task():
+    """Compute the management dashboard statistics"""
+
+    if not cache.add("statistics_snapshot_lock", 1, 60 * 30):
+        return False
+    try:
+        take_statistics_snapshot()
+    finally:
+        cache.delete("statistics_snapshot_lock")
     return True
 
 
@@ -925,6 +1065,27 @@ def update_listings_thumbnails():
     return True
 
 
+@task(name="update_search_index", queue="short_tasks")
+def update_search_index():
+    """Recompute search vectors for media marked dirty on save"""
+
+    # avoid overlapping runs when a previous batch is still going
+    if not cache.add("search_index_lock", 1, timeout=60 * 10):
+        return False
+    try:
+        updated = index_dirty_media(max_batches=getattr(settings, "SEARCH_INDEX_MAX_BATCHES", 20))
+    finally:
+        cache.delete("search_index_lock")
+    return updated
+
+
+@task(name="rebuild_search_suggestions", queue="short_tasks")
+def rebuild_search_suggestions():
+    """Refresh the typeahead suggestions table"""
+
+    return rebuild_suggestions()
+
+
 @task_revoked.connect
 def task_sent_handler(sender=None, headers=None, body=None, **kwargs):
     # For encode_media tasks that are revoked,
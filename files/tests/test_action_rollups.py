@@ -0,0 +1,59 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from actions.models import MediaAction, MediaActionRollup
+from actions.rollups import purge_media_actions, rollup_media_actions
+from files.models import Media
+from files.tests.user_utils import create_account
+
+
+class MediaActionRollupTests(TestCase):
+    @patch("files.models.Media.media_init", return_value=True)
+    def setUp(self, media_init):
+        self.user = create_account(username="rollups", password="pass1234", email="rollups@example.com")
+        self.media = Media.objects.create(user=self.user, title="Video", media_file="original/video.mp4")
+        Media.objects.filter(id=self.media.id).update(listable=True)
+        self.now = timezone.localtime().replace(minute=30, second=0, microsecond=0)
+
+    def _action(self, action, hours_ago):
+        ma = MediaAction.objects.create(media=self.media, session_key="a" * 32, action=action)
+        # action_date is auto_now_add
+        MediaAction.objects.filter(id=ma.id).update(action_date=self.now - timedelta(hours=hours_ago))
+
+    def _daily_total(self, action):
+        return MediaActionRollup.objects.filter(media=self.media, action=action, period="day").aggregate(total=Sum("count"))["total"]
+
+    def test_complete_hours_are_rolled_up_idempotently(self):
+        for hours_ago in (3, 3, 2):
+            self._action("watch", hours_ago)
+        self._action("like", 2)
+        # current hour, not complete yet
+        self._action("watch", 0)
+
+        rollup_media_actions(now=self.now)
+        rollup_media_actions(now=self.now)
+
+        hours = MediaActionRollup.objects.filter(media=self.media, action="watch", period="hour")
+        self.assertEqual(sorted(hours.values_list("count", flat=True)), [1, 2])
+        self.assertEqual(self._daily_total("watch"), 3)
+        self.assertEqual(self._daily_total("like"), 1)
+
+        rollup_media_actions(now=self.now + timedelta(hours=1))
+        self.assertEqual(self._daily_total("watch"), 4)
+
+    @override_settings(MEDIA_ACTION_RETENTION_DAYS=2)
+    def test_only_rolled_up_watch_actions_past_retention_are_purged(self):
+        self._action("watch", 24 * 5)
+        self._action("like", 24 * 5)
+        self._action("watch", 1)
+        self.assertEqual(purge_media_actions(now=self.now), 0)
+
+        rollup_media_actions(now=self.now)
+        self.assertEqual(purge_media_actions(now=self.now), 1)
+
+        self.assertEqual(MediaAction.objects.filter(media=self.media).count(), 2)
+        self.assertEqual(self._daily_total("watch"), 2)
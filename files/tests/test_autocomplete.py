@@ -0,0 +1,38 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from files.autocomplete import AUTOCOMPLETE_VERSION_KEY, rebuild_suggestions
+from files.models import Media, Tag
+from files.tests.user_utils import create_account
+
+
+class AutocompleteTests(TestCase):
+    @patch("files.models.Media.media_init", return_value=True)
+    def setUp(self, media_init):
+        cache.delete(AUTOCOMPLETE_VERSION_KEY)
+        self.user = create_account(username="typeahead", password="pass1234", email="typeahead@example.com")
+        Media.objects.create(user=self.user, title="Gran concierto de rock", media_file="original/video.mp4")
+        Media.objects.create(user=self.user, title="Privado", media_file="original/video2.mp4")
+        Media.objects.filter(title="Privado").update(state="private")
+        Media.objects.filter(title="Gran concierto de rock").update(state="public", is_reviewed=True, views=50)
+        Tag.objects.create(title="conciertos", media_count=3)
+        rebuild_suggestions()
+        self.client.force_login(self.user)
+
+    def test_autocomplete_matches_word_prefixes_of_public_titles_and_tags(self):
+        response = self.client.get("/api/v1/search/autocomplete", {"q": "Conci"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            [{"title": "Gran concierto de rock", "type": "media"}, {"title": "conciertos", "type": "tag"}],
+        )
+        self.assertEqual(self.client.get("/api/v1/search/autocomplete", {"q": "priv"}).json(), [])
+
+    def test_show_titles_is_served_by_autocomplete(self):
+        response = self.client.get("/api/v1/search", {"q": "rock", "show": "titles"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{"title": "Gran concierto de rock", "type": "media"}])
@@ -1,8 +1,19 @@
+import ipaddress
+import time
 from unittest.mock import patch
 
+from django.core.cache import cache
 from django.test import RequestFactory, TestCase, override_settings
 
-from files.cdn_balancer import get_balanced_hosts_for_request
+from files.cdn_balancer import (
+    LEARNED_ROUTE_KEY,
+    ROUTING_TABLE_KEY,
+    balancer_cache_stats,
+    compile_routing_table,
+    get_balanced_hosts_for_request,
+    reset_balancer_cache,
+)
+from files.cdn_routing import PrefixTrie, compile_routes
 
 
 class CdnBalancerTests(TestCase):
@@ -22,3 +33,146 @@ class CdnBalancerTests(TestCase):
         self.assertEqual(balanced.live_host, "claro.02.cl.cdnz.cl")
         self.assertEqual(balanced.client_ip, "186.79.196.48")
         self.assertEqual(balanced.decision, "fallback_cdn:no_geoip2")
+
+
+def _network(value):
+    return ipaddress.ip_network(value)
+
+
+@override_settings(
+    CDN_BALANCER_ENABLED=True,
+    CDN_BALANCER_ASN_DB_PATH="/geoip/GeoLite2-ASN.mmdb",
+    CDN_BALANCER_NEGATIVE_CACHE_TTL_SECONDS=30,
+    CDN_BALANCER_ROUTES_REFRESH_SECONDS=300,
+)
+@patch("files.cdn_balancer.geoip2", object())
+class CdnBalancerRoutingTests(TestCase):
+    def setUp(self):
+        reset_balancer_cache()
+        cache.delete(ROUTING_TABLE_KEY)
+        cache.delete_pattern(LEARNED_ROUTE_KEY.format("*"))
+        self.addCleanup(reset_balancer_cache)
+        self.addCleanup(cache.delete, ROUTING_TABLE_KEY)
+        self.addCleanup(cache.delete_pattern, LEARNED_ROUTE_KEY.format("*"))
+
+    def _balance(self, ip="186.79.196.48"):
+        return get_balanced_hosts_for_request(RequestFactory().get("/", HTTP_X_REAL_IP=ip))
+
+    def test_compiled_prefixes_route_without_lookups(self):
+        routes = [
+            (_network("186.79.0.0/16"), ("claro", 27995, None)),
+            (_network("190.20.0.0/16"), ("movistar:default", 7418, None)),
+            (_network("190.20.128.0/20"), ("movistar:santiago", 7418, "Santiago")),
+        ]
+        with patch("files.cdn_balancer.compile_mmdb_routes", return_value=routes):
+            self.assertEqual(compile_routing_table(), 3)
+
+        with patch("files.cdn_balancer._lookup_asn_city") as lookup:
+            claro = self._balance("186.79.196.48")
+            santiago = self._balance("190.20.130.1")
+            movistar = self._balance("190.20.1.1")
+
+        lookup.assert_not_called()
+        self.assertEqual((claro.decision, claro.vod_host, claro.asn), ("claro", "claro-vtrlolla-vod.cl.cdnz.cl", 27995))
+        self.assertEqual((santiago.decision, santiago.city), ("movistar:santiago", "Santiago"))
+        self.assertEqual(movistar.decision, "movistar:default")
+        self.assertEqual(balancer_cache_stats()["prefix_hits"], 3)
+
+    def test_prefixes_outside_the_table_are_learned(self):
+        with patch("files.cdn_balancer._lookup_asn_city", return_value=(64500, "Lima", _network("200.48.0.0/20"))) as lookup:
+            first = self._balance("200.48.1.1")
+            second = self._balance("200.48.15.200")
+
+        lookup.assert_called_once()
+        self.assertEqual((first.decision, second.decision), ("default:geo", "default:geo"))
+        stats = balancer_cache_stats()
+        self.assertEqual((stats["learned_hits"], stats["misses"], stats["learned_prefixes"]), (1, 1, 1))
+
+    def test_prefixes_learned_by_other_processes_are_shared_through_redis(self):
+        with patch("files.cdn_balancer._lookup_asn_city", return_value=(27995, None, _network("200.48.0.0/20"))):
+            self._balance("200.48.1.1")
+        self.assertIsNotNone(cache.get(LEARNED_ROUTE_KEY.format("200.48.0.0/20")))
+        # another process: nothing learned locally
+        reset_balancer_cache()
+
+        with patch("files.cdn_balancer._lookup_asn_city") as lookup:
+            first = self._balance("200.48.15.200")
+            second = self._balance("200.48.2.2")
+
+        lookup.assert_not_called()
+        self.assertEqual((first.decision, second.decision), ("claro", "claro"))
+        stats = balancer_cache_stats()
+        self.assertEqual((stats["shared_hits"], stats["learned_hits"], stats["learned_prefixes"]), (1, 1, 1))
+
+    def test_unknown_networks_are_cached_with_the_negative_ttl(self):
+        with patch("files.cdn_balancer._lookup_asn_city", return_value=(None, None, _network("10.0.0.0/8"))) as lookup:
+            self._balance("10.1.1.1")
+            balanced = self._balance("10.2.2.2")
+            self.assertEqual(balanced.decision, "fallback_cdn:no_geo_match")
+            self.assertLessEqual(cache.ttl(LEARNED_ROUTE_KEY.format("10.0.0.0/8")), 30)
+            cache.delete(LEARNED_ROUTE_KEY.format("10.0.0.0/8"))
+            with patch("files.cdn_balancer.time.monotonic", return_value=time.monotonic() + 31):
+                self._balance("10.2.2.2")
+
+        self.assertEqual(lookup.call_count, 2)
+        self.assertEqual(balancer_cache_stats()["negative"], 3)
+
+    def test_learned_prefixes_evict_the_least_recently_used(self):
+        with override_settings(CDN_BALANCER_LEARNED_PREFIXES_MAX=2), patch("files.cdn_balancer._lookup_asn_city") as lookup:
+            for ip in ("200.48.0.1", "200.49.0.1", "200.48.0.1", "200.50.0.1"):
+                lookup.return_value = (64500, "", _network(f"{ip}/32"))
+                self._balance(ip)
+            cache.delete_pattern(LEARNED_ROUTE_KEY.format("*"))
+
+            self._balance("200.48.0.1")
+            self.assertEqual(lookup.call_count, 3)
+            lookup.return_value = (64500, "", _network("200.49.0.1/32"))
+            self._balance("200.49.0.1")
+            self.assertEqual(lookup.call_count, 4)
+
+        self.assertEqual(balancer_cache_stats()["learned_prefixes"], 2)
+
+
+class PrefixRoutingTests(TestCase):
+    def test_longest_prefix_wins(self):
+        trie = PrefixTrie()
+        trie.insert("10.0.0.0/8", "wide")
+        trie.insert("10.1.0.0/16", "narrow")
+        trie.insert("2800:300::/24", "v6")
+
+        self.assertEqual(trie.lookup("10.1.2.3"), "narrow")
+        self.assertEqual(trie.lookup("10.2.2.3"), "wide")
+        self.assertEqual(trie.lookup("2800:300:1::1"), "v6")
+        self.assertIsNone(trie.lookup("11.0.0.1"))
+        self.assertEqual(len(trie), 3)
+
+        trie.remove("10.1.0.0/16")
+        self.assertEqual(trie.lookup("10.1.2.3"), "wide")
+        self.assertEqual(len(trie), 2)
+
+    def test_city_routed_networks_are_split_by_city(self):
+        cities = {
+            _network("190.20.0.0/18"): "Santiago",
+            _network("190.20.64.0/18"): None,
+            _network("190.20.128.0/17"): "Antofagasta",
+        }
+
+        def city_prefix(address):
+            return next((city, network) for network, city in cities.items() if address in network)
+
+        routes = compile_routes(
+            [(_network("190.20.0.0/16"), 7418), (_network("186.79.0.0/16"), 27995)],
+            lambda asn, city: f"{asn}:{city}",
+            {7418},
+            city_prefix,
+        )
+
+        self.assertEqual(
+            [(str(network), route) for network, (route, asn, city) in routes],
+            [
+                ("190.20.0.0/18", "7418:Santiago"),
+                ("190.20.64.0/18", "7418:None"),
+                ("190.20.128.0/17", "7418:Antofagasta"),
+                ("186.79.0.0/16", "27995:None"),
+            ],
+        )
@@ -0,0 +1,137 @@
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from files.cdn_balancer import _hosts_for_route, configured_edges
+from files.cdn_health import EDGE_HEALTH_KEY, check_edges, choose_edge, health_urls, reset_edge_health
+from files.models import Media
+from files.tests.user_utils import create_account
+
+
+def _stand_in(status):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _closed_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@override_settings(
+    CDN_BALANCER_HEALTH_ENABLED=True,
+    CDN_BALANCER_HEALTH_URLS={"vod": "http://{host}/vod/playlist.m3u8", "live": "http://{host}/live/playlist.m3u8"},
+    CDN_BALANCER_HEALTH_TIMEOUT_SECONDS=1,
+    CDN_BALANCER_HEALTH_MAX_FAILURES=2,
+    CDN_BALANCER_HEALTH_REFRESH_SECONDS=0,
+    CDN_BALANCER_FALLBACK_TO_CDN=True,
+    CDN_BALANCER_FALLBACK_VOD_HOST="fallback-vod.example.com",
+    CDN_BALANCER_FALLBACK_LIVE_HOST="fallback-live.example.com",
+)
+class CdnHealthTests(TestCase):
+    def setUp(self):
+        cache.delete(EDGE_HEALTH_KEY)
+        reset_edge_health()
+        self.addCleanup(reset_edge_health)
+        self.addCleanup(cache.delete, EDGE_HEALTH_KEY)
+
+        servers = {"up": _stand_in(200), "forbidden": _stand_in(403), "missing": _stand_in(404), "error": _stand_in(503)}
+        for server in servers.values():
+            self.addCleanup(server.server_close)
+            self.addCleanup(server.shutdown)
+        self.hosts = {name: f"127.0.0.1:{server.server_address[1]}" for name, server in servers.items()}
+        self.hosts["dead"] = f"127.0.0.1:{_closed_port()}"
+
+    def test_edges_down_after_repeated_failures(self):
+        edges = {"vod": list(self.hosts.values())}
+        check_edges(edges)
+        health = check_edges(edges)
+
+        self.assertTrue(health[self.hosts["up"]]["healthy"])
+        # tokens answer 403 on a serving edge, a missing playlist does not
+        self.assertTrue(health[self.hosts["forbidden"]]["healthy"])
+        self.assertFalse(health[self.hosts["missing"]]["healthy"])
+        self.assertFalse(health[self.hosts["error"]]["healthy"])
+        self.assertFalse(health[self.hosts["dead"]]["healthy"])
+        self.assertEqual(health[self.hosts["dead"]]["failures"], 2)
+
+        picked = {choose_edge([self.hosts["up"], self.hosts["dead"], self.hosts["error"]]) for _ in range(20)}
+        self.assertEqual(picked, {self.hosts["up"]})
+
+    @override_settings(CDN_BALANCER_HEALTH_URLS={}, WOWZA_VOD_SMIL_PATH_TEMPLATE="vod/smil:{media_id}.smil/playlist.m3u8")
+    @patch("files.models.Media.media_init", return_value=True)
+    def test_vod_edges_are_probed_on_the_playlist_of_a_listable_video(self, media_init):
+        self.assertIsNone(health_urls()["vod"])
+        check_edges({"vod": [self.hosts["dead"]]})
+        self.assertEqual(cache.get(EDGE_HEALTH_KEY), {})
+
+        user = create_account(username="cdnhealth", password="pass1234", email="cdnhealth@example.com")
+        media = Media.objects.create(user=user, title="Video", media_file="original/video.mp4", media_type="video")
+        Media.objects.filter(id=media.id).update(listable=True)
+
+        self.assertEqual(health_urls()["vod"], f"https://{{host}}/vod/smil:{media.friendly_token}.smil/playlist.m3u8")
+
+    def test_unchecked_edges_count_as_healthy(self):
+        self.assertIn(choose_edge(["a.example.com", "b.example.com"]), {"a.example.com", "b.example.com"})
+
+    def test_routes_fail_over_to_healthy_default_edges_first(self):
+        routes = {
+            "telsur": ([self.hosts["dead"], self.hosts["error"]], [self.hosts["up"]]),
+            "default:geo": ([self.hosts["error"], self.hosts["forbidden"]], [self.hosts["up"]]),
+        }
+        for _ in range(2):
+            check_edges({"vod": [self.hosts["dead"], self.hosts["error"], self.hosts["forbidden"]], "live": [self.hosts["up"]]})
+
+        with patch("files.cdn_balancer._ROUTE_HOSTS", routes):
+            balanced = _hosts_for_route("telsur", 14117, None)
+
+        self.assertEqual(balanced.vod_host, self.hosts["forbidden"])
+        self.assertEqual(balanced.live_host, self.hosts["up"])
+        self.assertEqual(balanced.decision, "telsur:failover")
+
+    def test_the_fallback_cdn_is_health_checked_too(self):
+        routes = {
+            "telsur": ([self.hosts["dead"]], [self.hosts["up"]]),
+            "default:geo": ([self.hosts["error"]], [self.hosts["up"]]),
+        }
+        with patch("files.cdn_balancer._ROUTE_HOSTS", routes):
+            self.assertIn("fallback-vod.example.com", configured_edges()["vod"])
+            self.assertIn("fallback-live.example.com", configured_edges()["live"])
+
+            with patch("files.cdn_health.probe_edge", return_value=(False, 1.0)):
+                for _ in range(2):
+                    check_edges({"vod": [self.hosts["dead"], self.hosts["error"]]})
+            # the fallback is healthy while unchecked
+            self.assertEqual(_hosts_for_route("telsur", 14117, None).vod_host, "fallback-vod.example.com")
+
+            with patch("files.cdn_health.probe_edge", return_value=(False, 1.0)):
+                for _ in range(2):
+                    check_edges({"vod": [self.hosts["dead"], self.hosts["error"], "fallback-vod.example.com"]})
+            # nothing is healthy: the fallback stays as the last resort
+            self.assertEqual(_hosts_for_route("telsur", 14117, None).vod_host, "fallback-vod.example.com")
+
+    def test_edges_recover(self):
+        with patch("files.cdn_health.probe_edge", return_value=(False, 1.0)):
+            check_edges({"vod": ["edge.example.com"]})
+            check_edges({"vod": ["edge.example.com"]})
+        self.assertIsNone(choose_edge(["edge.example.com"]))
+
+        with patch("files.cdn_health.probe_edge", return_value=(True, 0.05)):
+            for _ in range(3):
+                check_edges({"vod": ["edge.example.com"]})
+        self.assertEqual(choose_edge(["edge.example.com"]), "edge.example.com")
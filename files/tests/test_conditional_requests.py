@@ -0,0 +1,132 @@
+import gzip
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from files.feeds import IndexRSSFeed
+from files.models import Comment, Media, Playlist, Rating, RatingCategory
+from payments.models import DownloadEntitlement
+from files.tests.user_utils import create_account
+
+
+class ConditionalRequestTests(TestCase):
+    @patch("files.models.Media.media_init", return_value=True)
+    def setUp(self, media_init):
+        self.user = create_account(username="etags", password="pass1234", email="etags@example.com", is_editor=True)
+        self.media = Media.objects.create(user=self.user, title="Video", media_file="original/video.mp4", state="public")
+        Media.objects.filter(id=self.media.id).update(listable=True)
+        self.client.force_login(self.user)
+
+    def _revalidate(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Last-Modified", response)
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]), response["ETag"]
+
+    def test_media_list_is_not_modified_until_media_changes(self):
+        response, etag = self._revalidate("/api/v1/media")
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.media.title = "Renamed"
+            self.media.save()
+
+        self.assertEqual(self.client.get("/api/v1/media", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_media_detail_revalidates_on_counter_updates(self):
+        url = f"/api/v1/media/{self.media.friendly_token}"
+        response, etag = self._revalidate(url)
+        self.assertEqual(response.status_code, 304)
+
+        Media.objects.filter(id=self.media.id).update(views=10)
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @override_settings(VIDEO_DOWNLOAD_ENABLED=True, VIDEO_DOWNLOAD_REQUIRES_PAYMENT=True)
+    def test_media_detail_revalidates_on_viewer_entitlements_and_ratings(self):
+        Media.objects.filter(id=self.media.id).update(media_type="video", allow_download=True)
+        url = f"/api/v1/media/{self.media.friendly_token}"
+        response, etag = self._revalidate(url)
+        self.assertEqual(response.status_code, 304)
+        self.assertIn("private", response["Cache-Control"])
+
+        entitlement = DownloadEntitlement.objects.create(user=self.user, media=self.media, expires_at=timezone.now() + timedelta(days=1))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data["download_entitled"])
+        self.assertIn("private", response["Cache-Control"])
+        etag = response["ETag"]
+
+        # expiry changes no row, the entitlement itself is validated
+        DownloadEntitlement.objects.filter(id=entitlement.id).update(expires_at=timezone.now() - timedelta(minutes=1))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data["download_entitled"])
+        etag = response["ETag"]
+
+        category = RatingCategory.objects.create(title="Quality")
+        Rating.objects.create(user=self.user, media=self.media, rating_category=category, score=5)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_comments_revalidate_on_new_comments(self):
+        url = f"/api/v1/media/{self.media.friendly_token}/comments"
+        response, etag = self._revalidate(url)
+        self.assertEqual(response.status_code, 304)
+
+        Comment.objects.create(user=self.user, media=self.media, text="hello")
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_playlist_revalidates_when_media_is_added(self):
+        playlist = Playlist.objects.create(user=self.user, title="List")
+        url = f"/api/v1/playlists/{playlist.friendly_token}"
+        response, etag = self._revalidate(url)
+        self.assertEqual(response.status_code, 304)
+
+        playlist.playlistmedia_set.create(media=self.media, ordering=1)
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_rss_feed_answers_conditional_requests(self):
+        response, _ = self._revalidate("/rss/")
+
+        self.assertEqual(response.status_code, 304)
+
+
+class RSSFeedCacheTests(TestCase):
+    @patch("files.models.Media.media_init", return_value=True)
+    def setUp(self, media_init):
+        self.user = create_account(username="feeds", password="pass1234", email="feeds@example.com")
+        self.media = Media.objects.create(user=self.user, title="First", media_file="original/video.mp4")
+        Media.objects.filter(id=self.media.id).update(state="public", encoding_status="success")
+        # the save publishes it and starts a new search cache generation
+        self.media.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.media.save()
+        self.client.force_login(self.user)
+
+    def test_feed_is_rendered_once_until_media_is_published(self):
+        with patch.object(IndexRSSFeed, "get_feed", autospec=True, side_effect=IndexRSSFeed.get_feed) as get_feed:
+            first = self.client.get("/rss/")
+            second = self.client.get("/rss/")
+            self.assertEqual(get_feed.call_count, 1)
+            self.assertEqual(first.content, second.content)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.media.title = "Second"
+                self.media.save()
+
+            third = self.client.get("/rss/")
+            self.assertEqual(get_feed.call_count, 2)
+        self.assertIn(b"Second", third.content)
+
+    def test_gzip_body_is_served_when_accepted(self):
+        plain = self.client.get("/rss/")
+        compressed = self.client.get("/rss/", HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertEqual(compressed["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertNotEqual(compressed["ETag"], plain["ETag"])
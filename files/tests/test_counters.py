@@ -0,0 +1,57 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+from django_redis import get_redis_connection
+
+from actions.models import MediaAction
+from files.counters import COUNTER_FIELDS, COUNTER_KEY, FLUSHING_KEY, flush_media_counters, increment_media_counter, pending_media_counters
+from files.models import Media
+from files.tasks import save_user_action
+from files.tests.user_utils import create_account
+
+
+class MediaCountersTests(TestCase):
+    @patch("files.models.Media.media_init", return_value=True)
+    def setUp(self, media_init):
+        redis = get_redis_connection("default")
+        for field in COUNTER_FIELDS:
+            redis.delete(COUNTER_KEY.format(field), FLUSHING_KEY.format(field))
+        self.user = create_account(username="counters", password="pass1234", email="counters@example.com")
+        self.media = Media.objects.create(user=self.user, title="Video", media_file="original/video.mp4")
+
+    def test_increments_are_applied_on_flush(self):
+        for _ in range(5):
+            increment_media_counter(self.media.id, "views")
+        increment_media_counter(self.media.id, "likes")
+
+        self.media.refresh_from_db()
+        views, likes = self.media.views, self.media.likes
+        self.assertEqual(pending_media_counters(self.media.id), {"views": 5, "likes": 1, "dislikes": 0})
+
+        self.assertEqual(flush_media_counters(), 1)
+        self.media.refresh_from_db()
+        self.assertEqual((self.media.views, self.media.likes), (views + 5, likes + 1))
+        self.assertEqual(pending_media_counters(self.media.id)["views"], 0)
+
+    def test_flush_keeps_increments_that_arrive_meanwhile(self):
+        views = self.media.views
+        increment_media_counter(self.media.id, "views", 3)
+        # a previous flush failed after taking its deltas
+        redis = get_redis_connection("default")
+        redis.rename(COUNTER_KEY.format("views"), FLUSHING_KEY.format("views"))
+        increment_media_counter(self.media.id, "views", 2)
+
+        flush_media_counters()
+        self.media.refresh_from_db()
+        self.assertEqual(self.media.views, views + 3)
+
+        flush_media_counters()
+        self.media.refresh_from_db()
+        self.assertEqual(self.media.views, views + 5)
+
+    def test_watch_actions_buffer_views(self):
+        for session, remote_ip in [("a" * 32, "10.0.0.1"), ("b" * 32, "10.0.0.2")]:
+            save_user_action({"user_session": session, "remote_ip_addr": remote_ip}, friendly_token=self.media.friendly_token)
+
+        self.assertEqual(pending_media_counters(self.media.id)["views"], 2)
+        self.assertEqual(MediaAction.objects.filter(media=self.media, action="watch").count(), 2)
@@ -0,0 +1,58 @@
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from files.models import Media, parse_hls_renditions
+from files.tests.user_utils import create_account
+
+MASTER_PLAYLIST = """#EXTM3U
+#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360
+media-1/stream.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=2000000,RESOLUTION=1280x720
+media-2/stream.m3u8
+#EXT-X-I-FRAME-STREAM-INF:BANDWIDTH=100000,RESOLUTION=640x360,URI="media-1/iframes.m3u8"
+"""
+
+
+class HLSRenditionsTests(TestCase):
+    @patch("files.models.Media.media_init", return_value=True)
+    def setUp(self, media_init):
+        self.user = create_account(username="hls", password="pass1234", email="hls@example.com")
+        self.media = Media.objects.create(user=self.user, title="Video", media_file="original/video.mp4")
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.master = os.path.join(self.tmpdir.name, "master.m3u8")
+        with open(self.master, "w") as f:
+            f.write(MASTER_PLAYLIST)
+        for name in ["media-1/stream.m3u8", "media-2/stream.m3u8", "media-1/iframes.m3u8"]:
+            path = os.path.join(self.tmpdir.name, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, "w").close()
+
+    def test_parse_maps_resolutions_to_playlists(self):
+        renditions = parse_hls_renditions(self.master)
+
+        self.assertEqual(set(renditions), {"master_file", "360_playlist", "720_playlist", "360_iframe"})
+        self.assertTrue(renditions["720_playlist"].endswith("media-2/stream.m3u8"))
+
+    def test_hls_info_reads_the_stored_map(self):
+        Media.objects.filter(id=self.media.id).update(hls_file=self.master, hls_renditions={"master_file": "/m.m3u8"})
+        media = Media.objects.get(id=self.media.id)
+
+        with patch("files.models.m3u8.load") as load, patch("files.models.os.path.exists") as exists:
+            self.assertEqual(media.hls_info, {"master_file": "/m.m3u8"})
+        load.assert_not_called()
+        exists.assert_not_called()
+
+    def test_repair_command_fills_missing_maps(self):
+        Media.objects.filter(id=self.media.id).update(hls_file=self.master)
+
+        call_command("repair_hls_renditions", stdout=StringIO())
+
+        self.media.refresh_from_db()
+        self.assertEqual(self.media.hls_renditions, parse_hls_renditions(self.master))
@@ -0,0 +1,78 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from cms.custom_pagination import KeysetPagination
+from files.models import Media
+from files.tests.user_utils import create_account
+
+
+class KeysetPaginationTests(TestCase):
+    @patch("files.models.Media.media_init", return_value=True)
+    def setUp(self, media_init):
+        self.user = create_account(username="keyset", password="pass1234", email="keyset@example.com")
+        now = timezone.now()
+        for i in range(5):
+            Media.objects.create(user=self.user, title=f"Video {i}", media_file=f"original/video{i}.mp4")
+        # two media share add_date, id has to break the tie
+        for i, media in enumerate(Media.objects.order_by("id")):
+            Media.objects.filter(id=media.id).update(
+                listable=True,
+                add_date=now - timedelta(days=min(i, 3)),
+            )
+        self.client.force_login(self.user)
+
+    def _walk(self, url, params):
+        titles = []
+        pages = 0
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertNotIn("count", data)
+            titles.extend(item["title"] for item in data["results"])
+            url, params = data["next"], None
+            pages += 1
+        return titles, pages, data
+
+    @patch.object(KeysetPagination, "page_size", 2)
+    def test_media_list_cursor_pages_follow_add_date_and_id(self):
+        expected = list(Media.objects.order_by("-add_date", "-id").values_list("title", flat=True))
+
+        titles, pages, last_page = self._walk("/api/v1/media", {"pagination": "cursor"})
+
+        self.assertEqual(titles, expected)
+        self.assertEqual(pages, 3)
+        previous = self.client.get(last_page["previous"]).json()
+        self.assertEqual([item["title"] for item in previous["results"]], expected[2:4])
+
+    def test_page_number_responses_stay_the_default(self):
+        response = self.client.get("/api/v1/media")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], 5)
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get("/api/v1/media", {"cursor": "not-a-cursor"})
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_deep_cursors_are_an_index_range_condition(self):
+        last = Media.objects.order_by("-add_date", "-id")[3]
+        cursor = {"value": last.add_date.isoformat(), "id": last.id, "previous": False}
+        queryset = KeysetPagination("-add_date").page_queryset(Media.objects.all(), cursor, descending=True)
+
+        with connection.cursor() as db_cursor:
+            # the test table is tiny, keep the planner off sequential and
+            # bitmap scans as it would be on a large table
+            db_cursor.execute("SET LOCAL enable_seqscan = off")
+            db_cursor.execute("SET LOCAL enable_bitmapscan = off")
+            plan = queryset[:20].explain()
+
+        self.assertIn("Index Scan Backward using files_media_add_date_id_idx", plan)
+        self.assertIn("Index Cond: (ROW(add_date, id) < ROW(", plan)
+        self.assertNotIn("Sort", plan)
+        self.assertEqual(list(queryset), list(Media.objects.order_by("-add_date", "-id")[4:]))
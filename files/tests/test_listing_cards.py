@@ -0,0 +1,75 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from files.listing_cards import MEDIA_CARD_KEY, invalidate_media_cards
+from files.models import Media
+from files.tests.user_utils import create_account
+
+
+class ListingCardsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_account(username="cards", password="pass1234", email="cards@example.com")
+        self.client.force_login(self.user)
+
+    @patch("files.models.Media.media_init", return_value=True)
+    def _create_media(self, count, media_init):
+        for i in range(count):
+            Media.objects.create(user=self.user, title=f"Video {i}", media_file=f"original/video{i}.mp4")
+        Media.objects.update(listable=True)
+
+    def _drop_cards(self):
+        invalidate_media_cards(Media.objects.values_list("id", flat=True))
+
+    def _listing_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/v1/media")
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def test_listing_queries_do_not_grow_with_page_size(self):
+        self._create_media(2)
+        self._drop_cards()
+        small_cold, data = self._listing_queries()
+        small_warm, _ = self._listing_queries()
+        self.assertEqual(len(data["results"]), 2)
+
+        self._create_media(8)
+        self._drop_cards()
+        large_cold, data = self._listing_queries()
+        large_warm, _ = self._listing_queries()
+        self.assertEqual(len(data["results"]), 10)
+
+        self.assertEqual(small_cold, large_cold)
+        self.assertEqual(small_warm, large_warm)
+        self.assertLess(large_warm, large_cold)
+
+    def test_cards_keep_the_serializer_output(self):
+        self._create_media(1)
+        media = Media.objects.get()
+
+        item = self.client.get("/api/v1/media").json()["results"][0]
+
+        self.assertEqual(item["url"], "http://testserver" + media.get_absolute_url())
+        self.assertEqual(item["api_url"], "http://testserver" + media.get_absolute_url(api=True))
+        self.assertEqual(item["author_profile"], "http://testserver" + media.author_profile())
+        self.assertEqual(item["preview_url"], media.preview_url)
+        self.assertEqual(item["author_name"], self.user.name)
+
+    def test_author_changes_drop_cards_but_counters_do_not(self):
+        self._create_media(1)
+        media = Media.objects.get()
+        self.client.get("/api/v1/media")
+        key = MEDIA_CARD_KEY.format(media.id)
+        self.assertIsNotNone(cache.get(key))
+
+        self.user.update_user_media()
+        self.assertIsNotNone(cache.get(key))
+
+        self.user.name = "Renamed"
+        self.user.save()
+        self.assertIsNone(cache.get(key))
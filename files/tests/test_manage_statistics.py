@@ -1,9 +1,12 @@
 import os
 import tempfile
+from unittest.mock import patch
 
+from django.core.cache import cache
 from django.test import TestCase, override_settings
 
-from files.models import Comment, Media, WowzaApplication
+from files import tasks
+from files.models import Comment, Media, StatisticsSnapshot, WowzaApplication
 from files.tests.user_utils import create_account
 from payments.models import FlowCustomer, SubscriptionPlan, UserSubscription
 
@@ -73,3 +76,44 @@ class ManageStatisticsTests(TestCase):
         self.assertEqual(response.json()["total_subscribers"], 1)
         self.assertEqual(response.json()["total_comments"], 2)
         self.assertEqual(response.json()["total_live_signals"], 2)
+
+    def test_statistics_are_read_from_the_latest_snapshot(self):
+        manager = create_account(email="stats-manager@example.com", password="pass1234", is_manager=True)
+        editor = create_account(email="stats-editor@example.com", password="pass1234", is_editor=True)
+        self.client.force_login(manager)
+
+        first = self.client.get("/api/v1/manage_statistics").json()
+        Comment.objects.create(user=manager, media=Media.objects.create(user=manager, title="Video", media_file="original/video.mp4"), text="nuevo")
+
+        # the session user and the snapshot
+        with self.assertNumQueries(2):
+            cached = self.client.get("/api/v1/manage_statistics").json()
+        self.assertEqual(cached["total_comments"], first["total_comments"])
+        self.assertEqual(len(cached["series"]["uploads"]), 30)
+
+        refreshed = self.client.post("/api/v1/manage_statistics").json()
+        self.assertEqual(refreshed["total_comments"], first["total_comments"] + 1)
+        self.assertEqual(refreshed["series"]["uploads"][-1]["count"], 1)
+        self.assertEqual(StatisticsSnapshot.objects.count(), 2)
+
+        self.client.force_login(editor)
+        self.assertEqual(self.client.post("/api/v1/manage_statistics").status_code, 403)
+
+    def test_periodic_snapshots_reuse_recent_storage_figures(self):
+        with patch("files.statistics_snapshot.get_media_storage_usage", return_value={"used_bytes": 1}) as usage:
+            self.assertTrue(tasks.take_statistics_snapshot_task())
+            self.assertTrue(tasks.take_statistics_snapshot_task())
+            self.assertEqual(usage.call_count, 1)
+
+            with override_settings(STATISTICS_STORAGE_SECONDS=0):
+                tasks.take_statistics_snapshot_task()
+            self.assertEqual(usage.call_count, 2)
+
+            cache.add("statistics_snapshot_lock", 1)
+            try:
+                self.assertFalse(tasks.take_statistics_snapshot_task())
+            finally:
+                cache.delete("statistics_snapshot_lock")
+
+        self.assertEqual(StatisticsSnapshot.objects.count(), 3)
+        self.assertEqual(StatisticsSnapshot.objects.order_by("-add_date").first().data["storage_usage"], {"used_bytes": 1})
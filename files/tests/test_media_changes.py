@@ -0,0 +1,84 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from files import tasks
+from files.media_changes import MEDIA_CHANGES_PENDING_KEY, take_media_changes
+from files.models import Media
+from files.tests.user_utils import create_account
+
+
+class MediaChangesTests(TestCase):
+    @patch("files.models.Media.media_init", return_value=True)
+    def setUp(self, media_init):
+        self.user = create_account(username="changes", password="pass1234", email="changes@example.com")
+        self.media = Media.objects.create(user=self.user, title="Video", media_file="original/video.mp4", encoding_status="running")
+        cache.delete(MEDIA_CHANGES_PENDING_KEY.format(self.media.id))
+        take_media_changes(self.media.id)
+
+    def test_saves_that_change_nothing_schedule_nothing(self):
+        with patch.object(tasks.process_media_changes, "apply_async") as apply_async, self.captureOnCommitCallbacks(execute=True):
+            self.media.save(update_fields=["encoding_status"])
+            Media.objects.get(id=self.media.id).save()
+
+        apply_async.assert_not_called()
+
+    def test_bursts_are_processed_once_with_all_changed_fields(self):
+        with patch.object(tasks.process_media_changes, "apply_async") as apply_async, self.captureOnCommitCallbacks(execute=True):
+            self.media.encoding_status = "success"
+            self.media.save(update_fields=["encoding_status"])
+            self.media.title = "Renamed"
+            self.media.description = "not saved"
+            self.media.save(update_fields=["title"])
+
+        apply_async.assert_called_once_with(args=[self.media.id], countdown=2)
+
+        with patch("files.tasks.refresh_content_related") as refresh, patch("files.tasks.invalidate_media_searches") as invalidate:
+            self.assertTrue(tasks.process_media_changes(self.media.id))
+        invalidate.assert_not_called()
+        # neither the author, listability nor categories changed
+        refresh.assert_not_called()
+        self.assertEqual(take_media_changes(self.media.id), set())
+
+    def test_cached_cards_and_documents_are_dropped_by_the_save(self):
+        with patch("files.models.invalidate_media_cards") as cards, patch("files.models.invalidate_media_documents") as documents:
+            with patch.object(tasks.process_media_changes, "apply_async"), self.captureOnCommitCallbacks(execute=True):
+                self.media.save(update_fields=["encoding_status"])
+            cards.assert_not_called()
+            documents.assert_not_called()
+
+            self.media.title = "Renamed"
+            self.media.save()
+        cards.assert_called_once_with([self.media.id])
+        documents.assert_called_once_with([self.media.id])
+
+    def test_changes_are_recorded_by_field(self):
+        with patch.object(tasks.process_media_changes, "apply_async"), self.captureOnCommitCallbacks(execute=True):
+            self.media.encoding_status = "success"
+            self.media.save(update_fields=["encoding_status"])
+            self.media.title = "Renamed"
+            self.media.save()
+
+        self.assertEqual(take_media_changes(self.media.id), {"encoding_status", "title"})
+
+    def test_changes_are_scheduled_when_the_transaction_commits(self):
+        with patch.object(tasks.process_media_changes, "apply_async") as apply_async:
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.media.title = "Renamed"
+                self.media.save()
+            apply_async.assert_not_called()
+            self.assertEqual(len(callbacks), 1)
+
+            callbacks[0]()
+        apply_async.assert_called_once_with(args=[self.media.id], countdown=2)
+
+    def test_loading_media_keeps_the_loaded_values_without_copying_them(self):
+        with patch("files.models.tracked_values") as tracked:
+            media = Media.objects.get(id=self.media.id)
+        tracked.assert_not_called()
+
+        with patch.object(tasks.process_media_changes, "apply_async"), self.captureOnCommitCallbacks(execute=True):
+            media.hls_renditions = {"720p": "720p.m3u8"}
+            media.save()
+        self.assertEqual(take_media_changes(self.media.id), {"hls_renditions"})
@@ -0,0 +1,73 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from files.counters import reconcile_media_counts
+from files.models import Category, Media, Tag
+from files.tests.user_utils import create_account
+
+
+class MediaCountTests(TestCase):
+    @patch("files.models.Media.media_init", return_value=True)
+    def setUp(self, media_init):
+        self.user = create_account(username="counts", password="pass1234", email="counts@example.com")
+        self.category = Category.objects.create(title="Music")
+        self.tag = Tag.objects.create(title="live")
+        self.media = Media.objects.create(user=self.user, title="Video", media_file="original/video.mp4")
+        self.media.category.add(self.category)
+        self.media.tags.add(self.tag)
+
+    def _counts(self):
+        self.user.refresh_from_db()
+        self.category.refresh_from_db()
+        self.tag.refresh_from_db()
+        return self.user.media_count, self.category.media_count, self.tag.media_count
+
+    def _publish(self):
+        self.media.state = "public"
+        self.media.encoding_status = "success"
+        self.media.is_reviewed = True
+        self.media.save()
+
+    def test_counts_follow_listability_transitions(self):
+        self.assertEqual(self._counts(), (0, 0, 0))
+
+        self._publish()
+        self.assertEqual(self._counts(), (1, 1, 1))
+
+        # saves that keep the media listable don't count again
+        self.media.title = "Renamed"
+        self.media.save()
+        self.assertEqual(self._counts(), (1, 1, 1))
+
+        self.media.state = "private"
+        self.media.save(update_fields=["state"])
+        self.assertEqual(self._counts(), (0, 0, 0))
+        self.media.refresh_from_db()
+        self.assertFalse(self.media.listable)
+
+    def test_links_and_deletes_update_counts(self):
+        self._publish()
+        other = Category.objects.create(title="News")
+
+        self.media.category.add(other)
+        self.media.category.remove(self.category)
+        self.media.category.remove(self.category)
+        other.refresh_from_db()
+        self.assertEqual(other.media_count, 1)
+        self.assertEqual(self._counts(), (1, 0, 1))
+
+        self.tag.media_set.remove(self.media)
+        self.assertEqual(self._counts(), (1, 0, 0))
+
+        self.media.delete()
+        other.refresh_from_db()
+        self.assertEqual((self._counts()[0], other.media_count), (0, 0))
+
+    def test_reconcile_corrects_drift(self):
+        self._publish()
+        Category.objects.filter(id=self.category.id).update(media_count=7)
+        Media.objects.filter(id=self.media.id).update(listable=False)
+
+        self.assertEqual(reconcile_media_counts(), 2)
+        self.assertEqual(self._counts(), (0, 0, 1))
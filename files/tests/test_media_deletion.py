@@ -0,0 +1,92 @@
+import os
+import tempfile
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from files import tasks
+from files.models import Media, MediaDeletionJob
+from files.tests.user_utils import create_account
+
+
+class MediaDeletionJobTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media_root.name, MEDIA_DELETION_BATCH_SIZE=2, MEDIA_DELETION_FILES_PER_TASK=2)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = create_account(username="deleter", password="pass1234", email="deleter@example.com", is_manager=True)
+        os.makedirs(os.path.join(self.media_root.name, "original"))
+        self.media = []
+        with patch("files.models.Media.media_init", return_value=True):
+            for index in range(5):
+                path = os.path.join(self.media_root.name, "original", f"video{index}.mp4")
+                with open(path, "wb") as handle:
+                    handle.write(b"x")
+                self.media.append(Media.objects.create(user=self.user, title=f"Video {index}", media_file=f"original/video{index}.mp4"))
+        self.client.force_login(self.user)
+
+    def test_delete_returns_a_job_and_deletes_in_background(self):
+        tokens = [media.friendly_token for media in self.media[:4]]
+        with patch("files.tasks.remove_media_files.delay") as remove_files:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.delete("/api/v1/manage_media?tokens=" + ",".join(tokens + ["missing"]))
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["total"], 4)
+        self.assertEqual(list(Media.objects.values_list("id", flat=True)), [self.media[4].id])
+
+        job = MediaDeletionJob.objects.get(uid=response.data["uid"])
+        self.assertEqual((job.status, job.deleted, job.files_total, job.files_removed), ("success", 4, 4, 0))
+        # files stay until the file tasks run, two files per task
+        self.assertTrue(os.path.exists(self.media[0].media_file.path))
+        self.assertEqual(remove_files.call_count, 2)
+
+        for call in remove_files.call_args_list:
+            tasks.remove_media_files(*call.args)
+        self.assertFalse(os.path.exists(self.media[0].media_file.path))
+        self.assertTrue(os.path.exists(self.media[4].media_file.path))
+
+        response = self.client.get(response.data["url"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["deleted"], response.data["files_removed"]), (4, 4))
+
+    def test_failed_jobs_are_marked(self):
+        with patch("files.tasks.run_media_deletion_job", side_effect=RuntimeError("database went away")):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.delete(f"/api/v1/manage_media?tokens={self.media[0].friendly_token}")
+
+        job = MediaDeletionJob.objects.get(uid=response.data["uid"])
+        self.assertEqual((job.status, job.logs), ("fail", "database went away"))
+        self.assertTrue(Media.objects.filter(id=self.media[0].id).exists())
+
+    def test_jobs_left_running_by_a_stopped_worker_are_resumed(self):
+        tokens = [media.friendly_token for media in self.media[:4]]
+        with patch("files.tasks.delete_media_job.delay"):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.delete("/api/v1/manage_media?tokens=" + ",".join(tokens))
+        job = MediaDeletionJob.objects.get(uid=response.data["uid"])
+        # the worker deleted a first batch and stopped
+        Media.objects.filter(friendly_token=tokens[0]).delete()
+        MediaDeletionJob.objects.filter(id=job.id).update(status="running", deleted=1)
+
+        with patch("files.tasks.remove_media_files.delay"):
+            self.assertEqual(tasks.resume_media_deletion_jobs(), 0)
+            self.assertFalse(tasks.delete_media_job(str(job.uid)))
+
+            MediaDeletionJob.objects.filter(id=job.id).update(update_date=timezone.now() - timedelta(hours=1))
+            self.assertEqual(tasks.resume_media_deletion_jobs(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.deleted), ("success", 4))
+        self.assertEqual(list(Media.objects.values_list("id", flat=True)), [self.media[4].id])
+
+    def test_single_media_deletes_keep_removing_files_right_away(self):
+        path = self.media[0].media_file.path
+        self.media[0].delete()
+
+        self.assertFalse(os.path.exists(path))
@@ -0,0 +1,46 @@
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from files.media_documents import invalidate_media_documents
+from files.models import Media, Tag
+from files.tests.user_utils import create_account
+
+
+class MediaDocumentTests(TestCase):
+    @patch("files.models.Media.media_init", return_value=True)
+    def setUp(self, media_init):
+        self.user = create_account(username="documents", password="pass1234", email="documents@example.com", is_editor=True)
+        self.media = Media.objects.create(user=self.user, title="Video", media_file="original/video.mp4", state="public")
+        invalidate_media_documents([self.media.id])
+        self.client.force_login(self.user)
+        self.url = f"/api/v1/media/{self.media.friendly_token}"
+
+    def test_repeat_views_reuse_the_document(self):
+        with CaptureQueriesContext(connection) as first_queries:
+            first = self.client.get(self.url)
+        with CaptureQueriesContext(connection) as second_queries:
+            second = self.client.get(self.url)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json(), second.json())
+        self.assertLess(len(second_queries), len(first_queries))
+
+    def test_counters_are_read_from_the_row(self):
+        self.client.get(self.url)
+        Media.objects.filter(id=self.media.id).update(views=42)
+
+        self.assertEqual(self.client.get(self.url).json()["views"], 42)
+
+    def test_related_changes_drop_the_document(self):
+        self.client.get(self.url)
+
+        tag = Tag.objects.create(title="rock", user=self.user)
+        self.media.tags.add(tag)
+        self.assertEqual(self.client.get(self.url).json()["tags_info"][0]["title"], "rock")
+
+        tag.title = "jazz"
+        tag.save()
+        self.assertEqual(self.client.get(self.url).json()["tags_info"][0]["title"], "jazz")
@@ -0,0 +1,82 @@
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from actions.models import MediaAction
+from files.methods import show_related_media
+from files.models import Category, Media
+from files.recommendations import content_related_ids, refresh_all_content_related, related_media_ids, update_related_media
+from files.tests.user_utils import create_account
+
+
+@override_settings(RELATED_MEDIA_STRATEGY="calculated", RELATED_MEDIA_MIN_CO_WATCH=1)
+class RelatedMediaTests(TestCase):
+    @patch("files.models.Media.media_init", return_value=True)
+    def setUp(self, media_init):
+        self.user = create_account(username="related", password="pass1234", email="related@example.com")
+        self.media = [Media.objects.create(user=self.user, title=f"Video {i}", media_file=f"original/video{i}.mp4") for i in range(4)]
+        Media.objects.update(listable=True)
+        refresh_all_content_related()
+        a, b, c, d = self.media
+        # b is watched with a by three viewers, c by one, d is never watched
+        watches = {"s1": [a, b], "s2": [a, b], "s3": [a, b, c], "s4": [c]}
+        for session, media in watches.items():
+            for item in media:
+                MediaAction.objects.create(media=item, session_key=session, action="watch")
+
+    def test_nearest_media_are_ordered_by_similarity(self):
+        a, b, c, d = self.media
+        update_related_media()
+
+        self.assertEqual(related_media_ids(a.id), [b.id, c.id])
+        self.assertEqual(related_media_ids(d.id), [])
+
+    def test_related_media_fall_back_to_content(self):
+        a, b, c, d = self.media
+        update_related_media()
+
+        related = show_related_media(a, limit=3)
+
+        self.assertEqual([m.id for m in related[:2]], [b.id, c.id])
+        self.assertEqual(related[2], d)
+        self.assertEqual(len(show_related_media(d, limit=3)), 3)
+
+
+class ContentRelatedMediaTests(TestCase):
+    @patch("files.models.Media.media_init", return_value=True)
+    def setUp(self, media_init):
+        self.author = create_account(username="author", password="pass1234", email="author@example.com")
+        self.other = create_account(username="other", password="pass1234", email="other@example.com")
+        self.category = Category.objects.create(title="Music")
+        self.media = Media.objects.create(user=self.author, title="Video", media_file="original/video.mp4")
+        self.sibling = Media.objects.create(user=self.author, title="Sibling", media_file="original/sibling.mp4")
+        self.same_category = Media.objects.create(user=self.other, title="Song", media_file="original/song.mp4")
+        self.popular = Media.objects.create(user=self.other, title="Popular", media_file="original/popular.mp4")
+        self.media.category.add(self.category)
+        self.same_category.category.add(self.category)
+        Media.objects.update(listable=True)
+        Media.objects.filter(id=self.popular.id).update(views=1000)
+        refresh_all_content_related()
+
+    @override_settings(RELATED_MEDIA_LIMIT=3)
+    def test_lists_are_author_then_category_then_popular(self):
+        refresh_all_content_related()
+
+        self.assertEqual(content_related_ids(self.media), [self.sibling.id, self.same_category.id, self.popular.id])
+
+    def test_related_media_are_read_with_one_query(self):
+        with self.assertNumQueries(2):
+            related = show_related_media(self.media, limit=2)
+
+        self.assertEqual(len(related), 2)
+        self.assertNotIn(self.media, related)
+
+    @override_settings(RELATED_MEDIA_LIMIT=2)
+    def test_list_is_refreshed_when_categories_change(self):
+        refresh_all_content_related()
+        self.assertEqual(content_related_ids(self.media), [self.sibling.id, self.same_category.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.media.category.clear()
+
+        self.assertEqual(content_related_ids(self.media), [self.sibling.id, self.popular.id])
@@ -0,0 +1,69 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from files.models import Category, Media
+from files.search_cache import SEARCH_CACHE_HITS_KEY, SEARCH_CACHE_MISSES_KEY, search_cache_stats
+from files.tests.user_utils import create_account
+
+
+class SearchCacheTests(TestCase):
+    @patch("files.models.Media.media_init", return_value=True)
+    def setUp(self, media_init):
+        cache.delete_many([SEARCH_CACHE_HITS_KEY, SEARCH_CACHE_MISSES_KEY])
+        self.user = create_account(username="cacheadmin", password="pass1234", email="cacheadmin@example.com")
+        self.music = Category.objects.create(title="Musica cache")
+        self.sports = Category.objects.create(title="Deportes cache")
+        self.first = self._create_media("Primer video", self.music)
+        self.client.force_login(self.user)
+
+    @patch("files.models.Media.media_init", return_value=True)
+    def _create_media(self, title, category, media_init):
+        media = Media.objects.create(user=self.user, title=title, media_file="original/video.mp4")
+        media.state = "public"
+        media.is_reviewed = True
+        media.save()
+        media.category.add(category)
+        return media
+
+    def _search(self, **params):
+        response = self.client.get("/api/v1/search", params)
+        self.assertEqual(response.status_code, 200)
+        return [item["friendly_token"] for item in response.json()["results"]]
+
+    def test_category_search_is_served_from_cache_until_the_category_changes(self):
+        self.assertEqual(self._search(c=self.music.title), [self.first.friendly_token])
+        self.assertEqual(self._search(c=self.music.title), [self.first.friendly_token])
+        self.assertEqual(search_cache_stats()["hits"], 1)
+        self.assertEqual(search_cache_stats()["misses"], 1)
+
+        # a change in another category keeps the entry
+        self._create_media("Partido", self.sports)
+        self._search(c=self.music.title)
+        self.assertEqual(search_cache_stats()["hits"], 2)
+
+        second = self._create_media("Segundo video", self.music)
+        self.assertEqual(self._search(c=self.music.title), [second.friendly_token, self.first.friendly_token])
+
+    def test_unpublishing_media_drops_it_from_cached_results(self):
+        self.assertEqual(self._search(c=self.music.title), [self.first.friendly_token])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first.state = "private"
+            self.first.save()
+
+        self.assertEqual(self._search(c=self.music.title), [])
+
+    def test_publishing_a_loaded_media_drops_cached_results(self):
+        hidden = self._create_media("Video oculto", self.music)
+        Media.objects.filter(id=hidden.id).update(state="private")
+        self.assertEqual(self._search(c=self.music.title), [self.first.friendly_token])
+
+        # a fresh instance, no earlier save of it in this process
+        media = Media.objects.get(id=hidden.id)
+        media.state = "public"
+        with self.captureOnCommitCallbacks(execute=True):
+            media.save()
+
+        self.assertEqual(self._search(c=self.music.title), [hidden.friendly_token, self.first.friendly_token])
@@ -0,0 +1,125 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+
+from files.models import Category, Media, Tag
+from files.search_index import index_dirty_media, search_document_parts
+from files.tests.user_utils import create_account
+
+
+class SearchIndexTests(TestCase):
+    @patch("files.models.Media.media_init", return_value=True)
+    def setUp(self, media_init):
+        # cached searches are dropped once saves commit, never in these tests
+        cache.clear()
+        self.user = create_account(username="searchadmin", password="pass1234", email="searchadmin@example.com")
+        self.media = Media.objects.create(user=self.user, title="Concierto sinfonico", media_file="original/video.mp4")
+
+    def _search(self, term):
+        return Media.objects.filter(search=term)
+
+    def test_saves_mark_media_dirty_and_worker_indexes_in_batches(self):
+        self.media.refresh_from_db()
+        self.assertTrue(self.media.search_dirty)
+        self.assertFalse(self._search("sinfonico").exists())
+
+        self.assertEqual(index_dirty_media(), 1)
+
+        self.media.refresh_from_db()
+        self.assertFalse(self.media.search_dirty)
+        self.assertTrue(self._search("sinfonico").exists())
+
+    def test_tags_and_searchable_update_fields_requeue_media(self):
+        index_dirty_media()
+
+        self.media.views = 10
+        self.media.save(update_fields=["views"])
+        self.assertFalse(Media.objects.get(id=self.media.id).search_dirty)
+
+        self.media.tags.add(Tag.objects.create(title="orquesta", user=self.user))
+        self.assertTrue(Media.objects.get(id=self.media.id).search_dirty)
+        index_dirty_media()
+        self.assertTrue(self._search("orquesta").exists())
+
+        self.media.title = "Recital de piano"
+        self.media.save(update_fields=["title"])
+        self.assertTrue(Media.objects.get(id=self.media.id).search_dirty)
+
+    def test_changes_while_a_batch_is_indexed_keep_media_dirty(self):
+        index_dirty_media()
+        tag = Tag.objects.create(title="orquesta", user=self.user)
+        self.media.tags.add(Tag.objects.create(title="coro", user=self.user))
+
+        def tags_added_meanwhile(media):
+            parts = search_document_parts(media)
+            # tags change after the worker read the media, edit_date does not
+            tag.media_set.add(media)
+            return parts
+
+        with patch("files.search_index.search_document_parts", side_effect=tags_added_meanwhile):
+            self.assertEqual(index_dirty_media(), 0)
+
+        self.assertTrue(Media.objects.get(id=self.media.id).search_dirty)
+        index_dirty_media()
+        self.assertTrue(self._search("orquesta").exists())
+
+    @patch("files.models.Media.media_init", return_value=True)
+    def test_relevance_ranks_title_matches_before_description_matches(self, media_init):
+        # the description match is newer, so it would come first by add_date
+        title_match = Media.objects.create(user=self.user, title="El zorro", media_file="original/video3.mp4")
+        description_match = Media.objects.create(
+            user=self.user,
+            title="Entrevista",
+            description="hablamos del zorro",
+            media_file="original/video2.mp4",
+        )
+        Media.objects.all().update(state="public", is_reviewed=True)
+        index_dirty_media()
+        self.client.force_login(self.user)
+
+        response = self.client.get("/api/v1/search", {"q": "zorro", "sort_by": "relevance"})
+
+        self.assertEqual(response.status_code, 200)
+        tokens = [item["friendly_token"] for item in response.json()["results"]]
+        self.assertEqual(tokens, [title_match.friendly_token, description_match.friendly_token])
+
+    @patch("files.models.Media.media_init", return_value=True)
+    def test_relevance_ranks_only_the_most_recent_matches(self, media_init):
+        old_match = Media.objects.create(user=self.user, title="El zorro", media_file="original/video3.mp4")
+        title_match = Media.objects.create(user=self.user, title="Zorro", media_file="original/video3.mp4")
+        description_match = Media.objects.create(user=self.user, title="Entrevista", description="hablamos del zorro", media_file="original/video2.mp4")
+        Media.objects.all().update(state="public", is_reviewed=True)
+        Media.objects.filter(id=old_match.id).update(add_date=timezone.now() - timedelta(days=365))
+        index_dirty_media()
+        self.client.force_login(self.user)
+
+        with self.settings(SEARCH_RANK_MAX_CANDIDATES=2):
+            results = self.client.get("/api/v1/search", {"q": "zorro", "sort_by": "relevance"}).json()["results"]
+
+        self.assertEqual([item["friendly_token"] for item in results], [title_match.friendly_token, description_match.friendly_token])
+
+    @patch("files.models.Media.media_init", return_value=True)
+    def test_facets_option_returns_category_tag_and_media_type_counts(self, media_init):
+        category = Category.objects.create(title="Conciertos facet")
+        tag = Tag.objects.create(title="sinfonica", user=self.user)
+        other = Media.objects.create(user=self.user, title="Ensayo sinfonico", media_file="original/video4.mp4")
+        self.media.category.add(category)
+        self.media.tags.add(tag)
+        other.tags.add(tag)
+        Media.objects.filter(id__in=[self.media.id, other.id]).update(state="public", is_reviewed=True)
+        Media.objects.filter(id=other.id).update(media_type="audio")
+        Media.objects.filter(id=self.media.id).update(media_type="video")
+        index_dirty_media()
+        self.client.force_login(self.user)
+
+        response = self.client.get("/api/v1/search", {"q": "sinfonico", "facets": "1"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], 2)
+        facets = response.json()["facets"]
+        self.assertEqual(facets["category"], [{"title": "Conciertos facet", "count": 1}])
+        self.assertEqual(facets["tag"], [{"title": "sinfonica", "count": 2}])
+        self.assertEqual(sorted(item["title"] for item in facets["media_type"]), ["audio", "video"])
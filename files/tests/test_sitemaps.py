@@ -0,0 +1,60 @@
+from unittest.mock import patch
+
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory, TestCase, override_settings
+
+from files import views
+from files.models import Media
+from files.sitemaps import sitemap_partition
+from files.tests.user_utils import create_account
+
+
+def _content(response):
+    if response.streaming:
+        return b"".join(response.streaming_content).decode()
+    return response.content.decode()
+
+
+@override_settings(SITEMAP_PARTITION_SIZE=2, FRONTEND_HOST="https://example.com")
+class SitemapTests(TestCase):
+    @patch("files.models.Media.media_init", return_value=True)
+    def setUp(self, media_init):
+        self.factory = RequestFactory()
+        self.user = create_account(username="sitemap", password="pass1234", email="sitemap@example.com")
+        for i in range(3):
+            Media.objects.create(user=self.user, title=f"Video {i}", media_file=f"original/video{i}.mp4")
+        Media.objects.update(listable=True)
+        self.media = Media.objects.order_by("id").first()
+
+    def _get(self, view, *args):
+        request = self.factory.get("/sitemap.xml")
+        request.user = AnonymousUser()
+        return view(request, *args)
+
+    def test_index_lists_one_sitemap_per_partition(self):
+        content = _content(self._get(views.sitemap))
+
+        partitions = sorted({sitemap_partition(media_id) for media_id in Media.objects.values_list("id", flat=True)})
+        for partition in partitions:
+            self.assertIn(f"https://example.com/sitemap-media-{partition}.xml", content)
+        self.assertIn(f"https://example.com/sitemap-users-{sitemap_partition(self.user.id)}.xml", content)
+
+    def test_partition_is_cached_until_it_changes(self):
+        partition = str(sitemap_partition(self.media.id))
+
+        first = self._get(views.sitemap_section, "media", partition)
+        self.assertTrue(first.streaming)
+        self.assertIn(f"/view?m={self.media.friendly_token}", _content(first))
+
+        second = self._get(views.sitemap_section, "media", partition)
+        self.assertFalse(second.streaming)
+        self.assertEqual(second["ETag"], first["ETag"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.media.listable = False
+            self.media.state = "private"
+            self.media.save()
+
+        third = self._get(views.sitemap_section, "media", partition)
+        self.assertTrue(third.streaming)
+        self.assertNotIn(f"/view?m={self.media.friendly_token}", _content(third))
@@ -0,0 +1,63 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from files.models import (
+    SMIL_PENDING_CACHE_KEY,
+    EncodeProfile,
+    Encoding,
+    Media,
+    generate_smil,
+    schedule_smil_generation,
+    smil_file_path,
+)
+from files.tests.user_utils import create_account
+
+
+class SmilGenerationTests(TestCase):
+    @patch("files.models.Media.media_init", return_value=True)
+    def setUp(self, media_init):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = create_account(username="smiladmin", password="pass1234", email="smiladmin@example.com")
+        self.media = Media.objects.create(
+            user=self.user,
+            title="Video con SMIL",
+            media_file=SimpleUploadedFile("video.mp4", b"fake video", content_type="video/mp4"),
+            media_type="video",
+            encoding_status="waiting_smil",
+        )
+        profile = EncodeProfile.objects.create(name="720p h264", extension="mp4", resolution=720, codec="h264")
+        encoding = Encoding.objects.create(media=self.media, profile=profile, status="pending")
+        Encoding.objects.filter(id=encoding.id).update(status="success", media_file="encoded/1/smiladmin/video.mp4")
+        cache.delete(SMIL_PENDING_CACHE_KEY.format(self.media.friendly_token))
+
+    def test_generate_smil_writes_manifest_and_skips_unchanged_content(self):
+        smil_path = generate_smil(self.media)
+
+        self.assertEqual(smil_path, smil_file_path(self.media.friendly_token))
+        with open(smil_path) as smil_file:
+            self.assertIn('system-bitrate="720000"', smil_file.read())
+        self.media.refresh_from_db()
+        self.assertEqual(self.media.encoding_status, "success")
+
+        with patch("files.models.os.replace") as replace:
+            generate_smil(self.media)
+        replace.assert_not_called()
+        self.assertEqual(os.listdir(self.media_root.name).count(f"{self.media.friendly_token}.smil"), 1)
+
+    @patch("files.tasks.generate_smil_task.apply_async")
+    def test_schedule_smil_generation_coalesces_bursts(self, apply_async):
+        self.assertTrue(schedule_smil_generation(self.media))
+        self.assertFalse(schedule_smil_generation(self.media))
+
+        apply_async.assert_called_once()
+        self.assertEqual(apply_async.call_args[1]["args"], [self.media.friendly_token])
@@ -0,0 +1,67 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.utils import timezone
+
+from actions.models import MediaAction
+from actions.rollups import rollup_media_actions
+from files.methods import show_recommended_media
+from files.models import Category, Media
+from files.tests.user_utils import create_account
+from files.trending import GLOBAL_SCOPE, category_scope, trending_media_ids, update_trending_scores
+
+
+class TrendingTests(TestCase):
+    @patch("files.models.Media.media_init", return_value=True)
+    def setUp(self, media_init):
+        update_trending_scores(rebuild=True)
+        self.user = create_account(username="trending", password="pass1234", email="trending@example.com")
+        self.old = Media.objects.create(user=self.user, title="Old", media_file="original/old.mp4")
+        self.new = Media.objects.create(user=self.user, title="New", media_file="original/new.mp4")
+        self.category = Category.objects.create(title="Music")
+        self.new.category.add(self.category)
+        Media.objects.update(listable=True)
+        self.now = timezone.localtime().replace(minute=30, second=0, microsecond=0)
+
+    def _actions(self, media, action, hours_ago, count=1):
+        for _ in range(count):
+            ma = MediaAction.objects.create(media=media, session_key="a" * 32, action=action)
+            MediaAction.objects.filter(id=ma.id).update(action_date=self.now - timedelta(hours=hours_ago))
+
+    def test_recent_actions_outweigh_older_ones(self):
+        # more views, but four half lives ago
+        self._actions(self.old, "watch", 24 * 8, count=6)
+        self._actions(self.new, "watch", 3, count=2)
+        # closes the hours before
+        self._actions(self.new, "watch", 1)
+        rollup_media_actions()
+
+        self.assertGreater(update_trending_scores(), 0)
+
+        self.assertEqual(trending_media_ids(GLOBAL_SCOPE), [self.new.id, self.old.id])
+        self.assertEqual(trending_media_ids(category_scope(self.category.id)), [self.new.id])
+        self.assertEqual({m.id for m in show_recommended_media(None)}, {self.new.id, self.old.id})
+
+    def test_only_new_rollups_are_read(self):
+        self._actions(self.old, "like", 5)
+        self._actions(self.old, "watch", 1)
+        rollup_media_actions()
+        update_trending_scores()
+
+        self.assertEqual(update_trending_scores(), 0)
+        self.assertEqual(trending_media_ids(GLOBAL_SCOPE), [self.old.id])
+
+    def test_recommended_media_of_a_category_read_its_scope(self):
+        self._actions(self.old, "watch", 3, count=4)
+        self._actions(self.new, "watch", 3)
+        self._actions(self.new, "watch", 1)
+        rollup_media_actions()
+        update_trending_scores()
+        self.client.force_login(self.user)
+
+        response = self.client.get("/api/v1/media", {"show": "recommended", "category": "Music"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item["friendly_token"] for item in response.json()["results"]], [self.new.friendly_token])
+        self.assertEqual(self.client.get("/api/v1/media", {"show": "recommended", "category": "Missing"}).status_code, 404)
@@ -35,10 +35,10 @@ class VideoTrimmerTests(TestCase):
     @patch("files.tasks.produce_sprite_from_video.delay")
     @patch("files.models.Media.produce_thumbnails_from_video", return_value=True)
     @patch("files.models.Media.set_media_type", return_value=True)
-    @patch("files.models.generate_smil", return_value="/tmp/video.smil")
+    @patch("files.models.schedule_smil_generation", return_value=True)
     def test_post_trim_action_regenerates_smil_for_trimmed_video(
         self,
-        generate_smil,
+        schedule_smil_generation,
         set_media_type,
         produce_thumbnails_from_video,
         produce_sprite_from_video_delay,
@@ -47,8 +47,8 @@ class VideoTrimmerTests(TestCase):
         result = post_trim_action(self.media.friendly_token)
 
         self.assertEqual(result, True)
-        generate_smil.assert_called_once()
-        self.assertEqual(generate_smil.call_args[0][0].id, self.media.id)
+        schedule_smil_generation.assert_called_once()
+        self.assertEqual(schedule_smil_generation.call_args[0][0].id, self.media.id)
         self.media.refresh_from_db()
         self.assertEqual(self.media.encoding_status, "waiting_smil")
         trim_request = VideoTrimRequest.objects.get(media=self.media)
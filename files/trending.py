@@ -0,0 +1,140 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from actions.models import MediaActionRollup
+from actions.rollups import ROLLUP_LAG, rolled_up_until
+
+logger = logging.getLogger(__name__)
+
+# Trending media, by exponentially decayed action counts. Every scope
+# (global, a category, a channel) is a redis sorted set of its top media.
+# Scores are kept relative to an epoch: an action at time t adds
+# weight * 2 ** ((t - epoch) / half life), so older actions weigh less
+# without rewriting any score, and the order of a set is the order of the
+# decayed scores. Each run reads only the hourly rollups closed since the
+# previous one.
+GLOBAL_SCOPE = "global"
+TRENDING_KEY = "trending:scope:{0}"
+# epoch and watermark, timestamps in seconds
+TRENDING_STATE_KEY = "trending:state"
+# scores are rebased on a new epoch before they grow past 2 ** 32
+REBASE_HALF_LIVES = 32
+
+
+def category_scope(category_id):
+    return f"category:{category_id}"
+
+
+def channel_scope(channel_id):
+    return f"channel:{channel_id}"
+
+
+def _half_life():
+    return timedelta(hours=getattr(settings, "TRENDING_HALF_LIFE_HOURS", 48)).total_seconds()
+
+
+def _weights():
+    return getattr(settings, "TRENDING_ACTION_WEIGHTS", {"watch": 1, "like": 5})
+
+
+def _top_k():
+    return max(1, int(getattr(settings, "TRENDING_TOP_K", 500) or 500))
+
+
+def trending_media_ids(scope=GLOBAL_SCOPE, limit=50):
+    """Ids of the top media of a scope, most trending first"""
+
+    return [int(media_id) for media_id in get_redis_connection("default").zrevrange(TRENDING_KEY.format(scope), 0, limit - 1)]
+
+
+def _scopes(rows):
+    from .models import Media
+
+    media_ids = {row["media_id"] for row in rows}
+    scopes = defaultdict(lambda: [GLOBAL_SCOPE])
+    for media_id, channel_id in Media.objects.filter(id__in=media_ids, channel__isnull=False).values_list("id", "channel_id"):
+        scopes[media_id].append(channel_scope(channel_id))
+    for media_id, category_id in Media.category.through.objects.filter(media_id__in=media_ids).values_list("media_id", "category_id"):
+        scopes[media_id].append(category_scope(category_id))
+    return scopes
+
+
+def _rebase(redis, factor):
+    keys = list(redis.scan_iter(match=TRENDING_KEY.format("*"), count=1000))
+    pipe = redis.pipeline()
+    for key in keys:
+        pipe.zunionstore(key, {key: factor})
+    pipe.execute()
+
+
+def update_trending_scores(rebuild=False):
+    """Add the hourly rollups closed since the last run to the trending
+    scores, returns the number of rollup rows read.
+    rebuild drops the scores and replays the last TRENDING_REBUILD_DAYS"""
+
+    redis = get_redis_connection("default")
+    if rebuild:
+        keys = list(redis.scan_iter(match=TRENDING_KEY.format("*"), count=1000))
+        if keys:
+            redis.delete(*keys)
+        redis.delete(TRENDING_STATE_KEY)
+
+    until = rolled_up_until()
+    if until is None:
+        return 0
+    # the last rolled up hour can still be recounted
+    until = until - ROLLUP_LAG
+
+    state = redis.hgetall(TRENDING_STATE_KEY)
+    half_life = _half_life()
+    if state:
+        epoch = float(state[b"epoch"])
+        since = datetime.fromtimestamp(float(state[b"watermark"]), tz=timezone.get_current_timezone())
+    else:
+        since = until - timedelta(days=getattr(settings, "TRENDING_REBUILD_DAYS", 30))
+        epoch = since.timestamp()
+    if since >= until:
+        return 0
+
+    if (until.timestamp() - epoch) / half_life > REBASE_HALF_LIVES:
+        _rebase(redis, 2 ** ((epoch - until.timestamp()) / half_life))
+        epoch = until.timestamp()
+
+    weights = _weights()
+    rows = list(
+        MediaActionRollup.objects.filter(
+            period="hour",
+            action__in=weights,
+            period_start__gte=since,
+            period_start__lt=until,
+            media__listable=True,
+        ).values("media_id", "action", "period_start", "count")
+    )
+    scopes = _scopes(rows)
+
+    increments = defaultdict(lambda: defaultdict(float))
+    for row in rows:
+        # actions of the hour are counted at its middle
+        age = row["period_start"].timestamp() + 60 * 30 - epoch
+        score = weights[row["action"]] * row["count"] * 2 ** (age / half_life)
+        for scope in scopes[row["media_id"]]:
+            increments[scope][row["media_id"]] += score
+
+    top_k = _top_k()
+    # scores and the new watermark are written together
+    pipe = redis.pipeline(transaction=True)
+    for scope, scores in increments.items():
+        key = TRENDING_KEY.format(scope)
+        for media_id, score in scores.items():
+            pipe.zincrby(key, score, media_id)
+        pipe.zremrangebyrank(key, 0, -top_k - 1)
+    pipe.hset(TRENDING_STATE_KEY, mapping={"epoch": epoch, "watermark": until.timestamp()})
+    pipe.execute()
+
+    logger.info("Updated trending scores of %s scopes from %s rollups", len(increments), len(rows))
+    return len(rows)
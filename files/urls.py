@@ -4,7 +4,7 @@ from django.conf.urls.static import static
 from django.urls import path, re_path
 
 from . import management_views, views, wowza_chat_views, wowza_views
-from .feeds import IndexRSSFeed, SearchRSSFeed
+from .feeds import IndexRSSFeed, SearchRSSFeed, cached_feed
 
 urlpatterns = [
     path("i18n/", include("django.conf.urls.i18n")),
@@ -35,8 +35,8 @@ urlpatterns = [
     ),
     re_path(r"^popular$", views.recommended_media),
     re_path(r"^recommended$", views.recommended_media),
-    path("rss/", IndexRSSFeed()),
-    re_path("^rss/search", SearchRSSFeed()),
+    path("rss/", cached_feed(IndexRSSFeed())),
+    re_path("^rss/search", cached_feed(SearchRSSFeed())),
     re_path(r"^search", views.search, name="search"),
     re_path(r"^scpublisher", views.upload_media, name="upload_media"),
     re_path(r"^tags", views.tags, name="tags"),
@@ -57,6 +57,7 @@ urlpatterns = [
         name="api_get_encoding",
     ),
     re_path(r"^api/v1/search$", views.MediaSearch.as_view()),
+    re_path(r"^api/v1/search/autocomplete$", views.SearchAutocomplete.as_view()),
     re_path(
         r"^api/v1/media/(?P<friendly_token>[\w]*)/actions$",
         views.MediaActions.as_view(),
@@ -106,6 +107,10 @@ urlpatterns = [
     # ADMIN VIEWS
     re_path(r"^api/v1/encode_profiles/$", views.EncodeProfileList.as_view()),
     re_path(r"^api/v1/manage_media$", management_views.MediaList.as_view()),
+    re_path(
+        r"^api/v1/manage_media/deletions/(?P<uid>[0-9a-f-]{36})$",
+        management_views.MediaDeletionJobDetail.as_view(),
+    ),
     re_path(r"^api/v1/manage_comments$", management_views.CommentList.as_view()),
     re_path(r"^api/v1/manage_users$", management_views.UserList.as_view()),
     re_path(r"^api/v1/manage_statistics$", management_views.StatisticsView.as_view()),
@@ -125,3 +130,11 @@ urlpatterns = [
 
 if hasattr(settings, "GENERATE_SITEMAP") and settings.GENERATE_SITEMAP:
     urlpatterns.append(path("sitemap.xml", views.sitemap, name="sitemap"))
+    urlpatterns.append(path("sitemap-pages.xml", views.sitemap_pages, name="sitemap_pages"))
+    urlpatterns.append(
+        re_path(
+            r"^sitemap-(?P<section>media|playlists|users)-(?P<partition>\d+)\.xml$",
+            views.sitemap_section,
+            name="sitemap_section",
+        )
+    )
@@ -6,12 +6,12 @@ from urllib.parse import parse_qsl, urlparse
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.contrib.postgres.search import SearchQuery
 from django.core.mail import EmailMessage
-from django.db.models import Q
+from django.db.models import Max, Q, QuerySet
 from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
 from django.shortcuts import get_object_or_404, render, redirect
 from django.urls import reverse
+from django.utils.cache import patch_cache_control
 from django.views.decorators.csrf import csrf_exempt
 from drf_yasg import openapi as openapi
 from drf_yasg.utils import swagger_auto_schema
@@ -28,18 +28,29 @@ from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
 from actions.models import USER_MEDIA_ACTIONS, MediaAction
-from cms.custom_pagination import FastPaginationWithoutCount
+from cms.custom_pagination import FastPaginationWithoutCount, KeysetPagination, keyset_pagination_requested
 from cms.permissions import (
     IsAuthorizedToAdd,
     IsAuthorizedToAddComment,
     IsUserOrEditor,
     user_allowed_to_upload,
 )
-from users.models import User
-
+from users.models import Channel, User
+
+from .autocomplete import autocomplete
+from .content_versions import (
+    LISTING_SCOPE,
+    comments_scope,
+    content_validators,
+    media_scope,
+    not_modified,
+    playlist_scope,
+    set_validators,
+    user_scope,
+)
 from .forms import ContactForm, EditSubtitleForm, MediaForm, SubtitleForm, AdsForm
 from .frontend_translations import translate_string
-from .helpers import clean_query, get_alphanumeric_only, produce_ffmpeg_commands
+from .helpers import get_alphanumeric_only, produce_ffmpeg_commands
 from .methods import (
     check_comment_for_mention,
     create_video_trim_request,
@@ -66,6 +77,7 @@ from .models import (
     WowzaApplication,
     Ads
 )
+from .sitemaps import SITEMAP_INDEX_SCOPE, iter_sitemap_index, iter_sitemap_section, sitemap_response, sitemap_scope
 from .serializers import (
     CategorySerializer,
     CommentSerializer,
@@ -78,13 +90,15 @@ from .serializers import (
     TagSerializer,
     AdsSerializer
 )
+from .search_cache import cached_search, cached_value
+from .search_index import build_search_query, rank_search_results, search_facets
 from .storage_usage import STORAGE_LIMIT_MESSAGE, media_storage_has_capacity
-from .stop_words import STOP_WORDS
 from .tasks import save_user_action, video_trim_task
 import json
 
 from . import cdn_balancer as cdn_balancer_module
 from .cdn_balancer import get_balanced_hosts_for_request
+from .cdn_health import edge_health
 from .wowza import generate_wowza_token
 
 logger = logging.getLogger(__name__)
@@ -586,6 +600,8 @@ def embed_media(request):
                 "city_db_path": getattr(settings, "CDN_BALANCER_CITY_DB_PATH", ""),
                 "asn_db_path": getattr(settings, "CDN_BALANCER_ASN_DB_PATH", ""),
                 "lookup_status": getattr(cdn_balancer_module, "GEOIP2_LOOKUP_STATUS", {}),
+                "cache": cdn_balancer_module.balancer_cache_stats(),
+                "edges": edge_health(),
             },
         }
         logger.info(
@@ -703,13 +719,26 @@ def search(request):
 
 
 def sitemap(request):
-    """Sitemap"""
+    """Sitemap index, pointing to the pages sitemap and the partitions"""
 
-    context = {}
-    context["media"] = list(Media.objects.filter(Q(listable=True)).order_by("-add_date"))
-    context["playlists"] = list(Playlist.objects.filter().order_by("-add_date"))
-    context["users"] = list(User.objects.filter())
-    return render(request, "sitemap.xml", context, content_type="application/xml")
+    return sitemap_response(request, SITEMAP_INDEX_SCOPE, iter_sitemap_index)
+
+
+def sitemap_pages(request):
+    """Sitemap of the static pages"""
+
+    return render(request, "sitemap.xml", {}, content_type="application/xml")
+
+
+def sitemap_section(request, section, partition):
+    """Sitemap of media, playlists or users in one id range"""
+
+    partition = int(partition)
+    return sitemap_response(
+        request,
+        sitemap_scope(section, partition),
+        lambda: iter_sitemap_section(section, partition),
+    )
 
 @portal_login_required
 def tags(request):
@@ -866,6 +895,8 @@ def view_media(request):
                 "city_db_path": getattr(settings, "CDN_BALANCER_CITY_DB_PATH", ""),
                 "asn_db_path": getattr(settings, "CDN_BALANCER_ASN_DB_PATH", ""),
                 "lookup_status": getattr(cdn_balancer_module, "GEOIP2_LOOKUP_STATUS", {}),
+                "cache": cdn_balancer_module.balancer_cache_stats(),
+                "edges": edge_health(),
             },
         }
         logger.info(
@@ -959,6 +990,8 @@ class LiveList(APIView):
     @swagger_auto_schema(
         manual_parameters=[
             openapi.Parameter(name='page', type=openapi.TYPE_INTEGER, in_=openapi.IN_QUERY, description='Page number'),
+            openapi.Parameter(name='pagination', type=openapi.TYPE_STRING, in_=openapi.IN_QUERY, description='cursor, to use keyset pages instead of page numbers', enum=['cursor']),
+            openapi.Parameter(name='cursor', type=openapi.TYPE_STRING, in_=openapi.IN_QUERY, description='Cursor from the next/previous links'),
             openapi.Parameter(name='author', type=openapi.TYPE_STRING, in_=openapi.IN_QUERY, description='username'),
             openapi.Parameter(name='show', type=openapi.TYPE_STRING, in_=openapi.IN_QUERY, description='show', enum=['recommended', 'featured', 'latest']),
         ],
@@ -1006,7 +1039,10 @@ class LiveList(APIView):
                 else:
                     media = Media.objects.filter(basic_query & hls_filter).order_by("-add_date")
 
-        paginator = pagination_class()
+        if show_param != "recommended" and keyset_pagination_requested(request):
+            paginator = KeysetPagination("-add_date")
+        else:
+            paginator = pagination_class()
 
         if show_param != "recommended":
             media = media.prefetch_related("user")
@@ -1031,8 +1067,12 @@ class MediaList(APIView):
     @swagger_auto_schema(
         manual_parameters=[
             openapi.Parameter(name='page', type=openapi.TYPE_INTEGER, in_=openapi.IN_QUERY, description='Page number'),
+            openapi.Parameter(name='pagination', type=openapi.TYPE_STRING, in_=openapi.IN_QUERY, description='cursor, to use keyset pages instead of page numbers', enum=['cursor']),
+            openapi.Parameter(name='cursor', type=openapi.TYPE_STRING, in_=openapi.IN_QUERY, description='Cursor from the next/previous links'),
             openapi.Parameter(name='author', type=openapi.TYPE_STRING, in_=openapi.IN_QUERY, description='username'),
             openapi.Parameter(name='show', type=openapi.TYPE_STRING, in_=openapi.IN_QUERY, description='show', enum=['recommended', 'featured', 'latest']),
+            openapi.Parameter(name='category', type=openapi.TYPE_STRING, in_=openapi.IN_QUERY, description='Category title, recommended media of the category'),
+            openapi.Parameter(name='channel', type=openapi.TYPE_STRING, in_=openapi.IN_QUERY, description='Channel friendly_token, recommended media of the channel'),
         ],
         tags=['Media'],
         operation_summary='List Media',
@@ -1048,9 +1088,21 @@ class MediaList(APIView):
         if author_param:
             user_queryset = User.objects.all()
             user = get_object_or_404(user_queryset, username=author_param)
+
+        if show_param != "recommended":
+            etag, last_modified = content_validators(request, [LISTING_SCOPE])
+            response = not_modified(request, etag, last_modified)
+            if response:
+                return response
+
         if show_param == "recommended":
             pagination_class = FastPaginationWithoutCount
-            media = show_recommended_media(request, limit=50)
+            category = channel = None
+            if params.get("category", "").strip():
+                category = get_object_or_404(Category, title=params["category"].strip())
+            elif params.get("channel", "").strip():
+                channel = get_object_or_404(Channel, friendly_token=params["channel"].strip())
+            media = show_recommended_media(request, limit=50, category=category, channel=channel)
         else:
             pagination_class = api_settings.DEFAULT_PAGINATION_CLASS
             if author_param:
@@ -1071,14 +1123,20 @@ class MediaList(APIView):
             else:
                 media = Media.objects.filter(basic_query & hls_filter).order_by("-add_date")
 
-        paginator = pagination_class()
+        if show_param != "recommended" and keyset_pagination_requested(request):
+            paginator = KeysetPagination("-add_date")
+        else:
+            paginator = pagination_class()
 
         if show_param != "recommended":
             media = media.prefetch_related("user")
         page = paginator.paginate_queryset(media, request)
 
         serializer = MediaSerializer(page, many=True, context={"request": request})
-        return paginator.get_paginated_response(serializer.data)
+        response = paginator.get_paginated_response(serializer.data)
+        if show_param != "recommended":
+            set_validators(response, etag, last_modified)
+        return response
 
     @swagger_auto_schema(
         manual_parameters=[
@@ -1165,7 +1223,27 @@ class MediaDetail(APIView):
         if isinstance(media, Response):
             return media
 
+        # counters are updated without signals, read them from the row.
+        # related media follow the listings version, ratings, payments and
+        # subscriptions of the viewer the user version. Entitlements also
+        # expire with time, so they are part of the validators too
         serializer = SingleMediaSerializer(media, context={"request": request})
+        scopes = [media_scope(media.id), LISTING_SCOPE]
+        if request.user.is_authenticated:
+            scopes.append(user_scope(request.user.pk))
+        etag, last_modified = content_validators(
+            request,
+            scopes,
+            media.views,
+            media.likes,
+            media.dislikes,
+            serializer.viewer_entitled(media),
+        )
+        response = not_modified(request, etag, last_modified)
+        if response:
+            patch_cache_control(response, private=True)
+            return response
+
         if media.state == "private":
             related_media = []
         else:
@@ -1181,7 +1259,10 @@ class MediaDetail(APIView):
             ret["ratings_info"] = update_user_ratings(request.user, media, ret.get("ratings_info"))
 
         ret["related_media"] = related_media
-        return Response(ret)
+        # the body depends on the viewer, shared caches must not keep it
+        response = set_validators(Response(ret), etag, last_modified)
+        patch_cache_control(response, private=True)
+        return response
 
     @swagger_auto_schema(
         manual_parameters=[
@@ -1435,7 +1516,8 @@ class MediaSearch(APIView):
         author = params.get("author", "").strip()
         upload_date = params.get('upload_date', '').strip()
 
-        sort_by_options = ["title", "add_date", "edit_date", "views", "likes"]
+        # relevance ranks matches with ts_rank_cd over the weighted vector
+        sort_by_options = ["title", "add_date", "edit_date", "views", "likes", "relevance"]
         if sort_by not in sort_by_options:
             sort_by = "add_date"
         if ordering == "asc":
@@ -1446,24 +1528,33 @@ class MediaSearch(APIView):
         if media_type not in ["video", "image", "audio", "pdf"]:
             media_type = None
 
+        if params.get("show", "").strip() == "titles":
+            # typeahead goes to the suggestions index, not the full search
+            return Response(autocomplete(query), status=status.HTTP_200_OK)
+
         if not (query or category or tag):
             ret = {}
             return Response(ret, status=status.HTTP_200_OK)
 
+        cache_params = {
+            "q": " ".join(query.split()),
+            "c": category,
+            "t": tag,
+            "media_type": media_type,
+            "author": author,
+            "upload_date": upload_date,
+            "sort_by": sort_by,
+            "ordering": ordering,
+        }
+
         media = Media.objects.filter(state="public", is_reviewed=True)
 
         if query:
-            # move this processing to a prepare_query function
-            query = clean_query(query)
-            q_parts = [q_part.rstrip("y") for q_part in query.split() if q_part not in STOP_WORDS]
-            if q_parts:
-                query = SearchQuery(q_parts[0] + ":*", search_type="raw")
-                for part in q_parts[1:]:
-                    query &= SearchQuery(part + ":*", search_type="raw")
-            else:
-                query = None
+            query = build_search_query(query)
         if query:
             media = media.filter(search=query)
+        elif sort_by == "relevance":
+            sort_by = "add_date"
 
         if tag:
             media = media.filter(tags__title=tag)
@@ -1493,22 +1584,46 @@ class MediaSearch(APIView):
             if gte:
                 media = media.filter(add_date__gte=gte)
 
-        media = media.order_by(f"{ordering}{sort_by}")
+        facets = None
+        if params.get("facets", "").strip().lower() in ("1", "true", "yes"):
+            matches = media
+            facets = cached_value("facets", cache_params, lambda: search_facets(matches))
 
-        if self.request.query_params.get("show", "").strip() == "titles":
-            media = media.values("title")[:40]
-            return Response(media, status=status.HTTP_200_OK)
+        if sort_by == "relevance":
+            media = rank_search_results(media, query)
         else:
-            media = media.prefetch_related("user")
+            media = media.order_by(f"{ordering}{sort_by}")
+
+        media = media.prefetch_related("user")
+        if keyset_pagination_requested(request):
+            paginator = KeysetPagination("-rank" if sort_by == "relevance" else f"{ordering}{sort_by}")
+        else:
+            media = cached_search("media", cache_params, media)
             if category or tag:
                 pagination_class = api_settings.DEFAULT_PAGINATION_CLASS
             else:
                 # pagination_class = FastPaginationWithoutCount
                 pagination_class = api_settings.DEFAULT_PAGINATION_CLASS
             paginator = pagination_class()
-            page = paginator.paginate_queryset(media, request)
-            serializer = MediaSearchSerializer(page, many=True, context={"request": request})
-            return paginator.get_paginated_response(serializer.data)
+        page = paginator.paginate_queryset(media, request)
+        serializer = MediaSearchSerializer(page, many=True, context={"request": request})
+        response = paginator.get_paginated_response(serializer.data)
+        if facets is not None:
+            response.data["facets"] = facets
+        return response
+
+
+class SearchAutocomplete(APIView):
+    """Search box typeahead, answered from the suggestions index"""
+
+    @swagger_auto_schema(
+        manual_parameters=[openapi.Parameter(name="q", type=openapi.TYPE_STRING, in_=openapi.IN_QUERY, description="Prefix typed so far")],
+        tags=['Search'],
+        operation_summary='Autocomplete suggestions',
+        operation_description='Media titles, tags and categories starting with the given prefix',
+    )
+    def get(self, request, format=None):
+        return Response(autocomplete(request.query_params.get("q", "")), status=status.HTTP_200_OK)
 
 
 class PlaylistList(APIView):
@@ -1584,17 +1699,26 @@ class PlaylistDetail(APIView):
         if isinstance(playlist, Response):
             return playlist
 
-        serializer = PlaylistDetailSerializer(playlist, context={"request": request})
+        playlist_media = PlaylistMedia.objects.filter(playlist=playlist, media__state="public")
 
-        playlist_media = PlaylistMedia.objects.filter(playlist=playlist, media__state="public").prefetch_related("media__user")
+        media_ids = list(playlist_media.values_list("media_id", flat=True))
+        etag, last_modified = content_validators(
+            request,
+            [playlist_scope(playlist.id)] + [media_scope(media_id) for media_id in media_ids],
+        )
+        response = not_modified(request, etag, last_modified)
+        if response:
+            return response
 
-        playlist_media = [c.media for c in playlist_media]
+        serializer = PlaylistDetailSerializer(playlist, context={"request": request})
+
+        playlist_media = [c.media for c in playlist_media.prefetch_related("media__user")]
 
         playlist_media_serializer = MediaSerializer(playlist_media, many=True, context={"request": request})
         ret = serializer.data
         ret["playlist_media"] = playlist_media_serializer.data
 
-        return Response(ret)
+        return set_validators(Response(ret), etag, last_modified)
 
     @swagger_auto_schema(
         manual_parameters=[],
@@ -1842,6 +1966,8 @@ class CommentList(APIView):
     @swagger_auto_schema(
         manual_parameters=[
             openapi.Parameter(name='page', type=openapi.TYPE_INTEGER, in_=openapi.IN_QUERY, description='Page number'),
+            openapi.Parameter(name='pagination', type=openapi.TYPE_STRING, in_=openapi.IN_QUERY, description='cursor, to use keyset pages instead of page numbers', enum=['cursor']),
+            openapi.Parameter(name='cursor', type=openapi.TYPE_STRING, in_=openapi.IN_QUERY, description='Cursor from the next/previous links'),
             openapi.Parameter(name='author', type=openapi.TYPE_STRING, in_=openapi.IN_QUERY, description='username'),
         ],
         tags=['Comments'],
@@ -1852,8 +1978,11 @@ class CommentList(APIView):
         },
     )
     def get(self, request, format=None):
-        pagination_class = api_settings.DEFAULT_PAGINATION_CLASS
-        paginator = pagination_class()
+        if keyset_pagination_requested(request):
+            paginator = KeysetPagination("-add_date")
+        else:
+            pagination_class = api_settings.DEFAULT_PAGINATION_CLASS
+            paginator = pagination_class()
         comments = Comment.objects.filter(media__state="public").order_by("-add_date")
         comments = comments.prefetch_related("user")
         comments = comments.prefetch_related("media")
@@ -1906,12 +2035,18 @@ class CommentDetail(APIView):
         media = self.get_object(friendly_token)
         if isinstance(media, Response):
             return media
+
+        etag, last_modified = content_validators(request, [comments_scope(media.id)])
+        response = not_modified(request, etag, last_modified)
+        if response:
+            return response
+
         comments = media.comments.filter().prefetch_related("user")
         pagination_class = api_settings.DEFAULT_PAGINATION_CLASS
         paginator = pagination_class()
         page = paginator.paginate_queryset(comments, request)
         serializer = CommentSerializer(page, many=True, context={"request": request})
-        return paginator.get_paginated_response(serializer.data)
+        return set_validators(paginator.get_paginated_response(serializer.data), etag, last_modified)
 
     @swagger_auto_schema(
         manual_parameters=[],
@@ -1983,7 +2118,7 @@ class UserActions(APIView):
         media = []
         if action in VALID_USER_ACTIONS:
             if request.user.is_authenticated:
-                media = Media.objects.select_related("user").filter(mediaactions__user=request.user, mediaactions__action=action).order_by("-mediaactions__action_date")
+                media = Media.objects.select_related("user").filter(mediaactions__user=request.user, mediaactions__action=action)
             elif request.session.session_key:
                 media = (
                     Media.objects.select_related("user")
@@ -1991,8 +2126,10 @@ class UserActions(APIView):
                         mediaactions__session_key=request.session.session_key,
                         mediaactions__action=action,
                     )
-                    .order_by("-mediaactions__action_date")
                 )
+            if isinstance(media, QuerySet):
+                # one row per media, actions are kept for every view
+                media = media.annotate(last_action_date=Max("mediaactions__action_date")).order_by("-last_action_date")
 
         pagination_class = api_settings.DEFAULT_PAGINATION_CLASS
         paginator = pagination_class()
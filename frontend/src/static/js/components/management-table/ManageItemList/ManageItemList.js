@@ -1,7 +1,7 @@
 import React, { useRef, useState, useEffect } from 'react';
 import PropTypes from 'prop-types';
 import urlParse from 'url-parse';
-import { deleteRequest, csrfToken } from '../../../utils/helpers/';
+import { deleteRequest, getRequest, csrfToken } from '../../../utils/helpers/';
 import { usePopup } from '../../../utils/hooks/';
 import { PopupMain } from '../../_shared';
 import { PendingItemsList } from '../../item-list/PendingItemsList.jsx';
@@ -12,6 +12,9 @@ import { translateString } from '../../../utils/helpers/';
 
 import './ManageItemList.scss';
 
+// milliseconds between checks of a background media deletion
+const DELETION_JOB_POLL_INTERVAL = 2000;
+
 function useManageItemList(props, itemsListRef) {
   let previousItemsLength = 0;
 
@@ -575,14 +578,51 @@ export function ManageItemList(props) {
     }
   }
 
+  function whenDeleted(response, onDeleted, onFail) {
+    if (!response) {
+      return;
+    }
+
+    if (204 === response.status) {
+      onDeleted();
+      return;
+    }
+
+    // media deletions are accepted (202) and run in background, rows are
+    // reloaded once the deletion job at response.data.url has finished
+    if (202 !== response.status || !response.data || !response.data.url) {
+      return;
+    }
+
+    function checkDeletionJob(jobResponse) {
+      const jobStatus = jobResponse && jobResponse.data ? jobResponse.data.status : null;
+
+      if ('success' === jobStatus) {
+        onDeleted();
+      } else if ('fail' === jobStatus) {
+        onFail();
+      } else {
+        setTimeout(() => getRequest(response.data.url, false, checkDeletionJob, onFail), DELETION_JOB_POLL_INTERVAL);
+      }
+    }
+
+    checkDeletionJob(response);
+  }
+
   function removeBulkMediaResponse(response) {
-    if (response && 204 === response.status) {
+    if (response && (204 === response.status || 202 === response.status)) {
       setSelectedItems([]);
       setSelectedAllItems(false);
 
-      if ('function' === typeof props.onRowsDelete) {
-        props.onRowsDelete(true);
-      }
+      whenDeleted(
+        response,
+        () => {
+          if ('function' === typeof props.onRowsDelete) {
+            props.onRowsDelete(true);
+          }
+        },
+        removeBulkMediaFail
+      );
     }
   }
 
@@ -624,9 +664,7 @@ export function ManageItemList(props) {
   }
 
   function removeMediaResponse(response) {
-    if (response && 204 === response.status) {
-      props.onRowsDelete(false);
-    }
+    whenDeleted(response, () => props.onRowsDelete(false), removeMediaFail);
   }
 
   function removeMediaFail() {
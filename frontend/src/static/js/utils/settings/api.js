@@ -57,7 +57,7 @@ export function init(base_url, endpoints) {
     },
     search: {
       query: endpoints.search + '?q=',
-      titles: endpoints.search + '?show=titles&q=',
+      titles: endpoints.search + '/autocomplete?q=',
       tag: endpoints.search + '?t=',
       category: endpoints.search + '?c=',
     },
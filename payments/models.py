@@ -2,8 +2,12 @@ from __future__ import annotations
 
 from django.conf import settings
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 
+from files.content_versions import bump_versions, user_scope
+
 
 class DownloadEntitlement(models.Model):
     STATUS_ACTIVE = "active"
@@ -320,3 +324,14 @@ def parse_flow_datetime(value):
     if timezone.is_naive(dt):
         return timezone.make_aware(dt, timezone.get_current_timezone())
     return dt
+
+
+@receiver(post_save, sender=DownloadEntitlement)
+@receiver(post_delete, sender=DownloadEntitlement)
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+@receiver(post_save, sender=UserSubscription)
+@receiver(post_delete, sender=UserSubscription)
+def user_access_version(sender, instance, **kwargs):
+    # media details show what the user paid for or subscribed to
+    bump_versions([user_scope(instance.user_id)])
@@ -11,7 +11,11 @@ from imagekit.models import ProcessedImageField
 from imagekit.processors import ResizeToFill
 
 import files.helpers as helpers
+from files.content_versions import bump_versions
+from files.listing_cards import CARD_USER_FIELDS, invalidate_media_cards
+from files.media_documents import invalidate_media_documents
 from files.models import Category, Media, Tag
+from files.sitemaps import sitemap_scopes
 
 
 class User(AbstractUser):
@@ -173,6 +177,27 @@ Visita el perfil del usuario en %s
             email.send(fail_silently=True)
 
 
+@receiver(post_save, sender=User)
+def user_media_cache(sender, instance, created, update_fields=None, **kwargs):
+    # author fields of listing cards and media details, counter updates such as
+    # update_user_media or last_login leave them alone
+    if created:
+        return
+    if update_fields is not None and not CARD_USER_FIELDS.intersection(update_fields):
+        return
+    media_ids = list(Media.objects.filter(user=instance).values_list("id", flat=True))
+    invalidate_media_cards(media_ids)
+    invalidate_media_documents(media_ids)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_sitemap(sender, instance, created=True, update_fields=None, **kwargs):
+    # the users sitemap lists usernames
+    if created or update_fields is None or "username" in update_fields:
+        bump_versions(sitemap_scopes("users", [instance.id]))
+
+
 NOTIFICATION_METHODS = (("email", "Email"),)
 
 